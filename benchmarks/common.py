@@ -0,0 +1,38 @@
+"""
+Synthetic data shared by the benchmarks.
+"""
+import pathlib
+from datetime import datetime
+
+from vdffit.tests.synthetic import write_pas_day, write_span_day
+
+#: Date of all the synthetic data files
+DATE = datetime(2020, 1, 1)
+#: Number of distribution functions in the synthetic days
+DAY_SIZES = [100, 1000, 10000]
+
+
+def write_days(instrument, sizes=DAY_SIZES):
+    """
+    Write a synthetic day of data for each size, each in its own directory.
+
+    Returns
+    -------
+    pathlib.Path
+        Directory containing one sub-directory for each day size.
+    """
+    write_day = {'span': write_span_day, 'pas': write_pas_day}[instrument]
+    root = pathlib.Path(instrument + '_data').resolve()
+    for ntime in sizes:
+        directory = root / str(ntime)
+        directory.mkdir(parents=True, exist_ok=True)
+        write_day(directory, DATE, ntime)
+    return root
+
+
+def use_data_dir(directory):
+    """
+    Point vdffit at a directory of synthetic data.
+    """
+    from vdffit.config import set_data_dir
+    set_data_dir(directory)
@@ -0,0 +1,15 @@
+"""
+Time taken to import vdffit in a fresh interpreter.
+
+Each fitting worker is a new process, so pays this cost once per day of
+data.
+"""
+
+
+class ImportTime:
+    params = ['vdffit', 'vdffit.campaign', 'vdffit.fitting', 'vdffit.io.psp',
+              'vdffit.io.solo']
+    param_names = ['module']
+
+    def timeraw_import(self, module):
+        return f'import {module}'
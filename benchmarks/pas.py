@@ -0,0 +1,92 @@
+"""
+Benchmarks for each stage of reading PAS data.
+
+Each benchmark times a single stage on a whole synthetic day of data, for
+several day sizes.
+"""
+import pathlib
+
+from vdffit.fitting import BiMaxFitter, Moments
+from vdffit.io.solo import PASL2CDF
+from .common import DATE, DAY_SIZES, use_data_dir, write_days
+
+VARIABLES = ['vdf', 'Energy', 'Full_elevation', 'Full_azimuth',
+             'start_energy', 'nb_energy', 'start_elevation', 'nb_elevation',
+             'start_CEM', 'nb_CEM']
+
+
+class PASBase:
+    params = DAY_SIZES
+    param_names = ['ntime']
+    timeout = 600
+    number = 1
+
+    def setup_cache(self):
+        return str(write_days('pas'))
+
+    def setup(self, root, ntime):
+        use_data_dir(pathlib.Path(root) / str(ntime))
+        self.cdf = PASL2CDF(DATE)
+
+
+class PASRead(PASBase):
+    def time_open(self, root, ntime):
+        PASL2CDF(DATE)
+
+    def time_varget(self, root, ntime):
+        for var in VARIABLES:
+            self.cdf.varget(var)
+
+
+class PASBLookup(PASBase):
+    def setup(self, root, ntime):
+        super().setup(root, ntime)
+        self.cdf.epochs
+        self.cdf.mag_cdf.all_bvecs
+        self.cdf.mag_cdf._sort_order
+
+    def time_nearest_bvecs(self, root, ntime):
+        self.cdf.mag_cdf.get_bvecs(self.cdf.epochs)
+
+
+class PASDistributions(PASBase):
+    def setup(self, root, ntime):
+        super().setup(root, ntime)
+        cdf = self.cdf
+        # Load all the data
+        cdf.vdf, cdf.energy, cdf.theta, cdf.phi, cdf.bvecs
+        cdf.start_energy_idx, cdf.n_energy
+        cdf.start_elevation_idx, cdf.n_elevation
+        cdf.start_azimuth_idx, cdf.n_azimuth
+
+    def time_distributions(self, root, ntime):
+        for i in range(ntime):
+            dist = self.cdf[i]
+            dist.velocities, dist.vdf, dist.mask, dist.quality_flag()
+
+    def time_get_batch(self, root, ntime):
+        self.cdf.get_batch(0, ntime)
+
+
+class PASFit(PASBase):
+    # Fitting time is proportional to the number of spectra, so only time
+    # smaller days
+    params = DAY_SIZES[:2]
+
+    def setup(self, root, ntime):
+        super().setup(root, ntime)
+        self.fitter = BiMaxFitter()
+        self.dists = [self.cdf[i] for i in range(ntime)]
+        for dist in self.dists:
+            dist.velocities, dist.vdf
+        self.batch = self.cdf.get_batch(0, ntime)
+
+    def time_fit_single(self, root, ntime):
+        for dist in self.dists:
+            self.fitter.fit_single(dist)
+
+    def time_fit_batch(self, root, ntime):
+        self.fitter.fit_batch(self.batch)
+
+    def time_moments(self, root, ntime):
+        Moments().compute_batch(self.batch)
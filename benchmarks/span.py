@@ -0,0 +1,179 @@
+"""
+Benchmarks for each stage of fitting SPAN data.
+
+Each benchmark times a single stage on a whole synthetic day of data, for
+several day sizes.
+"""
+import pathlib
+import timeit
+
+import numpy as np
+
+from vdffit.fitting import BiMaxFitter, BiMaxLogFitter, FitStats, Moments
+from vdffit.io.psp import SPANL2CDF
+from .common import DATE, DAY_SIZES, use_data_dir, write_days
+
+VARIABLES = ['EFLUX', 'ENERGY', 'THETA', 'PHI']
+
+
+class SPANBase:
+    params = DAY_SIZES
+    param_names = ['ntime']
+    timeout = 600
+    number = 1
+
+    def setup_cache(self):
+        return str(write_days('span'))
+
+    def setup(self, root, ntime):
+        use_data_dir(pathlib.Path(root) / str(ntime))
+        self.cdf = SPANL2CDF(DATE)
+
+
+class SPANRead(SPANBase):
+    def time_open(self, root, ntime):
+        SPANL2CDF(DATE)
+
+    def time_varget(self, root, ntime):
+        for var in VARIABLES:
+            self.cdf.varget(var)
+
+
+class SPANBLookup(SPANBase):
+    def setup(self, root, ntime):
+        super().setup(root, ntime)
+        self.cdf.epochs
+        self.cdf.mag_cdf.all_bvecs
+        self.cdf.mag_cdf._sort_order
+
+    def time_nearest_bvecs(self, root, ntime):
+        self.cdf.mag_cdf.get_bvecs(self.cdf.epochs)
+
+
+class SPANDistributions(SPANBase):
+    def setup(self, root, ntime):
+        super().setup(root, ntime)
+        # Load all the data
+        self.cdf.eflux, self.cdf.energy, self.cdf.theta, self.cdf.phi
+        self.cdf.bvecs
+
+    def time_distributions(self, root, ntime):
+        for i in range(ntime):
+            dist = self.cdf[i]
+            dist.velocities, dist.vdf, dist.mask, dist.quality_flag()
+
+    def time_get_batch(self, root, ntime):
+        self.cdf.get_batch(0, ntime)
+
+
+class SPANFit(SPANBase):
+    # Fitting time is proportional to the number of spectra, so only time
+    # smaller days
+    params = DAY_SIZES[:2]
+
+    def setup(self, root, ntime):
+        super().setup(root, ntime)
+        self.fitter = BiMaxFitter()
+        self.dists = [self.cdf[i] for i in range(ntime)]
+        for dist in self.dists:
+            dist.velocities, dist.vdf
+        self.batch = self.cdf.get_batch(0, ntime)
+
+    def time_fit_single(self, root, ntime):
+        for dist in self.dists:
+            self.fitter.fit_single(dist)
+
+    def time_fit_batch(self, root, ntime):
+        self.fitter.fit_batch(self.batch)
+
+    def time_fit_batch_log_guess(self, root, ntime):
+        BiMaxFitter(initial_guess='log').fit_batch(self.batch)
+
+    def time_fit_batch_log(self, root, ntime):
+        BiMaxLogFitter().fit_batch(self.batch)
+
+    def time_moments(self, root, ntime):
+        Moments().compute_batch(self.batch)
+
+
+class SPANSolvers(SPANBase):
+    """
+    Fitting time and number of residual evaluations for each of the
+    ``BiMaxFitter`` solver profiles.
+    """
+    params = (DAY_SIZES[:1], list(BiMaxFitter.solver_profiles))
+    param_names = ['ntime', 'solver']
+
+    def setup(self, root, ntime, solver):
+        super().setup(root, ntime)
+        self.fitter = BiMaxFitter(solver=solver)
+        self.dists = [self.cdf[i] for i in range(ntime)]
+        for dist in self.dists:
+            dist.velocities, dist.vdf
+        self.batch = self.cdf.get_batch(0, ntime)
+
+    def time_fit_single(self, root, ntime, solver):
+        for dist in self.dists:
+            self.fitter.fit_single(dist)
+
+    def time_fit_batch(self, root, ntime, solver):
+        self.fitter.fit_batch(self.batch)
+
+    def track_nfev_single(self, root, ntime, solver):
+        stats = FitStats()
+        for dist in self.dists:
+            self.fitter.fit_single(dist, stats=stats)
+        return stats.nfev / max(stats.nsolve, 1)
+
+    def track_nfev_batch(self, root, ntime, solver):
+        stats = FitStats()
+        self.fitter.fit_batch(self.batch, stats=stats)
+        return stats.nfev / max(stats.nsolve, 1)
+
+
+class SPANPostProcess(SPANBase):
+    def setup(self, root, ntime):
+        self.fitter = BiMaxFitter()
+        results = self.fitter.empty_results(ntime)
+        for name in self.fitter.fit_param_names:
+            results[name] = 1
+        results['Time'] = (np.datetime64(DATE, 'ns') +
+                           np.arange(ntime) * np.timedelta64(7, 's'))
+        self.results = results
+
+    def time_post_fit_process(self, root, ntime):
+        self.fitter.post_fit_process(self.results)
+
+
+class SPANThroughput:
+    """
+    Number of spectra processed per second by each stage, for a day of
+    1000 spectra.
+    """
+    unit = 'spectra/s'
+    ntime = 1000
+    stages = {'open': (SPANRead, 'time_open'),
+              'varget': (SPANRead, 'time_varget'),
+              'B lookup': (SPANBLookup, 'time_nearest_bvecs'),
+              'distributions': (SPANDistributions, 'time_distributions'),
+              'get_batch': (SPANDistributions, 'time_get_batch'),
+              'fit_single': (SPANFit, 'time_fit_single'),
+              'fit_batch': (SPANFit, 'time_fit_batch'),
+              'fit_batch_log': (SPANFit, 'time_fit_batch_log'),
+              'moments': (SPANFit, 'time_moments'),
+              'post_fit_process': (SPANPostProcess, 'time_post_fit_process')}
+    params = list(stages)
+    param_names = ['stage']
+    timeout = 600
+
+    def setup_cache(self):
+        return str(write_days('span', sizes=[self.ntime]))
+
+    def track_spectra_per_second(self, root, stage):
+        cls, method = self.stages[stage]
+        bench = cls()
+        bench.setup(root, self.ntime)
+        t = min(timeit.repeat(
+            lambda: getattr(bench, method)(root, self.ntime), number=1,
+            repeat=3))
+        return self.ntime / t
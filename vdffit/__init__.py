@@ -1,5 +1,17 @@
-from pathlib import Path
+import importlib
 
-import sunpy
+#: Sub-packages, which are only imported when first accessed
+_submodules = ['campaign', 'config', 'fitting', 'io', 'net', 'util', 'vdf']
 
-data_dir = Path(sunpy.config.get('downloads', 'download_dir'))
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f'{__name__}.{name}')
+    if name == 'data_dir':
+        from vdffit.config import get_data_dir
+        return get_data_dir()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals()) + _submodules + ['data_dir'])
@@ -0,0 +1,299 @@
+"""
+Fit many days of data, writing the results for each day to disk as soon as
+it is finished.
+
+A manifest of finished days is kept in the output directory, so an
+interrupted campaign can be re-run and will only fit the days that have not
+already been done. The manifest also records the fitter configuration and
+fitting options, and a campaign can only be resumed with the same ones.
+
+This can also be run from the command line, e.g.::
+
+    python -m vdffit.campaign span 2020-01-01 2020-02-01 results/ --workers 8
+"""
+import argparse
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+
+__all__ = ['run_campaign', 'date_range', 'Manifest']
+
+#: File extension for each output format
+FORMATS = {'ecsv': 'ecsv', 'parquet': 'parquet', 'hdf5': 'h5', 'cdf': 'cdf'}
+
+#: Options to ``fit_cdf()`` that do not change the fit results, and so are
+#: not recorded in the manifest
+_NON_RESULT_OPTIONS = {'n_jobs', 'backend', 'cache', 'stats', 'verbose'}
+
+
+def _to_json(obj):
+    """
+    Convert *obj* to the form it takes after a round trip through JSON.
+
+    Objects with a ``config`` attribute (e.g. fitters and
+    `vdffit.fitting.Triage`) are stored as their configuration.
+    """
+    def default(o):
+        if hasattr(o, 'config'):
+            return {'class': type(o).__name__, 'config': o.config}
+        return repr(o)
+
+    return json.loads(json.dumps(obj, default=default, sort_keys=True))
+
+
+def date_range(start, end):
+    """
+    List of days from *start* (inclusive) to *end* (exclusive).
+
+    Parameters
+    ----------
+    start, end : datetime.datetime
+
+    Returns
+    -------
+    list[datetime.datetime]
+    """
+    start = datetime(start.year, start.month, start.day)
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+class Manifest:
+    """
+    A record of which days of a campaign have been fit, stored as a JSON file.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the manifest file. If it exists it is loaded.
+    instrument : str
+        Name of the instrument data class.
+    fitter : str
+        Name of the fitter class.
+    fitter_config : dict, optional
+        Fitter configuration (see ``FitterBase.config``).
+    fit_options : dict, optional
+        Options passed to ``fit_cdf()`` that change the fit results.
+
+    Raises
+    ------
+    ValueError
+        If the manifest at *path* was made with a different instrument,
+        fitter, fitter configuration or fitting options. Resuming would
+        mix results fit in different ways.
+    """
+    def __init__(self, path, instrument, fitter, fitter_config=None,
+                 fit_options=None):
+        self.path = path
+        self.instrument = instrument
+        self.fitter = fitter
+        self.fitter_config = _to_json(fitter_config or {})
+        self.fit_options = _to_json(fit_options or {})
+        if path.exists():
+            with open(path) as f:
+                data = json.load(f)
+            for key, value in [('instrument', instrument),
+                               ('fitter', fitter),
+                               ('fitter_config', self.fitter_config),
+                               ('fit_options', self.fit_options)]:
+                if data.get(key) != value:
+                    raise ValueError(
+                        f'Manifest at {path} is for {key} {data.get(key)}, '
+                        f'not {value}. Use a new output directory to fit '
+                        'with different settings.')
+            self.days = data['days']
+        else:
+            self.days = {}
+
+    @staticmethod
+    def key(date):
+        return date.strftime('%Y-%m-%d')
+
+    def is_done(self, date):
+        """
+        Return `True` if *date* has been fit and the output file exists.
+        """
+        entry = self.days.get(self.key(date))
+        return (entry is not None and entry['status'] == 'done' and
+                (self.path.parent / entry['file']).exists())
+
+    def update(self, date, entry):
+        """
+        Record the result of fitting a single day, and save the manifest.
+        """
+        self.days[self.key(date)] = entry
+        self.save()
+
+    def save(self):
+        # Write to a temporary file first, so a crash part way through
+        # writing can't leave a corrupt manifest
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'instrument': self.instrument,
+                       'fitter': self.fitter,
+                       'fitter_config': self.fitter_config,
+                       'fit_options': self.fit_options,
+                       'days': self.days}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _write_result(result, path, output_format, fname):
+    """
+    Write *result* to *path*, which will be renamed to *fname* once it has
+    been written.
+    """
+    if output_format == 'ecsv':
+        result.write(path, format='ascii.ecsv', overwrite=True)
+        return
+
+    from vdffit.io import CDFWriter, HDF5Writer, ParquetWriter
+    if output_format == 'cdf':
+        # Name the file by its final name, not the temporary one
+        writer = CDFWriter(
+            path, global_attrs={'Logical_file_id': Path(fname).stem})
+    else:
+        writer = {'parquet': ParquetWriter,
+                  'hdf5': HDF5Writer}[output_format](path)
+    with writer as w:
+        w.write(result)
+
+
+def _fit_day(cdf_class, date, fitter, output_dir, fit_kwargs,
+             output_format='ecsv'):
+    """
+    Fit a single day of data, and write the results to *output_dir*.
+
+    Returns
+    -------
+    dict
+        Manifest entry for this day.
+    """
+    fname = (f'{cdf_class.__name__}_{date:%Y%m%d}.'
+             f'{FORMATS[output_format]}')
+    try:
+        cdf = cdf_class(date)
+    except FileNotFoundError as e:
+        return {'status': 'missing', 'error': str(e)}
+
+    try:
+        result = fitter.fit_cdf(cdf, **fit_kwargs)
+        tmp_path = output_dir / ('.tmp_' + fname)
+        _write_result(result, tmp_path, output_format, fname)
+        os.replace(tmp_path, output_dir / fname)
+    except Exception:
+        return {'status': 'failed', 'error': traceback.format_exc()}
+
+    return {'status': 'done', 'file': fname, 'n_fits': len(result)}
+
+
+def run_campaign(cdf_class, start, end, output_dir, fitter=None, n_workers=1,
+                 output_format='ecsv', **fit_kwargs):
+    """
+    Fit all the data between two dates.
+
+    Each day is fit as a separate task, and results are written to
+    ``output_dir`` as soon as each day is finished. Days that have already
+    been fit by a previous call with the same *output_dir* are skipped.
+    A previous call must have used the same fitter configuration and
+    fitting options, apart from options that don't change the results
+    (*n_jobs*, *backend*, *cache*, *stats* and *verbose*); otherwise a
+    `ValueError` is raised.
+
+    Parameters
+    ----------
+    cdf_class : type
+        Data file class, e.g. `vdffit.io.psp.SPANL2CDF` or
+        `vdffit.io.solo.PASL2CDF`. Must take a single date argument.
+    start, end : datetime.datetime
+        Start (inclusive) and end (exclusive) dates.
+    output_dir : pathlib.Path
+        Directory to write results and the manifest to.
+    fitter : vdffit.fitting.FitterBase, optional
+        Fitter to use. Defaults to `vdffit.fitting.BiMaxFitter`.
+    n_workers : int, optional
+        Number of days to fit in parallel, each in a separate process. If
+        ``1``, days are fit in the current process.
+    output_format : {'ecsv', 'parquet', 'hdf5', 'cdf'}, optional
+        Format of the output files. See `vdffit.io.results` for details of
+        the Parquet, HDF5 and CDF formats.
+    **fit_kwargs :
+        Passed to ``fitter.fit_cdf()``.
+
+    Returns
+    -------
+    Manifest
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f'output_format must be one of {list(FORMATS)} '
+                         f'(got {output_format})')
+    if fitter is None:
+        from vdffit.fitting import BiMaxFitter
+        fitter = BiMaxFitter()
+    fit_kwargs.setdefault('verbose', 0)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(
+        output_dir / 'manifest.json', cdf_class.__name__,
+        type(fitter).__name__, fitter_config=fitter.config,
+        fit_options={key: value for key, value in fit_kwargs.items()
+                     if key not in _NON_RESULT_OPTIONS})
+    dates = [d for d in date_range(start, end) if not manifest.is_done(d)]
+
+    if n_workers == 1:
+        for date in dates:
+            manifest.update(
+                date, _fit_day(cdf_class, date, fitter, output_dir,
+                               fit_kwargs, output_format))
+        return manifest
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(_fit_day, cdf_class, date, fitter,
+                                   output_dir, fit_kwargs,
+                                   output_format): date
+                   for date in dates}
+        for future in as_completed(futures):
+            manifest.update(futures[future], future.result())
+    return manifest
+
+
+def _get_cdf_class(instrument):
+    if instrument == 'span':
+        from vdffit.io.psp import SPANL2CDF
+        return SPANL2CDF
+    elif instrument == 'pas':
+        from vdffit.io.solo import PASL2CDF
+        return PASL2CDF
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='vdffit-campaign',
+        description='Fit all the VDFs between two dates, one day at a time.')
+    parser.add_argument('instrument', choices=['span', 'pas'])
+    parser.add_argument('start', type=datetime.fromisoformat,
+                        help='Start date (inclusive), YYYY-MM-DD.')
+    parser.add_argument('end', type=datetime.fromisoformat,
+                        help='End date (exclusive), YYYY-MM-DD.')
+    parser.add_argument('output_dir', type=Path)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of days to fit in parallel.')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Fit this many VDFs at once within each day.')
+    parser.add_argument('--format', choices=list(FORMATS), default='ecsv',
+                        help='Output file format.')
+    args = parser.parse_args(args)
+
+    manifest = run_campaign(_get_cdf_class(args.instrument), args.start,
+                            args.end, args.output_dir,
+                            n_workers=args.workers,
+                            output_format=args.format,
+                            batch_size=args.batch_size)
+    statuses = [entry['status'] for entry in manifest.days.values()]
+    for status in sorted(set(statuses)):
+        print(f'{status}: {statuses.count(status)} days')
+
+
+if __name__ == '__main__':
+    main()
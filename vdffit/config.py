@@ -0,0 +1,49 @@
+"""
+Configuration of where vdffit looks for data files.
+
+The data directory is, in order of preference:
+
+1. The directory set with `set_data_dir`.
+2. The ``VDFFIT_DATA_DIR`` environment variable.
+3. The sunpy download directory. sunpy is only imported if neither of the
+   above are set.
+"""
+import os
+from pathlib import Path
+
+__all__ = ['get_data_dir', 'set_data_dir']
+
+#: Environment variable that sets the data directory
+DATA_DIR_ENV = 'VDFFIT_DATA_DIR'
+
+_data_dir = None
+
+
+def set_data_dir(path):
+    """
+    Set the directory that data files are read from.
+
+    Parameters
+    ----------
+    path : pathlib.Path or str or None
+        Data directory. If `None`, go back to the default directory.
+    """
+    global _data_dir
+    _data_dir = None if path is None else Path(path)
+
+
+def get_data_dir():
+    """
+    Get the directory that data files are read from.
+
+    Returns
+    -------
+    pathlib.Path
+    """
+    if _data_dir is not None:
+        return _data_dir
+    if os.environ.get(DATA_DIR_ENV):
+        return Path(os.environ[DATA_DIR_ENV])
+
+    import sunpy
+    return Path(sunpy.config.get('downloads', 'download_dir'))
@@ -1,3 +1,9 @@
 from .base import *
 from .bimax import *
+from .cache import *
+from .lm import *
+from .moments import *
 from .psp import *
+from .solo import *
+from .stats import *
+from .triage import *
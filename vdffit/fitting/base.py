@@ -1,8 +1,11 @@
 import abc
+import time
 
 import astropy.units as u
 import numpy as np
-from joblib import Parallel, delayed
+
+from vdffit.util.vector import Vector
+from .stats import FitStats, _timer
 
 __all__ = ['FitterBase']
 
@@ -11,21 +14,288 @@ class FitterBase(abc.ABC):
     vunit = u.km / u.s
     vdfunit = u.s**3 / u.m**6
 
-    def fit_cdf(self, cdf):
+    def fit_cdf(self, cdf, batch_size=None, n_jobs=1, backend=None,
+                chunk_size=None, warm_start=False, cache=None, triage=None,
+                stats=None, verbose=1):
         """
         Fit all velocity distribution functions in a CDF file.
 
+        The file is split into chunks of contiguous distribution functions,
+        and each chunk is fit as a single task using `joblib`. Only the CDF
+        file object and the chunk index range are sent to each task; each
+        task reads and slices the data it needs itself.
+
         Parameters
         ----------
         cdf : vdffit.io.CDFFile
+        batch_size : int, optional
+            If given, fit this many distribution functions at once using
+            ``fit_batch()``. Otherwise each distribution is fit in turn using
+            ``fit_single()``.
+        n_jobs : int, optional
+            Number of jobs to run in parallel. ``-1`` uses all available
+            cores. Passed to `joblib.Parallel`.
+        backend : str, optional
+            `joblib` backend to use, e.g. ``'loky'`` or ``'threading'``.
+        chunk_size : int, optional
+            Number of distribution functions in each task. Defaults to
+            splitting the file evenly between jobs.
+        warm_start : bool, optional
+            If `True`, start each fit from the parameters of the last
+            successful fit in the same chunk, instead of the default initial
+            guesses. Each chunk starts from the default initial guesses. Only
+            supported when ``batch_size`` is `None`.
+        cache : vdffit.fitting.FitCache, optional
+            If given, results for distribution functions that have already
+            been fit with the same fitter configuration are taken from the
+            cache, and only the remaining distribution functions are fit.
+            New results are added to the cache. Results from batched and
+            single fits, and with and without *warm_start*, are cached
+            separately. If the data file has not changed since it was last
+            fit with the cache its record hashes are taken from the cache
+            too, so the distribution functions are not read.
+        triage : vdffit.fitting.Triage, optional
+            If given, screen all the distribution functions before fitting.
+            Rejected distributions are not fit, and are given the fit status
+            of the check they failed. The number rejected for each reason is
+            stored in the ``'triage'`` entry of the returned time series
+            metadata.
+        stats : vdffit.fitting.FitStats, optional
+            If given, time each stage of fitting and count optimizer
+            evaluations and fit statuses. The statistics for this call are
+            added to *stats*, and stored in the ``'fit stats'`` entry of the
+            returned time series metadata.
+        verbose : int, optional
+            Verbosity level passed to `joblib.Parallel`.
         """
-        times = cdf.times
-        params = Parallel(n_jobs=1, verbose=1)(
-            delayed(self.fit_single)(cdf[t]) for t in times)
-        params = self.post_fit_process(params)
+        from joblib import Parallel, delayed, effective_n_jobs
+
+        if warm_start and batch_size is not None:
+            raise ValueError('warm_start is only supported when batch_size '
+                             'is None')
+        start_time = time.perf_counter()
+        call_stats = None if stats is None else FitStats()
+        n = len(cdf)
+        params = self.empty_results(n)
+        to_fit = np.ones(n, dtype=bool)
+        if cache is not None:
+            # Find this before triage, which might load data into memory
+            with _timer(call_stats, 'cache'):
+                signature = cdf.file_signature
+        if triage is not None:
+            with _timer(call_stats, 'triage'):
+                screened = triage.screen_cdf(self, cdf)
+            rejected = screened['fit status'] != 1
+            params[rejected] = screened[rejected]
+            to_fit &= ~rejected
+        if cache is not None:
+            # Batched fits use a different solver to single fits. The size
+            # of each batch doesn't change the results, as every fit in a
+            # batch is independent.
+            cache_options = {'batched': batch_size is not None,
+                             'warm_start': warm_start}
+            with _timer(call_stats, 'cache'):
+                records = None
+                if signature is not None:
+                    records = cache.get_record_hashes(signature)
+                if records is None:
+                    records = cdf.record_hashes()
+                    if signature is not None:
+                        cache.put_record_hashes(signature, records)
+                cached = cache.get(self, records, cache_options)
+            for i in np.nonzero(to_fit)[0]:
+                if records[i] in cached:
+                    params[i] = cached[records[i]]
+                    to_fit[i] = False
+
+        if chunk_size is None:
+            chunk_size = max(
+                int(np.ceil(np.sum(to_fit) / effective_n_jobs(n_jobs))), 1)
+        # Split each contiguous run of records to fit into chunks
+        edges = np.diff(to_fit.astype(int), prepend=0, append=0)
+        chunks = [(start, min(start + chunk_size, run_stop))
+                  for run_start, run_stop in zip(np.nonzero(edges == 1)[0],
+                                                 np.nonzero(edges == -1)[0])
+                  for start in range(run_start, run_stop, chunk_size)]
+        results = Parallel(n_jobs=n_jobs, backend=backend, verbose=verbose)(
+            delayed(self._fit_chunk)(cdf, int(start), int(stop), batch_size,
+                                     warm_start=warm_start,
+                                     stats=stats is not None)
+            for start, stop in chunks)
+        if stats is not None:
+            for _, chunk_stats in results:
+                call_stats.merge(chunk_stats)
+            results = [chunk_params for chunk_params, _ in results]
+        fitted = np.concatenate([self.empty_results(0)] + results)
+        params[to_fit] = fitted
+        if cache is not None:
+            with _timer(call_stats, 'cache'):
+                cache.put(self, [r for r, fit in zip(records, to_fit) if fit],
+                          fitted, cache_options)
+
+        if call_stats is not None:
+            call_stats.nspectra += n
+            call_stats.add_status(params['fit status'])
+        with _timer(call_stats, 'post-process'):
+            params = self.post_fit_process(params)
+        if triage is not None:
+            params.meta['triage'] = dict(triage.last_counts)
+        if stats is not None:
+            call_stats.time['total'] += time.perf_counter() - start_time
+            call_stats.calls['total'] += 1
+            stats.merge(call_stats)
+            params.meta['fit stats'] = call_stats.to_dict()
         return params
 
-    def fit_single(self, dist):
+    @property
+    def config(self):
+        """
+        Options that affect the fit results, as a `dict`.
+
+        By default this is all the attributes set on the fitter. This is used
+        to identify cached fit results.
+        """
+        return dict(vars(self))
+
+    @property
+    def triage_checks(self):
+        """
+        Checks that can be run on distribution functions before fitting.
+
+        Used by `vdffit.fitting.Triage`. This is a `dict` mapping the name of
+        each check to a ``(status, check)`` tuple. ``check`` is a function
+        that takes a `vdffit.vdf.ScreeningBatch` and returns a boolean array
+        that is `True` for distributions that would fail to be fit with fit
+        status ``status``.
+        """
+        return {}
+
+    @property
+    def reject_quality_flags(self):
+        """
+        Quality flags of distribution functions that `vdffit.fitting.Triage`
+        rejects by default.
+        """
+        return ()
+
+    @property
+    def result_dtype(self):
+        """
+        Structured `numpy.dtype` of fit results.
+
+        This has one float field for each of ``fit_param_names``, followed
+        by ``'fit status'``, ``'quality flag'`` and ``'Time'`` fields.
+        """
+        return np.dtype([(name, float) for name in self.fit_param_names] +
+                        [('fit status', int), ('quality flag', int),
+                         ('Time', 'datetime64[ns]')])
+
+    def empty_results(self, n):
+        """
+        Create a structured array to hold *n* fit results.
+
+        Returns
+        -------
+        numpy.ndarray
+            Zero-filled array with dtype ``result_dtype``.
+        """
+        return np.zeros(n, dtype=self.result_dtype)
+
+    def _as_results(self, params):
+        """
+        Convert a list of dicts of fit results to a structured array.
+        """
+        if isinstance(params, np.ndarray):
+            return params
+        results = self.empty_results(len(params))
+        for name in results.dtype.names:
+            results[name] = [p[name] for p in params]
+        return results
+
+    def iter_fit(self, cdfs, batch_size, start_time=None, end_time=None,
+                 n_jobs=1, backend=None):
+        """
+        Fit velocity distribution functions batch by batch, yielding the
+        results for each batch as soon as it is finished.
+
+        Only a bounded number of batches are read into memory at once, so
+        this can be used to fit many files in a row with flat memory use.
+
+        Parameters
+        ----------
+        cdfs : vdffit.io.CDFFile or list[vdffit.io.CDFFile]
+            A single file, or an iterable of files to fit one after the
+            other.
+        batch_size : int
+            Number of distribution functions in each batch.
+        start_time, end_time : datetime.datetime, optional
+            Only fit distribution functions between these times.
+        n_jobs : int, optional
+            Number of batches to fit in parallel. Passed to
+            `joblib.Parallel`.
+        backend : str, optional
+            `joblib` backend to use.
+
+        Yields
+        ------
+        astropy.timeseries.TimeSeries
+            Fit results for a single batch, in time order.
+        """
+        from joblib import Parallel, delayed
+
+        if hasattr(cdfs, 'get_batch'):
+            cdfs = [cdfs]
+
+        def tasks():
+            for cdf in cdfs:
+                start, stop = cdf.index_range(start_time, end_time)
+                for batch_start in range(start, stop, batch_size):
+                    batch_stop = min(batch_start + batch_size, stop)
+                    yield delayed(self._fit_chunk)(
+                        cdf, batch_start, batch_stop, batch_size)
+
+        parallel = Parallel(n_jobs=n_jobs, backend=backend,
+                            return_as='generator')
+        for params in parallel(tasks()):
+            yield self.post_fit_process(params)
+
+    def _fit_chunk(self, cdf, start, stop, batch_size, warm_start=False,
+                   stats=False):
+        """
+        Fit the distribution functions with indices [start, stop).
+
+        If *stats* is `True`, return a `FitStats` for this chunk along with
+        the fit results.
+        """
+        stats = FitStats() if stats else None
+        params = self.empty_results(stop - start)
+        if stats is not None:
+            # Load the magnetic field data up front so it is timed separately
+            with stats.timer('magnetic field'):
+                cdf.bvecs
+
+        if batch_size is None:
+            guess = None
+            for i in range(start, stop):
+                with _timer(stats, 'read'):
+                    dist = cdf[i]
+                params[i - start] = p = self.fit_single(dist, guess=guess,
+                                                        stats=stats)
+                if warm_start and p['fit status'] == 1:
+                    guess = [p[k] for k in self.fit_param_names]
+        else:
+            for batch_start in range(start, stop, batch_size):
+                batch_stop = min(batch_start + batch_size, stop)
+                with _timer(stats, 'read'):
+                    batch = cdf.get_batch(batch_start, batch_stop)
+                params[batch_start - start:batch_stop - start] = \
+                    self.fit_batch(batch, stats=stats)
+
+        if stats is None:
+            return params
+        return params, stats
+
+    def fit_single(self, dist, guess=None, stats=None):
         """
         Fit a single velocity distribution function.
 
@@ -37,28 +307,118 @@ class FitterBase(abc.ABC):
         ----------
         dist : vdffit.vdf.VDFBase
             A single velocity distribution function.
+        guess : list, optional
+            Parameters to start the fit from, in the same order as
+            ``fit_param_names``. Passed to ``run_single_fit()``.
+        stats : vdffit.fitting.FitStats, optional
+            If given, add timings and optimizer counts for this fit.
 
         Returns
         -------
-        params : dict
-            Fit parameters.
+        params : numpy.void
+            Fit parameters, as a single element of a ``result_dtype``
+            array.
         """
-        # Strip units
-        velocities = dist.velocities.to_value(self.vunit)
-        vdf = dist.vdf.to_value(self.vdfunit)
-        # Apply mask
-        velocities = velocities[dist.mask, :]
-        vdf = vdf[dist.mask]
+        with _timer(stats, 'distribution'):
+            # Strip units
+            velocities = dist.velocities.to_value(self.vunit)
+            vdf = dist.vdf.to_value(self.vdfunit)
+            # Apply mask
+            velocities = velocities[dist.mask, :]
+            vdf = vdf[dist.mask]
+            quality_flag = dist.quality_flag()
         # Pass to fitting method
-        status, params = self.run_single_fit(velocities, vdf, dist.bvec)
+        kwargs = {} if stats is None else {'stats': stats}
+        with _timer(stats, 'fit'):
+            status, params = self.run_single_fit(velocities, vdf, dist.bvec,
+                                                 guess=guess, **kwargs)
         if status != 1:
             params = [np.nan] * len(self.fit_param_names)
-        params = {k: v for k, v in zip(self.fit_param_names, params)}
+        result = self.empty_results(1)[0]
+        for name, value in zip(self.fit_param_names, params):
+            result[name] = value
+        result['fit status'] = status
+        result['quality flag'] = quality_flag
+        result['Time'] = dist.time
+        return result
+
+    def fit_batch(self, batch, stats=None):
+        """
+        Fit a batch of velocity distribution functions.
+
+        Derived classes should **not** override this, but instead should
+        implement ``run_batch_fit()``.
+
+        Parameters
+        ----------
+        batch : vdffit.vdf.VDFBatch
+        stats : vdffit.fitting.FitStats, optional
+            If given, add timings and optimizer counts for this batch.
+
+        Returns
+        -------
+        params : numpy.ndarray
+            Fit parameters for each distribution function, as a
+            ``result_dtype`` array.
+        """
+        with _timer(stats, 'distribution'):
+            fit_batch = batch.compressed()
+        kwargs = {} if stats is None else {'stats': stats}
+        with _timer(stats, 'fit'):
+            status, fitparams = self.run_batch_fit(
+                fit_batch.velocities, fit_batch.vdf, fit_batch.mask,
+                fit_batch.bvecs, **kwargs)
+        fitparams[status != 1] = np.nan
+
+        params = self.empty_results(len(batch))
+        for name, values in zip(self.fit_param_names, fitparams.T):
+            params[name] = values
         params['fit status'] = status
-        params['quality flag'] = dist.quality_flag()
-        params['Time'] = dist.time
+        params['quality flag'] = batch.quality_flags
+        params['Time'] = batch.times
         return params
 
+    def run_batch_fit(self, velocities, vdf, mask, bvecs, stats=None):
+        """
+        Fit a batch of distribution functions.
+
+        By default this calls ``run_single_fit()`` on each distribution in
+        turn. Derived classes can override this with a vectorized
+        implementation.
+
+        Parameters
+        ----------
+        velocities : numpy.ndarray
+            Velocity array, shape (N, npts, 3).
+        vdf : numpy.ndarray
+            VDF array, shape (N, npts).
+        mask : numpy.ndarray
+            Boolean mask of points to fit, shape (N, npts).
+        bvecs : numpy.ndarray
+            Magnetic field vectors, shape (N, 3).
+        stats : vdffit.fitting.FitStats, optional
+            If given, record optimizer runs. Only passed by ``fit_batch()``
+            when statistics are being collected.
+
+        Returns
+        -------
+        status : numpy.ndarray
+            Fitting status codes, shape (N, ).
+        params : numpy.ndarray
+            Fit parameters, shape (N, nparams).
+        """
+        n = vdf.shape[0]
+        status = np.ones(n, dtype=int)
+        params = np.full((n, len(self.fit_param_names)), np.nan)
+        kwargs = {} if stats is None else {'stats': stats}
+        for i in range(n):
+            status[i], p = self.run_single_fit(
+                velocities[i, mask[i]], vdf[i, mask[i]], Vector(bvecs[i]),
+                **kwargs)
+            if status[i] == 1:
+                params[i] = p
+        return status, params
+
     @abc.abstractproperty
     def fit_param_names(self):
         """
@@ -66,7 +426,7 @@ class FitterBase(abc.ABC):
         """
 
     @abc.abstractmethod
-    def run_single_fit(self, velocities, vdf, bvec):
+    def run_single_fit(self, velocities, vdf, bvec, guess=None):
         """
         Fit a single distribution funciton.
 
@@ -76,6 +436,13 @@ class FitterBase(abc.ABC):
             Velocity array, shape (n, 3).
         vdf : numpy.ndarray
             VDF array, shape (n, )
+        guess : list, optional
+            Parameters to start the fit from, instead of the fitter's default
+            initial guesses.
+        stats : vdffit.fitting.FitStats, optional
+            Implementations can accept this keyword argument to record
+            optimizer runs with ``stats.add_solve()``. It is only passed
+            when statistics are being collected.
 
         Returns
         -------
@@ -97,7 +464,10 @@ class FitterBase(abc.ABC):
         """
         Parameters
         ----------
-        params : dict[datetime: list]
+        params : numpy.ndarray or list[dict]
+            Fit results, as a ``result_dtype`` array. Implementations should
+            also accept a list of `dict`, and can use ``_as_results()`` to
+            convert it.
 
         Returns
         -------
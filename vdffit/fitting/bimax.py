@@ -1,25 +1,176 @@
 import astropy.constants as const
 import astropy.units as u
 import numpy as np
-import pandas as pd
-import scipy.optimize as opt
-from astropy.timeseries import TimeSeries
 
+from vdffit.util.time import datetime64_to_time
+from vdffit.util.vector import VectorArray
 from .base import FitterBase
+from .lm import batch_least_squares
+from .stats import _timer
 
-__all__ = ['BiMaxFitter']
+__all__ = ['BiMaxFitter', 'BiMaxLogFitter']
 
 
 class BiMaxFitter(FitterBase):
+    """
+    Bi-Maxwellian fitter.
+
+    Parameters
+    ----------
+    jac : {'analytic', '2-point'}, optional
+        How to compute the Jacobian of the model. ``'analytic'`` uses the
+        closed form partial derivatives in ``bi_maxwellian_3D_jac()``.
+        ``'2-point'`` uses forward finite differences.
+    max_warm_resid : float, optional
+        When fitting from a given starting guess (see ``run_single_fit()``),
+        the largest sum of squared residuals, relative to the sum of the
+        squared VDF values, for which the fit is accepted without also
+        fitting from the default initial guesses.
+    initial_guess : {'peak', 'log'}, optional
+        How to make the initial guesses for each fit:
+
+        - ``'peak'``: use the value and velocity of the VDF peak, and
+          thermal speeds of 40 km/s.
+        - ``'log'``: fit the logarithm of the VDF with weighted linear least
+          squares (see ``log_fit_batch()``). Falls back to ``'peak'`` for
+          distributions where this fails. This needs far fewer optimizer
+          iterations, but the fits start from a different point, so results
+          can differ slightly from ``'peak'``.
+    solver : str, optional
+        Optimizer settings to use, from the keys of ``solver_profiles``:
+
+        - ``'default'``: unbounded Levenberg-Marquardt, iterating until the
+          parameters change by less than 1 part in 1e14.
+        - ``'fast'``: unbounded Levenberg-Marquardt, stopping once the
+          parameters or residuals change by less than 1 part in 1e4. This
+          is well below the velocity resolution of SPAN and PAS. Fits that
+          have not converged after 60 evaluations fail.
+        - ``'bounded'``: as ``'fast'``, but bounded. Bulk velocities are
+          kept within the velocity range of the points being fit, and
+          thermal speeds between 1e-3 and 1 times the largest extent of
+          the points. Fits that end with a thermal speed on a bound fail
+          with status 4, and fits that end with a bulk velocity on a bound
+          fail with status 5. Uses the trust region reflective method for
+          single fits.
+
+        Batch fits always use the vectorized Levenberg-Marquardt solver,
+        with bounds applied by projecting each step back inside them.
+
+    Notes
+    -----
+    The fit parameters are in the same order as the arguments of
+    ``bi_maxwellian_3D()``, so parameter 4 (``vth_par``) is the thermal
+    speed along the magnetic field, and parameter 5 (``vth_perp``) the
+    thermal speed perpendicular to it. Earlier versions labelled these the
+    other way round, so ``vth_par``/``vth_perp`` and ``T_par``/``T_perp``
+    were swapped, and the density was calculated with the wrong thermal
+    speeds. Results from earlier versions should be re-fit or relabelled.
+    """
+    #: Optimizer settings for each solver profile
+    solver_profiles = {
+        'default': {'method': 'lm', 'ftol': 1e-6, 'xtol': 1e-14,
+                    'max_nfev': None, 'bounded': False},
+        'fast': {'method': 'lm', 'ftol': 1e-4, 'xtol': 1e-4,
+                 'max_nfev': 60, 'bounded': False},
+        'bounded': {'method': 'trf', 'ftol': 1e-4, 'xtol': 1e-4,
+                    'max_nfev': 60, 'bounded': True},
+    }
+
+    def __init__(self, jac='analytic', max_warm_resid=0.1,
+                 initial_guess='peak', solver='default'):
+        if jac not in ['analytic', '2-point']:
+            raise ValueError(
+                f"jac must be 'analytic' or '2-point' (got {jac})")
+        if initial_guess not in ['log', 'peak']:
+            raise ValueError(f"initial_guess must be 'log' or 'peak' "
+                             f"(got {initial_guess})")
+        if solver not in self.solver_profiles:
+            raise ValueError(f'solver must be one of '
+                             f'{list(self.solver_profiles)} (got {solver})')
+        self.jac = jac
+        self.max_warm_resid = max_warm_resid
+        self.initial_guess = initial_guess
+        self.solver = solver
+
+    @property
+    def _solver_options(self):
+        return self.solver_profiles[self.solver]
+
+    @property
+    def config(self):
+        """
+        Options that affect the fit results, as a `dict`.
+
+        As well as the attributes set on the fitter, this includes the
+        optimizer settings of the ``solver`` profile, so results are not
+        re-used if ``solver_profiles`` is changed.
+        """
+        config = super().config
+        config['solver_options'] = dict(self._solver_options)
+        return config
+
+    @staticmethod
+    def param_bounds(vmin, vmax):
+        """
+        Bounds on the fit parameters used by bounded solvers.
+
+        Parameters
+        ----------
+        vmin, vmax : numpy.ndarray
+            Smallest and largest velocity of the points being fit, in the
+            field aligned frame, shape (..., 3).
+
+        Returns
+        -------
+        lower, upper : numpy.ndarray
+            Bounds on (A, vx, vy, vz, vth_par, vth_perp), shape (..., 6).
+        """
+        extent = np.max(vmax - vmin, axis=-1, keepdims=True)
+        zero = np.zeros_like(extent)
+        lower = np.concatenate([zero, vmin, 1e-3 * extent, 1e-3 * extent],
+                               axis=-1)
+        upper = np.concatenate([zero + np.inf, vmax, extent, extent],
+                               axis=-1)
+        return lower, upper
+
     @property
     def fit_param_names(self):
-        return ['A', 'vx', 'vy', 'vz', 'vth_perp', 'vth_par']
+        # Same order as the arguments of bi_maxwellian_3D()
+        return ['A', 'vx', 'vy', 'vz', 'vth_par', 'vth_perp']
 
     def status_info(self):
         return {2: "Less than 12 points available for fit.",
-                3: "Velocity at peak VDF is non-finite.",
+                3: "Magnetic field is zero or non-finite, or velocity at "
+                   "peak VDF is non-finite.",
                 4: "Fit failed.",
-                5: "Fitted velocity is out of the VDF bounds."}
+                5: "Fitted velocity is out of the VDF bounds.",
+                6: "Rejected before fitting because of the quality flag."}
+
+    @property
+    def triage_checks(self):
+        return {'too few points': (2, self._too_few_points),
+                'bad magnetic field': (3, self._bad_bvec),
+                'non-finite peak velocity': (3, self._nonfinite_peak)}
+
+    @staticmethod
+    def _too_few_points(batch):
+        return batch.npoints < 12
+
+    @staticmethod
+    def _bad_bvecs(bvecs):
+        """
+        `True` for magnetic field vectors that are zero or non-finite, and so
+        do not define a field aligned frame.
+        """
+        return ~(np.all(np.isfinite(bvecs), axis=-1) &
+                 np.any(bvecs != 0, axis=-1))
+
+    def _bad_bvec(self, batch):
+        return self._bad_bvecs(batch.bvecs)
+
+    @staticmethod
+    def _nonfinite_peak(batch):
+        return ~batch.peak_finite
 
     @staticmethod
     def bi_maxwellian_3D(vx, vy, vz, A, vbx, vby, vbz, vth_z, vth_perp):
@@ -27,14 +178,52 @@ class BiMaxFitter(FitterBase):
         Return distribution function at (vx, vy, vz),
         given 6 distribution parameters.
         '''
+        return A * BiMaxFitter._bi_maxwellian_exp(vx, vy, vz, vbx, vby, vbz,
+                                                  vth_z, vth_perp)
+
+    @staticmethod
+    def _bi_maxwellian_exp(vx, vy, vz, vbx, vby, vbz, vth_z, vth_perp):
+        '''
+        Exponential term of ``bi_maxwellian_3D()``, which is the distribution
+        function with an amplitude of 1.
+        '''
         # Put in bulk frame
         vx = vx - vbx
         vy = vy - vby
         vz = vz - vbz
         exponent = (vx / vth_perp)**2 + (vy / vth_perp)**2 + (vz / vth_z)**2
-        return A * np.exp(-exponent)
+        return np.exp(-exponent)
+
+    @staticmethod
+    def bi_maxwellian_3D_jac(vx, vy, vz, A, vbx, vby, vbz, vth_z, vth_perp,
+                             exp=None):
+        '''
+        Return the partial derivatives of ``bi_maxwellian_3D()`` with respect
+        to each of the 6 distribution parameters.
+
+        The last axis of the returned array indexes the parameters, in the
+        order (A, vbx, vby, vbz, vth_z, vth_perp). If the exponential term
+        (from ``_bi_maxwellian_exp()``) has already been calculated at the
+        same parameters it can be passed as *exp* to save re-calculating it.
+        '''
+        if exp is None:
+            exp = BiMaxFitter._bi_maxwellian_exp(vx, vy, vz, vbx, vby, vbz,
+                                                 vth_z, vth_perp)
+        vx = vx - vbx
+        vy = vy - vby
+        vz = vz - vbz
+        vth_perp2 = vth_perp**2
+        vth_z2 = vth_z**2
+        vperp2 = vx**2 + vy**2
+        f = A * exp
+        return np.stack([exp,
+                         2 * f * vx / vth_perp2,
+                         2 * f * vy / vth_perp2,
+                         2 * f * vz / vth_z2,
+                         2 * f * vz**2 / (vth_z2 * vth_z),
+                         2 * f * vperp2 / (vth_perp2 * vth_perp)], axis=-1)
 
-    def run_single_fit(self, vs, vdf, bvec):
+    def run_single_fit(self, vs, vdf, bvec, guess=None, stats=None):
         """
         Fit a bi-Maxwellian distribution function.
 
@@ -43,6 +232,14 @@ class BiMaxFitter(FitterBase):
         vs : numpy.ndarray
         vdf : numpy.ndarray
         bvec : Vector
+        guess : array-like, optional
+            Parameters to start the fit from, in the same order and frame as
+            the returned fit parameters (e.g. the fit to a neighbouring
+            distribution). If the fit from here fails, or the relative
+            residual is more than ``max_warm_resid``, the distribution is
+            re-fit from the default initial guesses.
+        stats : vdffit.fitting.FitStats, optional
+            If given, record each run of the optimizer.
 
         Returns
         -------
@@ -50,41 +247,276 @@ class BiMaxFitter(FitterBase):
         """
         if len(vdf) < 12:
             return 2, {}
+        if self._bad_bvecs(bvec.vec):
+            return 3, {}
 
         # Rotate velocities into field aligned frame
         R = bvec.rotation_matrix
         vs = np.einsum('ij,kj->ki', R, vs)
 
-        # Residuals to minimize
-        def resid(maxwell_params, vs, vdf):
-            fit = self.bi_maxwellian_3D(vs[:, 0], vs[:, 1],
-                                        vs[:, 2], *maxwell_params)
-            return vdf - fit
-
         guesses = self.initial_guesses(vs, vdf)
         if np.any(np.isnan([guesses[1], guesses[2], guesses[3]])):
             return 3, {}
+        if self.initial_guess == 'log':
+            guesses = self._log_guesses(
+                vs[np.newaxis], vdf[np.newaxis],
+                np.ones((1, len(vdf)), dtype=bool),
+                np.array([guesses], dtype=float))[0]
+
+        if guess is not None:
+            guess = np.array(guess, dtype=float)
+            guess[1:4] = R @ guess[1:4]
+            guess[4:] = np.abs(guess[4:])
+            warm = self._solve(vs, vdf, guess, stats)
+            status, fitparams, cost = warm
+            if (status != 1 or
+                    2 * cost > self.max_warm_resid * np.sum(vdf**2)):
+                status, fitparams, cost = self._solve(vs, vdf, guesses,
+                                                      stats)
+                # Keep the warm started fit if it is better
+                if warm[0] == 1 and (status != 1 or warm[2] < cost):
+                    status, fitparams, cost = warm
+        else:
+            status, fitparams, cost = self._solve(vs, vdf, guesses, stats)
+
+        if status != 1:
+            return status, {}
+
+        # Transform bulk velocity out of field aligned frame
+        fitparams[1:4] = np.einsum('ij,j->i', R.T, fitparams[1:4])
+        return 1, fitparams
+
+    def _solve(self, vs, vdf, guesses, stats=None):
+        """
+        Fit a single distribution in the field aligned frame.
+
+        Returns
+        -------
+        status : int
+        fitparams : numpy.ndarray
+        cost : float
+            Half the sum of the squared residuals.
+        """
+        # The solver evaluates the Jacobian at parameters where it has
+        # already evaluated the residuals: the last evaluation, or for
+        # Levenberg-Marquardt after rejected steps, the evaluation with the
+        # lowest cost. Keep the exponential terms of both to re-use.
+        last = {}
+        best = {'cost': np.inf}
+
+        # Residuals to minimize
+        def resid(maxwell_params, vs, vdf):
+            exp = self._bi_maxwellian_exp(vs[:, 0], vs[:, 1], vs[:, 2],
+                                          *maxwell_params[1:])
+            res = vdf - maxwell_params[0] * exp
+            last.update(params=maxwell_params.copy(), exp=exp)
+            cost = np.sum(res**2)
+            if cost <= best['cost']:
+                best.update(last, cost=cost)
+            return res
+
+        def resid_jac(maxwell_params, vs, vdf):
+            exp = None
+            for evaluation in [last, best]:
+                if np.array_equal(maxwell_params, evaluation.get('params')):
+                    exp = evaluation['exp']
+                    break
+            return -self.bi_maxwellian_3D_jac(vs[:, 0], vs[:, 1],
+                                              vs[:, 2], *maxwell_params,
+                                              exp=exp)
+
+        import scipy.optimize as opt
 
         # Do fitting
-        fitout = opt.least_squares(resid, guesses,
-                                   args=(vs, vdf), method='lm',
-                                   ftol=1e-6, xtol=1e-14)
+        options = self._solver_options
+        vmin, vmax = np.min(vs, axis=0), np.max(vs, axis=0)
+        bounds = (-np.inf, np.inf)
+        norm = 1
+        if options['bounded']:
+            bounds = self.param_bounds(vmin, vmax)
+            guesses = np.clip(guesses, *bounds)
+            # The trust region reflective method has an absolute gradient
+            # tolerance, so normalise the VDF to be O(1)
+            if np.isfinite(guesses[0]) and guesses[0] > 0:
+                norm = guesses[0]
+            vdf = vdf / norm
+            guesses[0] /= norm
+        jac = resid_jac if self.jac == 'analytic' else '2-point'
+        with _timer(stats, 'least squares'):
+            fitout = opt.least_squares(resid, guesses, jac=jac,
+                                       args=(vs, vdf), bounds=bounds,
+                                       method=options['method'],
+                                       ftol=options['ftol'],
+                                       xtol=options['xtol'],
+                                       max_nfev=options['max_nfev'])
+        if stats is not None:
+            stats.add_solve(fitout.nfev, fitout.njev)
 
         fitparams = fitout.x
-        if fitout.status <= 0 or fitparams[4] == fitparams[5]:
-            return 4, {}
+        fitparams[0] *= norm
+        cost = fitout.cost * norm**2
+        failed = fitout.status <= 0 or fitparams[4] == fitparams[5]
+        if options['bounded']:
+            failed |= np.any(fitout.active_mask[4:] != 0)
+        if failed:
+            return 4, fitparams, cost
 
         v_bulk = fitparams[1:4]
-        out_of_bounds = [(v_bulk[i] < np.min(vs[:, i]) or
-                          v_bulk[i] > np.max(vs[:, i]))
-                         for i in range(3)]
-        out_of_bounds = np.any(out_of_bounds)
+        out_of_bounds = np.any((v_bulk < vmin) | (v_bulk > vmax))
+        if options['bounded']:
+            out_of_bounds |= np.any(fitout.active_mask[1:4] != 0)
         if out_of_bounds:
-            return 5, {}
+            return 5, fitparams, cost
+
+        return 1, fitparams, cost
+
+    def run_batch_fit(self, vs, vdf, mask, bvecs, stats=None):
+        """
+        Fit a batch of bi-Maxwellian distribution functions.
+
+        This gives the same status codes as ``run_single_fit()``, but fits all
+        of the distribution functions at once with a vectorized
+        Levenberg-Marquardt solver.
+
+        Parameters
+        ----------
+        vs : numpy.ndarray
+            Velocities, shape (N, npts, 3).
+        vdf : numpy.ndarray
+            VDF values, shape (N, npts).
+        mask : numpy.ndarray
+            Boolean mask of points to fit, shape (N, npts).
+        bvecs : numpy.ndarray
+            Magnetic field vectors, shape (N, 3).
+        stats : vdffit.fitting.FitStats, optional
+            If given, record the optimizer runs.
+
+        Returns
+        -------
+        status : numpy.ndarray
+            Fit status codes, shape (N, ).
+        fit_params : numpy.ndarray
+            Fit parameters, shape (N, 6).
+        """
+        n = vdf.shape[0]
+        status = np.ones(n, dtype=int)
+        fitparams = np.full((n, len(self.fit_param_names)), np.nan)
+        status[np.sum(mask, axis=1) < 12] = 2
+        status[(status == 1) & self._bad_bvecs(bvecs)] = 3
+        fit = np.nonzero(status == 1)[0]
+        if not fit.size:
+            return status, fitparams
+
+        vs, vdf, mask = vs[fit], vdf[fit], mask[fit]
+        # Rotate velocities into field aligned frame
+        bvecs = VectorArray(bvecs[fit])
+        vs = bvecs.rotate_into(vs)
+
+        guesses = self.initial_guesses_batch(vs, vdf, mask)
+        bad_guess = np.any(np.isnan(guesses[:, 1:4]), axis=1)
+        status[fit[bad_guess]] = 3
+        keep = ~bad_guess
+        fit, vs, vdf, mask, bvecs, guesses = (
+            fit[keep], vs[keep], vdf[keep], mask[keep],
+            VectorArray(bvecs.vecs[keep]), guesses[keep])
+        if not fit.size:
+            return status, fitparams
+        if self.initial_guess == 'log':
+            guesses = self._log_guesses(vs, vdf, mask, guesses)
+
+        # Normalise each VDF by its peak value, so the amplitudes are O(1)
+        norm = guesses[:, 0].copy()
+        norm[~(np.isfinite(norm) & (norm > 0))] = 1
+        vdf_norm = vdf / norm[:, None]
+        guesses[:, 0] /= norm
+
+        # The Jacobian is only evaluated for a subset of the problems whose
+        # residuals were last evaluated, at the same parameters, so keep the
+        # last exponential terms to re-use
+        last = {'idx': None, 'params': None, 'exp': None}
+
+        def resid(params, idx):
+            exp = self._bi_maxwellian_exp(
+                vs[idx, :, 0], vs[idx, :, 1], vs[idx, :, 2],
+                *[p[:, None] for p in params[:, 1:].T])
+            last.update(idx=idx, params=params.copy(), exp=exp)
+            return np.where(mask[idx],
+                            vdf_norm[idx] - params[:, :1] * exp, 0)
+
+        def resid_jac(params, idx):
+            exp = None
+            if last['idx'] is not None and np.all(np.isin(idx, last['idx'])):
+                rows = np.searchsorted(last['idx'], idx)
+                if np.array_equal(params, last['params'][rows]):
+                    exp = last['exp'][rows]
+            jac = self.bi_maxwellian_3D_jac(
+                vs[idx, :, 0], vs[idx, :, 1], vs[idx, :, 2],
+                *[p[:, None] for p in params.T], exp=exp)
+            return np.where(mask[idx, :, None], -jac, 0)
+
+        options = self._solver_options
+        vmin = np.min(np.where(mask[:, :, None], vs, np.inf), axis=1)
+        vmax = np.max(np.where(mask[:, :, None], vs, -np.inf), axis=1)
+        bounds = None
+        if options['bounded']:
+            bounds = self.param_bounds(vmin, vmax)
+        jac = resid_jac if self.jac == 'analytic' else None
+        with _timer(stats, 'least squares'):
+            fitout = batch_least_squares(resid, guesses, jac=jac,
+                                         bounds=bounds,
+                                         ftol=options['ftol'],
+                                         xtol=options['xtol'],
+                                         max_nfev=options['max_nfev'])
+        if stats is not None:
+            stats.add_solve(fitout.nfev, fitout.njev)
+        params = fitout.x
+        params[:, 0] *= norm
+
+        failed = (fitout.status <= 0) | (params[:, 4] == params[:, 5])
+        if options['bounded']:
+            # Fits that end on a bound were pushed against it
+            lower, upper = bounds
+            failed |= np.any((params[:, 4:] <= lower[:, 4:]) |
+                             (params[:, 4:] >= upper[:, 4:]), axis=1)
+        status[fit[failed]] = 4
+
+        v_bulk = params[:, 1:4]
+        out_of_bounds = np.any((v_bulk < vmin) | (v_bulk > vmax), axis=1)
+        if options['bounded']:
+            out_of_bounds |= np.any((v_bulk <= vmin) | (v_bulk >= vmax),
+                                    axis=1)
+        status[fit[~failed & out_of_bounds]] = 5
 
         # Transform bulk velocity out of field aligned frame
-        fitparams[1:4] = np.einsum('ij,j->i', R.T, v_bulk)
-        return 1, fitparams
+        params[:, 1:4] = bvecs.rotate_out_of(v_bulk)
+        good = status[fit] == 1
+        fitparams[fit[good]] = params[good]
+        return status, fitparams
+
+    def initial_guesses_batch(self, vs, vdf, mask):
+        """
+        Initial gueses for a batch of bimaxwellian fits.
+
+        Parameters
+        ----------
+        vs : numpy.ndarray
+            Velocities, shape (N, npts, 3).
+        vdf : numpy.ndarray
+            VDF values, shape (N, npts).
+        mask : numpy.ndarray
+            Boolean mask of points to fit, shape (N, npts).
+
+        Returns
+        -------
+        numpy.ndarray
+            Initial guesses, shape (N, 6).
+        """
+        n = vdf.shape[0]
+        peak_idx = np.argmax(np.where(mask & ~np.isnan(vdf), vdf, -np.inf),
+                             axis=1)
+        A0 = vdf[np.arange(n), peak_idx]
+        v0 = vs[np.arange(n), peak_idx, :]
+        return np.column_stack([A0, v0, np.full((n, 2), 40., dtype=vdf.dtype)])
 
     def initial_guesses(self, vs, vdf):
         """
@@ -100,25 +532,113 @@ class BiMaxFitter(FitterBase):
         v0 = vs[peak_idx, :]
         return [A0, v0[0], v0[1], v0[2], 40, 40]
 
+    def _log_guesses(self, vs, vdf, mask, guesses):
+        """
+        Replace *guesses* with the fits to the log VDF, where these succeed.
+        """
+        log_guesses = self.log_fit_batch(vs, vdf, mask)
+        good = np.all(np.isfinite(log_guesses), axis=1)
+        guesses[good] = log_guesses[good]
+        return guesses
+
+    @staticmethod
+    def log_fit_batch(vs, vdf, mask):
+        """
+        Fit a batch of bi-Maxwellians without iterating.
+
+        The logarithm of a bi-Maxwellian is a quadratic function of
+        velocity, so it can be fit with linear least squares. Each point is
+        weighted by its VDF value, which makes the fit close to a least
+        squares fit to the VDF itself.
+
+        Parameters
+        ----------
+        vs : numpy.ndarray
+            Velocities in the field aligned frame, shape (N, npts, 3).
+        vdf : numpy.ndarray
+            VDF values, shape (N, npts).
+        mask : numpy.ndarray
+            Boolean mask of points to fit, shape (N, npts). Points where the
+            VDF is not positive are always left out.
+
+        Returns
+        -------
+        numpy.ndarray
+            Fit parameters (A, vx, vy, vz, vth_par, vth_perp), shape (N, 6),
+            in the same type as *vdf*. Rows are NaN where the log VDF does
+            not have a maximum.
+        """
+        n = vdf.shape[0]
+        with np.errstate(all='ignore'):
+            use = (mask & (vdf > 0) &
+                   np.all(np.isfinite(vs), axis=-1))
+            weight = np.where(use, vdf, 0).astype(float)
+            peak = np.argmax(weight, axis=1)
+            weight /= weight[np.arange(n), peak][:, None]
+            # Work relative to the peak, and in units of the spread of the
+            # points, so the linear system is well conditioned
+            v0 = vs[np.arange(n), peak].astype(float)
+            dv = np.where(use[:, :, None], vs - v0[:, None, :], 0)
+            scale = np.sqrt(np.sum(dv**2, axis=(1, 2)) /
+                            np.maximum(np.sum(use, axis=1), 1))
+            scale[~(scale > 0)] = 1
+            dv /= scale[:, None, None]
+
+            # log(f) = c0 + c1 vx + c2 vy + c3 vz + c4 vperp^2 + c5 vz^2
+            basis = np.stack([np.ones_like(dv[:, :, 0]),
+                              dv[:, :, 0], dv[:, :, 1], dv[:, :, 2],
+                              dv[:, :, 0]**2 + dv[:, :, 1]**2,
+                              dv[:, :, 2]**2], axis=-1) * weight[:, :, None]
+            logf = np.log(np.where(use, vdf, 1)) * weight
+            lhs = basis.swapaxes(1, 2) @ basis
+            rhs = (basis.swapaxes(1, 2) @ logf[:, :, None])[:, :, 0]
+            try:
+                coef = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+            except np.linalg.LinAlgError:
+                coef = np.stack([np.linalg.lstsq(a, b, rcond=None)[0]
+                                 for a, b in zip(lhs, rhs)])
+
+            # Complete the square to get the bi-Maxwellian parameters
+            a_perp, a_par = -coef[:, 4], -coef[:, 5]
+            u = np.column_stack([coef[:, 1] / (2 * a_perp),
+                                 coef[:, 2] / (2 * a_perp),
+                                 coef[:, 3] / (2 * a_par)])
+            logA = (coef[:, 0] + a_perp * (u[:, 0]**2 + u[:, 1]**2) +
+                    a_par * u[:, 2]**2)
+            params = np.column_stack([np.exp(logA),
+                                      v0 + u * scale[:, None],
+                                      scale / np.sqrt(a_par),
+                                      scale / np.sqrt(a_perp)])
+        good = (a_perp > 0) & (a_par > 0) & np.all(np.isfinite(params),
+                                                   axis=1)
+        params[~good] = np.nan
+        return params.astype(vdf.dtype)
+
     def post_fit_process(self, params):
         """
         - Create a TimeSeries
         - Attach units
         - Convert thermal speeds to temperatures
         """
-        params = pd.DataFrame(params)
-        ts = TimeSeries(time=params['Time'])
-        ts['n'] = (params['A'].values * self.vdfunit *
+        from astropy.timeseries import TimeSeries
+
+        params = self._as_results(params)
+        ts = TimeSeries(time=datetime64_to_time(params['Time']))
+        ts['n'] = (params['A'] * self.vdfunit *
                    np.pi**(3 / 2) *
-                   (params['vth_perp'].values * self.vunit)**2 *
-                   params['vth_par'].values * self.vunit).to(u.cm**-3)
-        ts['vx'] = params['vx'].values * self.vunit
-        ts['vy'] = params['vy'].values * self.vunit
-        ts['vz'] = params['vz'].values * self.vunit
-        ts['T_perp'] = self.v_to_T(params['vth_perp'].values * self.vunit)
-        ts['T_par'] = self.v_to_T(params['vth_par'].values * self.vunit)
-        ts['Fit status'] = params['fit status'].values.astype(int)
-        ts['Quality flag'] = params['quality flag'].values.astype(int)
+                   (params['vth_perp'] * self.vunit)**2 *
+                   params['vth_par'] * self.vunit).to(u.cm**-3)
+        ts['vx'] = params['vx'] * self.vunit
+        ts['vy'] = params['vy'] * self.vunit
+        ts['vz'] = params['vz'] * self.vunit
+        ts['T_perp'] = self.v_to_T(params['vth_perp'] * self.vunit)
+        ts['T_par'] = self.v_to_T(params['vth_par'] * self.vunit)
+        ts['Fit status'] = params['fit status'].astype(int)
+        ts['Fit status'].info.description = 'Fit status code'
+        ts['Quality flag'] = params['quality flag'].astype(int)
+        ts['Quality flag'].info.description = (
+            'Quality flag of the distribution function')
+        ts.meta['fit status'] = {1: 'Fit successful.', **self.status_info()}
         return ts
 
     @staticmethod
@@ -132,3 +652,101 @@ class BiMaxFitter(FitterBase):
         """
         m = const.m_p
         return (m * v**2 / (2 * const.k_B.si)).to(u.K)
+
+
+class BiMaxLogFitter(BiMaxFitter):
+    """
+    Bi-Maxwellian fitter that only fits the logarithm of the VDF, using
+    ``BiMaxFitter.log_fit_batch()``.
+
+    This needs no iteration, so is much faster than `BiMaxFitter`, but
+    the fit is less accurate for distributions that are not close to
+    bi-Maxwellian.
+    """
+    def __init__(self):
+        # There is no optimizer, so the solver and Jacobian options are
+        # fixed. They are still set, so that the fitter configuration is
+        # complete and the inherited methods work.
+        super().__init__(jac='analytic', initial_guess='log',
+                         solver='default')
+
+    def status_info(self):
+        info = super().status_info()
+        info[4] = "Log VDF has no maximum."
+        return info
+
+    def run_single_fit(self, vs, vdf, bvec, guess=None, stats=None):
+        """
+        Fit a bi-Maxwellian distribution function.
+
+        Parameters
+        ----------
+        vs : numpy.ndarray
+        vdf : numpy.ndarray
+        bvec : Vector
+        guess : array-like, optional
+            Ignored, as the fit does not need a starting point.
+        stats : vdffit.fitting.FitStats, optional
+            Ignored.
+        """
+        status, params = self.run_batch_fit(
+            vs[np.newaxis], vdf[np.newaxis],
+            np.ones((1, len(vdf)), dtype=bool), bvec.vec[np.newaxis])
+        if status[0] != 1:
+            return status[0], {}
+        return 1, params[0]
+
+    def run_batch_fit(self, vs, vdf, mask, bvecs, stats=None):
+        """
+        Fit a batch of bi-Maxwellian distribution functions.
+
+        Parameters
+        ----------
+        vs : numpy.ndarray
+            Velocities, shape (N, npts, 3).
+        vdf : numpy.ndarray
+            VDF values, shape (N, npts).
+        mask : numpy.ndarray
+            Boolean mask of points to fit, shape (N, npts).
+        bvecs : numpy.ndarray
+            Magnetic field vectors, shape (N, 3).
+        stats : vdffit.fitting.FitStats, optional
+            Ignored.
+
+        Returns
+        -------
+        status : numpy.ndarray
+            Fit status codes, shape (N, ).
+        fit_params : numpy.ndarray
+            Fit parameters, shape (N, 6).
+        """
+        n = vdf.shape[0]
+        status = np.ones(n, dtype=int)
+        fitparams = np.full((n, len(self.fit_param_names)), np.nan)
+        status[np.sum(mask, axis=1) < 12] = 2
+
+        bad_bvec = self._bad_bvecs(bvecs)
+        # Zero fields can't be rotated into, so give NaN velocities instead
+        bvecs = VectorArray(np.where(bad_bvec[:, None], np.nan, bvecs))
+        vs = bvecs.rotate_into(vs)
+        # Same checks as BiMaxFitter
+        peak_v = self.initial_guesses_batch(vs, vdf, mask)[:, 1:4]
+        bad_peak = bad_bvec | ~np.all(np.isfinite(peak_v), axis=1)
+        status[(status == 1) & bad_peak] = 3
+
+        params = self.log_fit_batch(vs, vdf, mask)
+        failed = ~np.all(np.isfinite(params), axis=1)
+        status[(status == 1) & failed] = 4
+
+        with np.errstate(invalid='ignore'):
+            v_bulk = params[:, 1:4]
+            vmin = np.min(np.where(mask[:, :, None], vs, np.inf), axis=1)
+            vmax = np.max(np.where(mask[:, :, None], vs, -np.inf), axis=1)
+            out_of_bounds = np.any((v_bulk < vmin) | (v_bulk > vmax),
+                                   axis=1)
+        status[(status == 1) & out_of_bounds] = 5
+
+        params[:, 1:4] = bvecs.rotate_out_of(v_bulk)
+        good = status == 1
+        fitparams[good] = params[good]
+        return status, fitparams
@@ -0,0 +1,216 @@
+"""
+A persistent, on-disk cache of fit results.
+"""
+import json
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+
+__all__ = ['FitCache']
+
+
+class FitCache:
+    """
+    An on-disk cache of the results of fitting individual distribution
+    functions, stored in a SQLite database.
+
+    Results are keyed by the fitter class and its configuration (see
+    ``FitterBase.config``), by the options passed to ``fit_cdf()`` that
+    change the results, and by a hash of the data in each record (see
+    `vdffit.vdf.VDFBatch.record_hashes`). This means that when a new
+    version of a data file is released, or the magnetic field data changes,
+    only the records that have changed are re-fit.
+
+    The record hashes of each data file are also stored, keyed by
+    ``VDFCDF.file_signature``, so a file that has not changed since it was
+    last fit does not have to be read to look up its results.
+
+    When the cache grows larger than *max_size*, the least recently used
+    results are removed.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the cache database. Created if it does not exist.
+    max_size : int, optional
+        Maximum total size of the cached results, in bytes.
+    """
+    def __init__(self, path, max_size=2**30):
+        self.path = path
+        self.max_size = max_size
+        with closing(self._connect()) as con, con:
+            con.execute('CREATE TABLE IF NOT EXISTS results ('
+                        'fitter TEXT, record TEXT, result TEXT, '
+                        'size INTEGER, last_used REAL, '
+                        'PRIMARY KEY (fitter, record))')
+            con.execute('CREATE INDEX IF NOT EXISTS last_used_idx '
+                        'ON results (last_used)')
+            con.execute('CREATE TABLE IF NOT EXISTS files ('
+                        'signature TEXT PRIMARY KEY, records TEXT, '
+                        'last_used REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def fitter_key(fitter, options=None):
+        """
+        Key identifying a fitter class and configuration, and the fitting
+        options in the `dict` *options*.
+        """
+        return json.dumps([type(fitter).__qualname__, fitter.config,
+                           options or {}], sort_keys=True, default=repr)
+
+    @staticmethod
+    def _encode(params):
+        values = [params[name] for name in params.dtype.names]
+        values = [int(v.astype('datetime64[ns]').view(np.int64))
+                  if isinstance(v, np.datetime64) else v.item()
+                  for v in values]
+        return json.dumps(values, allow_nan=True)
+
+    @staticmethod
+    def _decode(result):
+        return tuple(json.loads(result))
+
+    def get(self, fitter, records, options=None):
+        """
+        Get cached fit results.
+
+        Parameters
+        ----------
+        fitter : vdffit.fitting.FitterBase
+        records : list[str]
+            Record hashes.
+        options : dict, optional
+            Fitting options that change the results, which must be the same
+            as when the results were added.
+
+        Returns
+        -------
+        dict[str, tuple]
+            Mapping from record hash to fit parameters, for the records that
+            are in the cache. Each value is in the same order as the fields
+            of ``fitter.result_dtype``, with times as integer nanoseconds.
+        """
+        key = self.fitter_key(fitter, options)
+        found = {}
+        with closing(self._connect()) as con, con:
+            # Query in chunks to stay under the SQLite variable limit
+            for i in range(0, len(records), 500):
+                chunk = records[i:i + 500]
+                rows = con.execute(
+                    'SELECT record, result FROM results WHERE fitter = ? '
+                    f'AND record IN ({", ".join("?" * len(chunk))})',
+                    [key, *chunk]).fetchall()
+                found.update({record: self._decode(result)
+                              for record, result in rows})
+            now = time.time()
+            con.executemany(
+                'UPDATE results SET last_used = ? WHERE fitter = ? '
+                'AND record = ?', [(now, key, r) for r in found])
+        return found
+
+    def put(self, fitter, records, params, options=None):
+        """
+        Add fit results to the cache.
+
+        Parameters
+        ----------
+        fitter : vdffit.fitting.FitterBase
+        records : list[str]
+            Record hashes.
+        params : numpy.ndarray
+            Fit parameters for each record, with dtype
+            ``fitter.result_dtype``.
+        options : dict, optional
+            Fitting options that change the results.
+        """
+        key = self.fitter_key(fitter, options)
+        now = time.time()
+        rows = []
+        for record, p in zip(records, params):
+            result = self._encode(p)
+            rows.append((key, record, result, len(result), now))
+        with closing(self._connect()) as con, con:
+            con.executemany('INSERT OR REPLACE INTO results '
+                            'VALUES (?, ?, ?, ?, ?)', rows)
+        self.evict()
+
+    def get_record_hashes(self, signature):
+        """
+        Get the stored record hashes of a data file.
+
+        Parameters
+        ----------
+        signature : str
+            File signature (see ``VDFCDF.file_signature``).
+
+        Returns
+        -------
+        list[str] or None
+            Record hashes, or `None` if they are not stored.
+        """
+        with closing(self._connect()) as con, con:
+            row = con.execute('SELECT records FROM files WHERE signature = ?',
+                              [signature]).fetchone()
+            if row is None:
+                return None
+            con.execute('UPDATE files SET last_used = ? WHERE signature = ?',
+                        [time.time(), signature])
+        return json.loads(row[0])
+
+    def put_record_hashes(self, signature, records):
+        """
+        Store the record hashes of a data file.
+
+        Parameters
+        ----------
+        signature : str
+            File signature (see ``VDFCDF.file_signature``).
+        records : list[str]
+            Record hashes.
+        """
+        with closing(self._connect()) as con, con:
+            con.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)',
+                        [signature, json.dumps(records), time.time()])
+
+    def evict(self):
+        """
+        Remove the least recently used results until the total size of the
+        cache is no more than ``max_size``.
+
+        Stored record hashes of files that were last used before any of the
+        remaining results are also removed.
+        """
+        with closing(self._connect()) as con, con:
+            total = con.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            if total <= self.max_size:
+                return
+            rows = con.execute('SELECT rowid, size FROM results '
+                               'ORDER BY last_used ASC').fetchall()
+            remove = []
+            for rowid, size in rows:
+                if total <= self.max_size:
+                    break
+                remove.append((rowid,))
+                total -= size
+            con.executemany('DELETE FROM results WHERE rowid = ?', remove)
+            con.execute('DELETE FROM files WHERE last_used < '
+                        '(SELECT MIN(last_used) FROM results)')
+
+    @property
+    def size(self):
+        """
+        Total size of the cached results, in bytes.
+        """
+        with closing(self._connect()) as con:
+            return con.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def __len__(self):
+        with closing(self._connect()) as con:
+            return con.execute('SELECT COUNT(*) FROM results').fetchone()[0]
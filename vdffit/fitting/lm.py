@@ -0,0 +1,186 @@
+"""
+A vectorized Levenberg-Marquardt solver for fitting many small, independent
+least squares problems at once.
+"""
+import numpy as np
+
+__all__ = ['batch_least_squares']
+
+
+def _forward_diff_jac(fun, x, idx, f0, dtype):
+    """
+    Forward difference Jacobian of *fun* at *x*, shape (n, m, p).
+    """
+    eps = np.sqrt(np.finfo(dtype).eps)
+    h = eps * np.maximum(np.abs(x), 1)
+    jac = np.empty(f0.shape + (x.shape[1],), dtype=f0.dtype)
+    for j in range(x.shape[1]):
+        xh = x.copy()
+        xh[:, j] += h[:, j]
+        # Use the actual step, as xh - x is not exactly h in floating point
+        jac[:, :, j] = (fun(xh, idx) - f0) / (xh[:, j] - x[:, j])[:, None]
+    return jac
+
+
+def batch_least_squares(fun, x0, jac=None, bounds=None, ftol=1e-8,
+                        xtol=1e-8, max_nfev=None, lambda0=1e-3):
+    """
+    Solve N independent non-linear least squares problems using the
+    Levenberg-Marquardt algorithm, with all problems stepped together.
+
+    Parameters
+    ----------
+    fun : callable
+        ``fun(x, idx)`` must return the residuals for the problems with
+        indices *idx*, evaluated at parameters *x*. *x* has shape (n, p),
+        and the return value must have shape (n, m). Padded residuals should
+        be returned as zero.
+    x0 : numpy.ndarray
+        Initial guesses, shape (N, p).
+    jac : callable, optional
+        ``jac(x, idx)`` must return the Jacobian of the residuals with shape
+        (n, m, p). If not given a forward difference approximation is used.
+    bounds : tuple[numpy.ndarray, numpy.ndarray], optional
+        Lower and upper bounds on the parameters, each broadcastable to
+        (N, p). The initial guesses are clipped to the bounds, and each step
+        is projected back inside them, so problems can end on a bound.
+    ftol : float, optional
+        Tolerance for termination by the relative change of the cost function.
+    xtol : float, optional
+        Tolerance for termination by the relative change of the parameters.
+        Values smaller than the machine epsilon of the parameters' type are
+        raised to it.
+    max_nfev : int, optional
+        Maximum number of residual evaluations for each problem. Defaults to
+        ``100 * p``.
+    lambda0 : float, optional
+        Initial damping parameter.
+
+    Returns
+    -------
+    scipy.optimize.OptimizeResult
+        With the following fields, each with a leading dimension of N:
+
+        - ``x``: the solutions.
+        - ``cost``: half the sum of squared residuals at the solutions.
+        - ``status``: the reason for termination. These follow the
+          conventions of `scipy.optimize.least_squares`; 0 means the
+          maximum number of function evaluations was exceeded, -1 means the
+          solver broke down, 2 means the ``ftol`` condition was satisfied,
+          3 the ``xtol`` condition, and 4 both.
+        - ``nfev``: number of residual evaluations.
+        - ``njev``: number of Jacobian evaluations.
+        - ``success``: `True` where ``status > 0``.
+    """
+    x = np.array(x0, copy=True)
+    n, p = x.shape
+    dtype = x.dtype
+    if bounds is not None:
+        lower, upper = (np.broadcast_to(np.asarray(b, dtype=dtype), (n, p))
+                        for b in bounds)
+        x = np.clip(x, lower, upper)
+    if max_nfev is None:
+        max_nfev = 100 * p
+    # Steps smaller than this can't change the parameters
+    xtol = max(xtol, np.finfo(dtype).eps)
+
+    status = np.full(n, -1, dtype=int)
+    nfev = np.zeros(n, dtype=int)
+    njev = np.zeros(n, dtype=int)
+    cost = np.full(n, np.inf, dtype=dtype)
+    lam = np.full(n, lambda0, dtype=dtype)
+    # Gradient and (Gauss-Newton) Hessian, in scaled parameter coordinates
+    hess = np.zeros((n, p, p), dtype=dtype)
+    grad = np.zeros((n, p), dtype=dtype)
+    scale = np.ones((n, p), dtype=dtype)
+    active = np.ones(n, dtype=bool)
+    eye = np.eye(p, dtype=dtype)
+
+    def update_derivatives(idx, f):
+        if jac is None:
+            J = _forward_diff_jac(fun, x[idx], idx, f, dtype)
+            nfev[idx] += p
+        else:
+            J = jac(x[idx], idx)
+        njev[idx] += 1
+        JT = J.swapaxes(1, 2)
+        JTJ = JT @ J
+        d = np.sqrt(np.einsum('nii->ni', JTJ))
+        d[~(d > 0)] = 1
+        scale[idx] = d
+        hess[idx] = JTJ / (d[:, :, None] * d[:, None, :])
+        grad[idx] = (JT @ f[:, :, None])[:, :, 0] / d
+
+    with np.errstate(all='ignore'):
+        idx = np.arange(n)
+        f = fun(x, idx)
+        nfev += 1
+        cost = 0.5 * np.sum(f**2, axis=1)
+        # Problems with a non-finite starting point can never be solved
+        active &= np.isfinite(cost)
+        update_derivatives(idx[active], f[active])
+
+        while np.any(active):
+            idx = np.nonzero(active)[0]
+            # Solve (J^T J + lambda I) y = -J^T f in scaled coordinates
+            try:
+                y = np.linalg.solve(hess[idx] + lam[idx, None, None] * eye,
+                                    -grad[idx][:, :, None])[:, :, 0]
+            except np.linalg.LinAlgError:
+                y = np.stack([np.linalg.lstsq(h + d * eye, -g, rcond=None)[0]
+                              for h, g, d in zip(hess[idx], grad[idx],
+                                                 lam[idx])])
+            step = y / scale[idx]
+            x_new = x[idx] + step
+            if bounds is not None:
+                x_new = np.clip(x_new, lower[idx], upper[idx])
+                step = x_new - x[idx]
+                y = step * scale[idx]
+            f_new = fun(x_new, idx)
+            nfev[idx] += 1
+            cost_new = 0.5 * np.sum(f_new**2, axis=1)
+
+            # Actual and predicted (by the linear model) relative reductions
+            actred = (cost[idx] - cost_new) / cost[idx]
+            hy = np.einsum('nij,nj->ni', hess[idx], y)
+            prered = -(np.einsum('ni,ni->n', grad[idx], y) +
+                       0.5 * np.einsum('ni,ni->n', y, hy)) / cost[idx]
+            accept = np.isfinite(cost_new) & (cost_new < cost[idx])
+
+            # Convergence tests
+            xnorm = np.linalg.norm(np.where(accept[:, None], x_new, x[idx]),
+                                   axis=1)
+            xconv = np.linalg.norm(step, axis=1) <= xtol * (xtol + xnorm)
+            fconv = ((np.abs(actred) <= ftol) & (prered <= ftol) &
+                     np.isfinite(cost_new))
+            fconv |= cost_new == 0
+
+            # Update accepted steps
+            acc = idx[accept]
+            x[acc] = x_new[accept]
+            cost[acc] = cost_new[accept]
+            lam[acc] = np.maximum(lam[acc] / 10, 1e-12)
+            rej = idx[~accept]
+            lam[rej] *= 10
+
+            conv = xconv | fconv
+            status[idx[conv]] = np.where(xconv & fconv, 4,
+                                         np.where(fconv, 2, 3))[conv]
+            done = conv.copy()
+            exhausted = ~conv & (nfev[idx] >= max_nfev)
+            status[idx[exhausted]] = 0
+            done |= exhausted
+            broken = ~done & ~(lam[idx] < 1e16)
+            status[idx[broken]] = -1
+            done |= broken
+            active[idx[done]] = False
+
+            # Refresh derivatives where the parameters have moved
+            refresh = accept & ~done
+            if np.any(refresh):
+                update_derivatives(idx[refresh], f_new[refresh])
+
+    from scipy.optimize import OptimizeResult
+
+    return OptimizeResult(x=x, cost=cost, status=status, nfev=nfev,
+                          njev=njev, success=status > 0)
@@ -0,0 +1,193 @@
+"""
+Numerically integrated moments of velocity distribution functions.
+"""
+import astropy.constants as const
+import astropy.units as u
+import numpy as np
+
+from vdffit.util.time import datetime64_to_time
+from vdffit.vdf import VDFBatch
+
+__all__ = ['Moments', 'batch_moments']
+
+
+def batch_moments(velocities, vdf, volumes, mass=const.m_p):
+    """
+    Integrate the density, bulk velocity and temperature tensor of many
+    distribution functions at once.
+
+    Parameters
+    ----------
+    velocities : numpy.ndarray
+        Velocities in units of `vdffit.vdf.VDFBatch.vunit`, shape
+        (N, npts, 3).
+    vdf : numpy.ndarray
+        VDF values in units of `vdffit.vdf.VDFBatch.vdfunit`, shape
+        (N, npts).
+    volumes : numpy.ndarray
+        Velocity space volume of the bin around each point, in units of
+        ``VDFBatch.vunit**3``, shape (N, npts). Points with a non-finite
+        velocity, VDF value or volume are left out.
+    mass : astropy.units.Quantity, optional
+        Particle mass.
+
+    Returns
+    -------
+    n : numpy.ndarray
+        Number densities in cm**-3, shape (N, ).
+    v : numpy.ndarray
+        Bulk velocities in km/s, shape (N, 3).
+    T : numpy.ndarray
+        Temperature tensors in K, shape (N, 3, 3).
+    """
+    n_factor = (VDFBatch.vdfunit * VDFBatch.vunit**3).to(u.cm**-3)
+    T_factor = (mass * VDFBatch.vunit**2 / const.k_B).to_value(u.K)
+    # Sum in double precision, whatever the type of the inputs
+    velocities = velocities.astype(float, copy=False)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = vdf.astype(float) * volumes
+        finite_v = (np.isfinite(velocities[:, :, 0]) &
+                    np.isfinite(velocities[:, :, 1]) &
+                    np.isfinite(velocities[:, :, 2]))
+        if not np.all(finite_v):
+            velocities = np.where(finite_v[:, :, None], velocities, 0)
+        weight[~(np.isfinite(weight) & finite_v)] = 0
+
+        # Sums over points are done as matrix products, which are much
+        # faster than reductions along the middle axis
+        density = np.sum(weight, axis=1)
+        v = (weight[:, None, :] @ velocities)[:, 0] / density[:, None]
+        T = ((weight[:, :, None] * velocities).swapaxes(1, 2) @ velocities /
+             density[:, None, None] - v[:, :, None] * v[:, None, :])
+    return density * n_factor, v, T * T_factor
+
+
+class Moments:
+    """
+    Numerically integrated moments of velocity distribution functions.
+
+    Moments do not assume a shape for the distribution function, and are
+    much faster to calculate than fits, so are useful for quicklook data
+    and for checking fit results. Every bin with finite data is integrated
+    over, not only the bins that are fit.
+
+    Parameters
+    ----------
+    mass : astropy.units.Quantity, optional
+        Particle mass. Defaults to the proton mass.
+    """
+    vunit = u.km / u.s
+
+    def __init__(self, mass=const.m_p):
+        self.mass = mass
+
+    @property
+    def param_names(self):
+        return ['n', 'vx', 'vy', 'vz', 'T_par', 'T_perp']
+
+    def status_info(self):
+        return {2: "Density is not positive."}
+
+    @property
+    def result_dtype(self):
+        """
+        Structured `numpy.dtype` of results.
+
+        This has the same layout as ``FitterBase.result_dtype``, with one
+        float field for each of ``param_names``.
+        """
+        return np.dtype([(name, float) for name in self.param_names] +
+                        [('fit status', int), ('quality flag', int),
+                         ('Time', 'datetime64[ns]')])
+
+    def compute_batch(self, batch):
+        """
+        Calculate the moments of a batch of distribution functions.
+
+        Parameters
+        ----------
+        batch : vdffit.vdf.VDFBatch
+            Must have bin volumes.
+
+        Returns
+        -------
+        numpy.ndarray
+            Moments of each distribution function, as a ``result_dtype``
+            array. Temperatures are parallel and perpendicular to the
+            magnetic field.
+        """
+        if batch.volumes is None:
+            raise ValueError('Batch does not have bin volumes, which are '
+                             'needed to calculate moments')
+        n, v, T = batch_moments(batch.velocities, batch.vdf, batch.volumes,
+                                mass=self.mass)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            b = batch.bvecs / np.linalg.norm(batch.bvecs, axis=1,
+                                             keepdims=True)
+            T_par = np.einsum('ni,nij,nj->n', b, T, b)
+            T_perp = (np.trace(T, axis1=1, axis2=2) - T_par) / 2
+
+        results = np.zeros(len(batch), dtype=self.result_dtype)
+        for name, values in zip(self.param_names,
+                                [n, *v.T, T_par, T_perp]):
+            results[name] = values
+        status = np.where(n > 0, 1, 2)
+        for name in self.param_names:
+            results[name][status != 1] = np.nan
+        results['fit status'] = status
+        results['quality flag'] = batch.quality_flags
+        results['Time'] = batch.times
+        return results
+
+    def compute_cdf(self, cdf, batch_size=1000):
+        """
+        Calculate the moments of all the distribution functions in a file.
+
+        Parameters
+        ----------
+        cdf : vdffit.io.VDFCDF
+        batch_size : int, optional
+            Number of distribution functions to read from the file at once.
+
+        Returns
+        -------
+        astropy.timeseries.TimeSeries
+            In the same format as ``BiMaxFitter.post_fit_process()``.
+        """
+        results = [self.compute_batch(cdf.get_batch(start, min(
+            start + batch_size, len(cdf))))
+            for start in range(0, len(cdf), batch_size)]
+        return self.to_timeseries(
+            np.concatenate([np.zeros(0, dtype=self.result_dtype)] +
+                           results))
+
+    def to_timeseries(self, results):
+        """
+        Convert an array of results to a TimeSeries.
+
+        Parameters
+        ----------
+        results : numpy.ndarray
+            With dtype ``result_dtype``.
+
+        Returns
+        -------
+        astropy.timeseries.TimeSeries
+        """
+        from astropy.timeseries import TimeSeries
+
+        ts = TimeSeries(time=datetime64_to_time(results['Time']))
+        ts['n'] = results['n'] * u.cm**-3
+        ts['vx'] = results['vx'] * self.vunit
+        ts['vy'] = results['vy'] * self.vunit
+        ts['vz'] = results['vz'] * self.vunit
+        ts['T_perp'] = results['T_perp'] * u.K
+        ts['T_par'] = results['T_par'] * u.K
+        ts['Fit status'] = results['fit status'].astype(int)
+        ts['Fit status'].info.description = 'Fit status code'
+        ts['Quality flag'] = results['quality flag'].astype(int)
+        ts['Quality flag'].info.description = (
+            'Quality flag of the distribution function')
+        ts.meta['fit status'] = {1: 'Moments calculated.',
+                                 **self.status_info()}
+        return ts
@@ -5,6 +5,16 @@ __all__ = ['PSPProtonCoreFitter']
 
 class PSPProtonCoreFitter(BiMaxFitter):
     """
+    Bi-Maxwellian fitter for the proton core measured by PSP SPAN.
+
+    By default `vdffit.fitting.Triage` rejects distributions with a SPAN
+    quality flag of 2 (peak on the edge of the angular bins) with
+    this fitter, giving them a fit status of ``Triage.QUALITY_STATUS``. See
+    `vdffit.vdf.SPANDistribution.quality_flag` for the meaning of each flag.
     """
+    @property
+    def reject_quality_flags(self):
+        return (2,)
+
     def post_fit_process(self, params):
-        super().post_fit_process(params)
+        return super().post_fit_process(params)
@@ -0,0 +1,21 @@
+from .bimax import BiMaxFitter
+
+__all__ = ['PASProtonCoreFitter']
+
+
+class PASProtonCoreFitter(BiMaxFitter):
+    """
+    Bi-Maxwellian fitter for the proton core measured by Solar Orbiter PAS.
+
+    By default `vdffit.fitting.Triage` rejects distributions with a PAS
+    quality flag of 2 (peak on the edge of the window) or 3 (poor angular
+    coverage of the peak) with this fitter, giving them a fit status of
+    ``Triage.QUALITY_STATUS``. See `vdffit.vdf.PASDistribution.quality_flag`
+    for the meaning of each flag. Distributions with flag 4 have too few
+    points, so are already rejected by the ``'too few points'`` check::
+
+        fitter.fit_cdf(cdf, batch_size=1000, triage=Triage())
+    """
+    @property
+    def reject_quality_flags(self):
+        return (2, 3)
@@ -0,0 +1,132 @@
+"""
+Timers and counters for profiling fits.
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+__all__ = ['FitStats']
+
+
+class FitStats:
+    """
+    Timers and counters collected while fitting distribution functions.
+
+    Pass an instance to ``FitterBase.fit_cdf()`` or
+    ``FitterBase.fit_single()`` to collect statistics. Statistics from
+    every call are added together.
+
+    Stages are timed separately in each job, so when fitting in parallel
+    the stage times are summed over jobs, and can be larger than the
+    ``'total'`` wall clock time. Stages can also be nested; the
+    ``'least squares'`` stage is part of the ``'fit'`` stage.
+
+    Attributes
+    ----------
+    time : collections.Counter
+        Cumulative time spent in each stage, in seconds.
+    calls : collections.Counter
+        Number of times each stage was run.
+    status : collections.Counter
+        Number of distribution functions with each fit status.
+    nspectra : int
+        Number of distribution functions processed.
+    nsolve : int
+        Number of times the optimizer was run.
+    nfev : int
+        Total number of residual function evaluations by the optimizer.
+    njev : int
+        Total number of Jacobian evaluations by the optimizer. This is
+        also the number of optimizer iterations that took a step.
+    """
+    def __init__(self):
+        self.time = Counter()
+        self.calls = Counter()
+        self.status = Counter()
+        self.nspectra = 0
+        self.nsolve = 0
+        self.nfev = 0
+        self.njev = 0
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Context manager that adds the time spent inside it to *stage*.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.time[stage] += time.perf_counter() - start
+            self.calls[stage] += 1
+
+    def add_solve(self, nfev, njev):
+        """
+        Record one or more optimizer runs.
+
+        Parameters
+        ----------
+        nfev, njev : int or numpy.ndarray
+            Number of function and Jacobian evaluations of each run.
+            ``njev`` can be `None` if the optimizer did not report it.
+        """
+        nfev = np.asarray(nfev)
+        self.nsolve += nfev.size
+        self.nfev += int(np.sum(nfev))
+        if njev is not None:
+            self.njev += int(np.sum(njev))
+
+    def add_status(self, status):
+        """
+        Record the fit status of one or more distribution functions.
+        """
+        codes, counts = np.unique(np.atleast_1d(status), return_counts=True)
+        self.status.update({int(c): int(n) for c, n in zip(codes, counts)})
+
+    def merge(self, other):
+        """
+        Add the statistics in *other* to this object.
+
+        Returns
+        -------
+        FitStats
+            This object.
+        """
+        self.time.update(other.time)
+        self.calls.update(other.calls)
+        self.status.update(other.status)
+        self.nspectra += other.nspectra
+        self.nsolve += other.nsolve
+        self.nfev += other.nfev
+        self.njev += other.njev
+        return self
+
+    def to_dict(self):
+        """
+        Statistics as a `dict` of plain Python types, that can be serialized
+        to JSON.
+        """
+        return {'nspectra': self.nspectra,
+                'nsolve': self.nsolve,
+                'nfev': self.nfev,
+                'njev': self.njev,
+                'time': dict(self.time),
+                'calls': dict(self.calls),
+                'status': dict(sorted(self.status.items()))}
+
+    def __repr__(self):
+        times = ', '.join(f'{stage}={t:.3g}s'
+                          for stage, t in self.time.items())
+        return (f'<FitStats nspectra={self.nspectra} nsolve={self.nsolve} '
+                f'nfev={self.nfev} {times}>')
+
+
+def _timer(stats, stage):
+    """
+    ``stats.timer(stage)``, or a no-op if *stats* is `None`.
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.timer(stage)
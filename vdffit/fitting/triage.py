@@ -0,0 +1,138 @@
+"""
+Screening of distribution functions before fitting.
+"""
+from collections import Counter
+
+import numpy as np
+
+__all__ = ['Triage']
+
+
+class Triage:
+    """
+    Screen distribution functions before they are fit.
+
+    Checks are run in bulk on batches of distribution functions read
+    straight from the data file, without calculating velocities or
+    converting to VDF values. Distributions that fail a check are given
+    the fit status of that check, and are never sent to be fit.
+
+    Parameters
+    ----------
+    checks : list[str], optional
+        Names of the fitter's checks to run, from the keys of
+        ``fitter.triage_checks``. Defaults to all of the fitter's checks.
+    reject_quality_flags : list[int], optional
+        Also reject distributions with any of these quality flags. These are
+        given a fit status of ``Triage.QUALITY_STATUS``. Defaults to the
+        fitter's ``reject_quality_flags``.
+    batch_size : int, optional
+        Number of distribution functions to read from the file at once.
+
+    Attributes
+    ----------
+    counts : collections.Counter
+        Number of distribution functions rejected for each reason, summed
+        over every call to ``screen_cdf()``.
+    last_counts : collections.Counter
+        Number of distribution functions rejected for each reason in the
+        last call to ``screen_cdf()``.
+    """
+    #: Fit status given to distributions rejected by their quality flag
+    QUALITY_STATUS = 6
+
+    def __init__(self, checks=None, reject_quality_flags=None,
+                 batch_size=1000):
+        self.checks = checks
+        self.reject_quality_flags = (None if reject_quality_flags is None
+                                     else list(reject_quality_flags))
+        self.batch_size = batch_size
+        self.counts = Counter()
+        self.last_counts = Counter()
+
+    @property
+    def config(self):
+        """
+        Options that affect which distributions are rejected, as a `dict`.
+        """
+        return {'checks': self.checks,
+                'reject_quality_flags': self.reject_quality_flags}
+
+    def _checks(self, fitter):
+        checks = fitter.triage_checks
+        if self.checks is not None:
+            unknown = set(self.checks) - set(checks)
+            if unknown:
+                raise ValueError(f'Unknown checks {sorted(unknown)} for '
+                                 f'{type(fitter).__name__}. Available checks '
+                                 f'are {list(checks)}')
+            checks = {name: checks[name] for name in self.checks}
+        checks = list(checks.items())
+        flags = self.reject_quality_flags
+        if flags is None:
+            flags = list(fitter.reject_quality_flags)
+        if flags:
+            checks.append(('quality flag', (
+                self.QUALITY_STATUS,
+                lambda batch: np.isin(batch.quality_flags, flags))))
+        return checks
+
+    def screen(self, fitter, batch):
+        """
+        Screen a batch of distribution functions.
+
+        Parameters
+        ----------
+        fitter : vdffit.fitting.FitterBase
+        batch : vdffit.vdf.ScreeningBatch
+
+        Returns
+        -------
+        status : numpy.ndarray
+            Fit status for each distribution; 1 if it passed all the checks.
+        counts : collections.Counter
+            Number of distribution functions rejected for each reason. Each
+            distribution is only counted against the first check it fails.
+        """
+        status = np.ones(len(batch), dtype=int)
+        counts = Counter()
+        for reason, (code, check) in self._checks(fitter):
+            rejected = (status == 1) & check(batch)
+            status[rejected] = code
+            counts[reason] += int(np.sum(rejected))
+        return status, counts
+
+    def screen_cdf(self, fitter, cdf):
+        """
+        Screen all the distribution functions in a file.
+
+        Parameters
+        ----------
+        fitter : vdffit.fitting.FitterBase
+        cdf : vdffit.io.VDFCDF
+
+        Returns
+        -------
+        numpy.ndarray
+            Results for every distribution, with dtype
+            ``fitter.result_dtype``. Fit parameters are NaN. Distributions
+            that passed all the checks have a fit status of 1.
+        """
+        results = fitter.empty_results(len(cdf))
+        for name in fitter.fit_param_names:
+            results[name] = np.nan
+        counts = Counter()
+        for start in range(0, len(cdf), self.batch_size):
+            stop = min(start + self.batch_size, len(cdf))
+            batch = cdf.get_screening_batch(start, stop)
+            status, batch_counts = self.screen(fitter, batch)
+            results['fit status'][start:stop] = status
+            results['quality flag'][start:stop] = batch.quality_flags
+            results['Time'][start:stop] = batch.times
+            counts += batch_counts
+
+        for reason, _ in self._checks(fitter):
+            counts.setdefault(reason, 0)
+        self.counts.update(counts)
+        self.last_counts = counts
+        return results
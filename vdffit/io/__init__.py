@@ -1 +1,2 @@
 from .cdf import *
+from .results import *
@@ -1,10 +1,83 @@
 import abc
+import hashlib
+import json
+import threading
 from functools import cached_property
 
 import astropy.units as u
 import cdflib
+import numpy as np
+from astropy.time import Time
 
-__all__ = ['CDFFile']
+from vdffit.util.vector import Vector
+from vdffit.vdf.batch import ScreeningBatch, VDFBatch
+
+__all__ = ['CDFFile', 'MAGCDF', 'LazyVariable']
+
+#: Unit strings used in data files that astropy doesn't understand, mapped to
+#: equivalent strings that it does
+UNIT_ALIASES = {
+    # Can actually ignore steradians apparently...
+    'eV/cm2-s-ster-eV': 'eV/(cm2 s eV)',
+    'Degrees': 'deg',
+    'unitless': '',
+}
+
+
+class LazyVariable:
+    """
+    A lazy view of a variable in a CDF file.
+
+    No data is read until the variable is indexed, and then only the
+    records needed are read from the file. The first index must be an
+    integer or a slice, and indexes records.
+
+    Parameters
+    ----------
+    cdf_file : CDFFile
+    var_str : str
+        Variable name.
+    """
+    def __init__(self, cdf_file, var_str):
+        self.cdf_file = cdf_file
+        self.var_str = var_str
+
+    @cached_property
+    def shape(self):
+        info = self.cdf_file._read('varinq', self.var_str)
+        nrec = info.Last_Rec + 1 if info.Rec_Vary else 1
+        return (nrec,) + tuple(info.Dim_Sizes)
+
+    @cached_property
+    def unit(self):
+        return self.cdf_file.var_unit(self.var_str)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rec_key, rest = key[0], key[1:]
+        if isinstance(rec_key, slice):
+            start, stop, step = rec_key.indices(len(self))
+            if len(range(start, stop, step)) == 0:
+                empty = np.empty((0,) + self.shape[1:])
+                return (empty << self.unit)[(slice(None),) + rest]
+            first, last = sorted([start, start + step *
+                                  (len(range(start, stop, step)) - 1)])
+            var = self.cdf_file.varget(self.var_str, startrec=first,
+                                       endrec=last)
+            var = var.reshape((last - first + 1,) + self.shape[1:])
+            key = (slice(start - first, stop - first if stop >= first
+                         else None, step),) + rest
+        else:
+            rec = range(len(self))[rec_key]
+            var = self.cdf_file.varget(self.var_str, startrec=rec,
+                                       endrec=rec)
+            var = var.reshape((1,) + self.shape[1:])
+            key = (0,) + rest
+        return var[key]
 
 
 class CDFFile(abc.ABC):
@@ -13,6 +86,17 @@ class CDFFile(abc.ABC):
     """
     epoch_var = 'Epoch'
 
+    def __getstate__(self):
+        # Don't pickle the open file, or any data that has been read from
+        # it. These are re-loaded on demand after unpickling.
+        state = self.__dict__.copy()
+        state.pop('_lock', None)
+        for cls in type(self).__mro__:
+            for name, attr in vars(cls).items():
+                if isinstance(attr, cached_property):
+                    state.pop(name, None)
+        return state
+
     @property
     @abc.abstractmethod
     def path(self):
@@ -29,12 +113,23 @@ class CDFFile(abc.ABC):
             raise FileNotFoundError(f'path {self.path} does not exist')
         return cdflib.CDF(self.path)
 
+    def _read(self, method, *args, **kwargs):
+        """
+        Call *method* on the underlying `cdflib.CDF` object.
+
+        The open file can't be read from several threads at once, so reads
+        are serialised with a lock.
+        """
+        lock = self.__dict__.setdefault('_lock', threading.Lock())
+        with lock:
+            return getattr(self.cdf, method)(*args, **kwargs)
+
     @property
     def info(self):
         """
         CDF information.
         """
-        return self.cdf.cdf_info()
+        return self._read('cdf_info')
 
     @property
     def zvars(self):
@@ -43,7 +138,7 @@ class CDFFile(abc.ABC):
         """
         return self.info['zVariables']
 
-    def varget(self, var_str):
+    def varget(self, var_str, startrec=0, endrec=None):
         """
         Get an inidividual variable.
 
@@ -51,26 +146,80 @@ class CDFFile(abc.ABC):
         ----------
         var_str : str
             Variable name.
+        startrec, endrec : int, optional
+            If given, only read records from *startrec* to *endrec*
+            (inclusive).
 
         Returns
         -------
         astropy.units.Quantity
+            A view of the data read from the file, with units attached.
+        """
+        var = self._read('varget', var_str, startrec=startrec,
+                         endrec=endrec)
+        return var << self.var_unit(var_str)
+
+    def lazy_varget(self, var_str):
+        """
+        Get a lazy view of an individual variable, which only reads records
+        from the file when they are indexed.
+
+        Parameters
+        ----------
+        var_str : str
+            Variable name.
+
+        Returns
+        -------
+        LazyVariable
+        """
+        return LazyVariable(self, var_str)
+
+    def _get_records(self, attr, var_str, start, stop):
+        """
+        Get records [start, stop) of a variable.
+
+        If the whole variable has already been loaded into the cached
+        property *attr* it is sliced, otherwise only the records needed are
+        read from the file.
+        """
+        if attr in self.__dict__:
+            return getattr(self, attr)[start:stop]
+        return self.lazy_varget(var_str)[start:stop]
+
+    def _get_record(self, attr, var_str, idx):
+        """
+        Get record *idx* of a variable.
+
+        If the whole variable has already been loaded into the cached
+        property *attr* it is indexed, otherwise only the record needed is
+        read from the file.
+        """
+        idx = range(len(self))[idx]
+        return self._get_records(attr, var_str, idx, idx + 1)[0]
+
+    def var_unit(self, var_str):
+        """
+        Get the unit of an individual variable.
+
+        Parameters
+        ----------
+        var_str : str
+            Variable name.
+
+        Returns
+        -------
+        astropy.units.Unit
         """
-        var = self.cdf.varget(var_str)
         if var_str == 'PHI':
             # PHI is missing any attributes in the alpha data
-            return var * u.Unit('deg')
-        units = self.cdf.varattsget(var_str)['UNITS']
-        if units == 'eV/cm2-s-ster-eV':
-            # Can actually ignore steradians apparently...
-            units = 'eV/(cm2 s eV)'
-        elif units == 'Degrees':
-            units = 'deg'
-        return var * u.Unit(units)
+            return u.Unit('deg')
+        units = self._read('varattsget', var_str)['UNITS']
+        return u.Unit(UNIT_ALIASES.get(units, units))
 
     @cached_property
     def epochs(self):
-        return self.cdf.varget(self.epoch_var)
+        return self._read('varget', self.epoch_var)
 
     @cached_property
     def times(self):
@@ -87,12 +236,420 @@ class CDFFile(abc.ABC):
         return len(self.times)
 
 
+class MAGCDF(CDFFile):
+    """
+    A CDF file containing magnetic field vectors.
+
+    Epochs are assumed to be CDF_TIME_TT2000 values, in nanoseconds.
+    """
+    @property
+    @abc.abstractmethod
+    def all_bvecs(self):
+        """
+        All the magnetic field vectors in the file, shape (n, 3).
+        """
+
+    @cached_property
+    def _sort_order(self):
+        """
+        Indices that sort the epochs, or `None` if they are already sorted.
+        """
+        if np.all(np.diff(self.epochs) >= 0):
+            return None
+        return np.argsort(self.epochs, kind='stable')
+
+    def nearest_indices(self, epochs):
+        """
+        Get the indices of the magnetic field samples nearest to *epochs*.
+
+        This uses a binary search, so takes O(N log M) time for N epochs and
+        M magnetic field samples.
+
+        Parameters
+        ----------
+        epochs : numpy.ndarray
+            Epochs to look up.
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer indices into `all_bvecs`, the same shape as *epochs*.
+        """
+        epochs = np.asarray(epochs)
+        mag_epochs = self.epochs
+        if self._sort_order is not None:
+            mag_epochs = mag_epochs[self._sort_order]
+
+        idx = np.searchsorted(mag_epochs, epochs)
+        idx = np.clip(idx, 1, max(mag_epochs.size - 1, 1))
+        left = np.abs(epochs - mag_epochs[idx - 1])
+        right = np.abs(mag_epochs[np.minimum(idx, mag_epochs.size - 1)] -
+                       epochs)
+        # Take the earlier sample if both are equally close
+        idx = np.where(left <= right, idx - 1, idx)
+
+        if self._sort_order is not None:
+            idx = self._sort_order[idx]
+        return idx
+
+    def get_bvecs(self, epochs, window=None):
+        """
+        Get the magnetic field vectors at many epochs at once.
+
+        Parameters
+        ----------
+        epochs : numpy.ndarray
+            Epochs, shape (n, ).
+        window : astropy.units.Quantity, optional
+            If given, return the average of all magnetic field vectors within
+            a window of this width centred on each epoch, instead of the
+            nearest vector. Can be a scalar, or have shape (n, ). If there are
+            no samples in a window, the nearest vector is returned.
+
+        Returns
+        -------
+        numpy.ndarray
+            Magnetic field vectors, shape (n, 3).
+        """
+        epochs = np.asarray(epochs)
+        nearest = self.all_bvecs[self.nearest_indices(epochs)]
+        if window is None:
+            return nearest
+
+        half_window = np.asarray(window.to_value(u.ns) / 2)
+        order = self._sort_order
+        mag_epochs = self.epochs if order is None else self.epochs[order]
+        bvecs = self.all_bvecs if order is None else self.all_bvecs[order]
+
+        start = np.searchsorted(mag_epochs, epochs - half_window, side='left')
+        end = np.searchsorted(mag_epochs, epochs + half_window, side='right')
+        # Cumulative sums of finite values make each window sum O(1)
+        finite = np.all(np.isfinite(bvecs), axis=1)
+        bsum = np.zeros((bvecs.shape[0] + 1, 3))
+        np.cumsum(np.where(finite[:, None], bvecs, 0), axis=0, out=bsum[1:])
+        count = np.concatenate([[0], np.cumsum(finite)])
+
+        n = count[end] - count[start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (bsum[end] - bsum[start]) / n[:, None]
+        return np.where(n[:, None] > 0, mean, nearest)
+
+    def get_bvec(self, epoch):
+        """
+        Get the magnetic field vector closest to *epoch*.
+        """
+        idx = self.nearest_indices(epoch)
+        return Vector(self.all_bvecs[idx, :])
+
+
 class VDFCDF(CDFFile):
     """
     A CDF file containing velocity distribution functions.
+
+    Sub-classes must set a ``mag_cdf`` attribute with the magnetic field
+    data.
     """
+    #: If set, average the magnetic field over a window of this width
+    #: centred on each distribution function, instead of taking the nearest
+    #: sample.
+    bvec_window = None
+    #: Floating point type of the arrays returned by ``get_batch()``. Set to
+    #: `numpy.float32` to halve the memory used by each batch, and fit
+    #: batches in single precision. Batch fits with
+    #: `vdffit.fitting.BiMaxFitter` in single precision give n, v and T
+    #: within a relative tolerance of 1e-5 of the double precision fits.
+    dtype = np.float64
+
+    @cached_property
+    def bvec_idx(self):
+        """
+        Index of the magnetic field sample closest to each distribution.
+        """
+        return self.mag_cdf.nearest_indices(self.epochs)
+
+    @cached_property
+    def bvecs(self):
+        """
+        Magnetic field vector for each distribution function, shape (n, 3).
+        """
+        if self.bvec_window is None:
+            return self.mag_cdf.all_bvecs[self.bvec_idx]
+        return self.mag_cdf.get_bvecs(self.epochs, window=self.bvec_window)
+
+    def get_bvec(self, idx):
+        """
+        Magnetic field vector for the distribution function at index *idx*.
+
+        Returns
+        -------
+        vdffit.util.Vector
+        """
+        return Vector(self.bvecs[idx])
+
     @abc.abstractmethod
-    def __getitem__(self, i):
+    def get_distribution(self, idx):
+        """
+        Get the distribution function at integer index *idx*. Must return a
+        VDFBase instance.
         """
-        Get the ith distribution funciton. Must return a VDFBase instance.
+
+    def __getitem__(self, idx):
+        """
+        Get distribution functions by index or time.
+
+        Parameters
+        ----------
+        idx : int, time, or slice
+            If an integer, the distribution function at that index. If a
+            time, the distribution function at exactly that time. Times can be
+            `datetime.datetime`, `numpy.datetime64` or `astropy.time.Time`
+            objects. If a slice of integers or times, a list of all the
+            distribution functions in that range (the end time is
+            exclusive).
+
+        Returns
+        -------
+        vdffit.vdf.VDFBase or list[vdffit.vdf.VDFBase]
+        """
+        if isinstance(idx, slice):
+            if isinstance(idx.start, (int, np.integer, type(None))) and \
+                    isinstance(idx.stop, (int, np.integer, type(None))):
+                indices = range(*idx.indices(len(self)))
+            else:
+                indices = range(*self.index_range(idx.start, idx.stop))
+                indices = indices[::idx.step]
+            return [self.get_distribution(i) for i in indices]
+        if not isinstance(idx, (int, np.integer)):
+            idx = self.index(idx)
+        return self.get_distribution(int(idx))
+
+    @cached_property
+    def _times64(self):
+        """
+        Times as a `numpy.datetime64` array.
+        """
+        return np.asarray(self.times, dtype='datetime64[ns]')
+
+    @cached_property
+    def _time_index(self):
+        """
+        Mapping from times (as integer nanoseconds) to index.
+        """
+        return {t: i for i, t in
+                enumerate(self._times64.view(np.int64).tolist())}
+
+    @staticmethod
+    def _to_datetime64(time):
+        if isinstance(time, Time):
+            time = time.utc.datetime64
+        return np.asarray(time, dtype='datetime64[ns]')
+
+    def index(self, time):
+        """
+        Get the index of the distribution function at exactly *time*.
+
+        Parameters
+        ----------
+        time : datetime.datetime, numpy.datetime64, or astropy.time.Time
+
+        Returns
+        -------
+        int
+        """
+        key = int(self._to_datetime64(time).view(np.int64))
+        if key not in self._time_index:
+            raise ValueError(f'{time} not found in timestamps')
+        return self._time_index[key]
+
+    def nearest_index(self, time):
+        """
+        Get the index of the distribution function nearest to *time*.
+
+        Parameters
+        ----------
+        time : datetime.datetime, numpy.datetime64, or astropy.time.Time
+
+        Returns
+        -------
+        int
+        """
+        times = self._times64
+        time = self._to_datetime64(time)
+        idx = int(np.clip(np.searchsorted(times, time), 1, len(times) - 1))
+        if abs(time - times[idx - 1]) <= abs(times[idx] - time):
+            idx -= 1
+        return idx
+
+    def nearest(self, time):
+        """
+        Get the distribution function nearest to *time*.
+
+        Parameters
+        ----------
+        time : datetime.datetime, numpy.datetime64, or astropy.time.Time
+
+        Returns
+        -------
+        vdffit.vdf.VDFBase
+        """
+        return self.get_distribution(self.nearest_index(time))
+
+    def index_range(self, start_time=None, end_time=None):
+        """
+        Range of indices of the distribution functions within a time range.
+
+        Parameters
+        ----------
+        start_time, end_time : datetime.datetime, optional
+            Start (inclusive) and end (exclusive) times. Defaults to the start
+            and end of the file. Can also be `numpy.datetime64` or
+            `astropy.time.Time` objects.
+
+        Returns
+        -------
+        start, stop : int
+        """
+        times = self._times64
+        start = 0
+        stop = len(times)
+        if start_time is not None:
+            start = int(np.searchsorted(
+                times, self._to_datetime64(start_time), side='left'))
+        if end_time is not None:
+            stop = int(np.searchsorted(
+                times, self._to_datetime64(end_time), side='left'))
+        return start, max(start, stop)
+
+    def iter_distributions(self, start_time=None, end_time=None):
+        """
+        Iterate over distribution functions, one at a time.
+
+        Parameters
+        ----------
+        start_time, end_time : datetime.datetime, optional
+            Start (inclusive) and end (exclusive) times. Defaults to the start
+            and end of the file.
+
+        Yields
+        ------
+        vdffit.vdf.VDFBase
+        """
+        start, stop = self.index_range(start_time, end_time)
+        for i in range(start, stop):
+            yield self[i]
+
+    def iter_batches(self, batch_size, start_time=None, end_time=None):
+        """
+        Iterate over batches of distribution functions.
+
+        Each batch is read from the file as it is needed, so only a single
+        batch is held in memory at once.
+
+        Parameters
+        ----------
+        batch_size : int
+            Maximum number of distribution functions in each batch.
+        start_time, end_time : datetime.datetime, optional
+            Start (inclusive) and end (exclusive) times. Defaults to the start
+            and end of the file.
+
+        Yields
+        ------
+        vdffit.vdf.VDFBatch
+        """
+        start, stop = self.index_range(start_time, end_time)
+        for batch_start in range(start, stop, batch_size):
+            yield self.get_batch(batch_start,
+                                 min(batch_start + batch_size, stop))
+
+    def record_hashes(self, batch_size=1000):
+        """
+        Hash of the data in each distribution function.
+
+        See `vdffit.vdf.VDFBatch.record_hashes` for details.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            Number of distribution functions to read at once.
+
+        Returns
+        -------
+        list[str]
+        """
+        return [h for batch in self.iter_batches(batch_size)
+                for h in batch.record_hashes()]
+
+    @property
+    def file_signature(self):
+        """
+        A string that changes whenever ``record_hashes()`` might change.
+
+        This is made from the path, size and modification time of the data
+        file, the magnetic field vectors and ``dtype``, so it can be found
+        without reading the distribution functions. It is `None` if any data
+        variables have been loaded into memory, as they might have been
+        modified.
+        """
+        for cls in type(self).__mro__:
+            if issubclass(VDFCDF, cls):
+                continue
+            for name, attr in vars(cls).items():
+                if isinstance(attr, cached_property) and name in vars(self):
+                    return None
+        stat = self.path.stat()
+        bvec_hash = hashlib.blake2b(
+            np.ascontiguousarray(self.bvecs).tobytes(),
+            digest_size=16).hexdigest()
+        return json.dumps([type(self).__qualname__, str(self.path.resolve()),
+                           stat.st_size, stat.st_mtime_ns,
+                           np.dtype(self.dtype).str, bvec_hash])
+
+    def get_batch(self, start, stop):
+        """
+        Get a batch of distribution functions as arrays.
+
+        Sub-classes can override this to provide a faster implementation
+        than creating each distribution function in turn.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of indices to get.
+
+        Returns
+        -------
+        vdffit.vdf.VDFBatch
+        """
+        return VDFBatch.from_distributions(
+            [self[i] for i in range(start, stop)])
+
+    @staticmethod
+    def _fit_mask(vdf, finite):
+        """
+        Mask of the points to fit, which are the points with a finite
+        velocity and a VDF value within 1% of the peak VDF value.
+        """
+        with np.errstate(invalid='ignore'):
+            peak = np.max(vdf, axis=1, keepdims=True, initial=-np.inf,
+                          where=finite & ~np.isnan(vdf))
+            return finite & (vdf > 0.01 * peak)
+
+    def get_screening_batch(self, start, stop):
+        """
+        Get the data needed to screen a batch of distribution functions
+        before fitting.
+
+        Sub-classes can override this to read only the arrays needed from
+        the file, without calculating velocities.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of indices to get.
+
+        Returns
+        -------
+        vdffit.vdf.ScreeningBatch
         """
+        return ScreeningBatch.from_batch(self.get_batch(start, stop))
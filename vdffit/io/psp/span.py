@@ -1,11 +1,19 @@
 from functools import cached_property
+from pathlib import Path
 
 import astropy.constants as const
+import astropy.units as u
+import numpy as np
 
-from vdffit import data_dir
+from vdffit.config import get_data_dir
 from vdffit.io.cdf import VDFCDF
 from vdffit.io.psp.mag import MAGL2
-from vdffit.vdf import SPANDistribution
+from vdffit.vdf import (
+    ScreeningBatch,
+    SPANDistribution,
+    VDFBatch,
+    spherical_bin_volumes,
+)
 
 __all__ = ['SPANL2CDF']
 
@@ -22,7 +30,7 @@ class SPANL2CDF(VDFCDF):
     index is bin in parameter space. The second index is always length 2048,
     which can be reshaped into (8, 32, 8) to get the (phi, E, theta) bins.
     """
-    def __init__(self, date, species='p'):
+    def __init__(self, date, species='p', data_dir=None):
         """
         Parameters
         ----------
@@ -30,10 +38,14 @@ class SPANL2CDF(VDFCDF):
             Date of file.
         species : str, optional
             Species. Can be 'p' for protons or 'a' for alphas.
+        data_dir : pathlib.Path, optional
+            Directory containing the SPAN and MAG files. Defaults to
+            `vdffit.config.get_data_dir()`.
         """
         self.species = species
         self.date = date
-        self.mag_cdf = MAGL2(date)
+        self.data_dir = get_data_dir() if data_dir is None else Path(data_dir)
+        self.mag_cdf = MAGL2(date, data_dir=self.data_dir)
         # Calling this loads the CDF and checks that the file exists
         self.cdf
 
@@ -42,44 +54,245 @@ class SPANL2CDF(VDFCDF):
         date_str = self.date.strftime('%Y%m%d')
         if self.species == 'p':
             fname = f'psp_swp_spi_sf00_l2_8dx32ex8a_{date_str}_v04.cdf'
-            return data_dir / fname
+            return self.data_dir / fname
         elif self.species == 'a':
             raise NotImplementedError()
 
-    def __getitem__(self, idx):
+    def get_distribution(self, idx):
         """
         Get a single distribtuion function.
 
         Parameters
         ----------
-        idx : int or Time
+        idx : int
 
         Returns
         -------
         SPAN_distribution
         """
-        if not isinstance(idx, int):
-            time = idx
-            if time not in self.times:
-                raise ValueError(f'{time} not found in timestamps')
-            idx = self.times.index(time)
-        else:
-            time = self.times[idx]
+        time = self.times[idx]
 
-        epoch = self.epochs[idx]
+        # Only read the record needed, unless the whole file is loaded
+        eflux, energy, theta, phi = [
+            self._get_record(attr, var_str, idx)
+            for attr, var_str in [('eflux', 'EFLUX'), ('energy', 'ENERGY'),
+                                  ('theta', 'THETA'), ('phi', 'PHI')]]
+        return SPANDistribution(eflux,
+                                energy,
+                                theta,
+                                phi,
+                                self.mass,
+                                time,
+                                self.get_bvec(idx),
+                                self.species)
 
+    @property
+    def mass(self):
+        """
+        Particle mass.
+        """
         if self.species == 'p':
-            mass = const.m_p
+            return const.m_p
         elif self.species == 'a':
-            mass = 4 * const.m_p
-        return SPANDistribution(self.eflux[idx, :],
-                                self.energy[idx, :],
-                                self.theta[idx, :],
-                                self.phi[idx, :],
-                                mass,
-                                time,
-                                self.mag_cdf.get_bvec(epoch),
-                                self.species)
+            return 4 * const.m_p
+
+    @staticmethod
+    def _grid_tables(*tables):
+        """
+        Find the distinct energy/angle tables in a range of records.
+
+        Consecutive records with identical tables share a single table.
+
+        Parameters
+        ----------
+        tables : numpy.ndarray
+            Energy/angle tables, each shape (n, 2048).
+
+        Returns
+        -------
+        table_idx : numpy.ndarray
+            Index of the table used by each record, shape (n, ).
+        first_records : numpy.ndarray
+            Index of the first record using each table.
+        """
+        def same(a):
+            # Compare each row with the previous row, treating NaNs as equal
+            return np.all((a[1:] == a[:-1]) |
+                          (np.isnan(a[1:]) & np.isnan(a[:-1])), axis=1)
+
+        new_table = np.ones(tables[0].shape[0], dtype=bool)
+        for table in tables:
+            new_table[1:] &= same(table)
+        new_table[1:] = ~new_table[1:]
+        table_idx = np.cumsum(new_table) - 1
+        return table_idx, np.nonzero(new_table)[0]
+
+    def velocities_and_vdf(self, start=0, stop=None, volumes=False):
+        """
+        Velocities and VDF values for many distributions at once.
+
+        Unit conversions are done once for the whole file, and velocities are
+        only calculated once for each distinct set of energy/angle tables.
+        Bins with a non-finite theta value are filled with NaN. The returned
+        arrays have type ``self.dtype``.
+
+        If the data have not already been loaded, only the records requested
+        are read from the file.
+
+        Parameters
+        ----------
+        start, stop : int, optional
+            Range of records to get. Defaults to the whole file.
+        volumes : bool, optional
+            If `True`, also return the velocity space volume of each bin.
+
+        Returns
+        -------
+        velocities : numpy.ndarray
+            Spacecraft frame velocities in km/s, shape (n, 2048, 3).
+        vdf : numpy.ndarray
+            VDF values in s**3 / m**6, shape (n, 2048).
+        volumes : numpy.ndarray
+            Bin volumes in (km/s)**3, shape (n, 2048). Only returned if
+            *volumes* is `True`.
+        """
+        if stop is None:
+            stop = len(self)
+        energy, theta, phi, eflux = [
+            self._get_records(attr, var_str, start, stop)
+            for attr, var_str in [('energy', 'ENERGY'), ('theta', 'THETA'),
+                                  ('phi', 'PHI'), ('eflux', 'EFLUX')]]
+        table_idx, first_records = self._grid_tables(
+            energy.value, theta.value, phi.value)
+
+        # Conversion factors, so only plain arrays are used below
+        vunit = VDFBatch.vunit
+        v_factor = np.sqrt((2 * energy.unit / self.mass).to_value(vunit**2))
+        vdf_factor = (eflux.unit / vunit**4).to(VDFBatch.vdfunit)
+
+        energy = energy.value[first_records]
+        theta = theta.to_value(u.rad)[first_records]
+        phi = phi.to_value(u.rad)[first_records]
+        modv = v_factor * np.sqrt(energy)
+
+        # Velocities in the instrument frame
+        vinstr_x = modv * np.cos(theta) * np.cos(phi)
+        vinstr_y = modv * np.cos(theta) * np.sin(phi)
+        vinstr_z = modv * np.sin(theta)
+        # Rotate into the spacecraft frame
+        rot = np.deg2rad(20)
+        velocities = np.stack(
+            [-np.cos(rot) * vinstr_y - np.sin(rot) * vinstr_z,
+             np.sin(rot) * vinstr_y - np.cos(rot) * vinstr_z,
+             vinstr_x], axis=-1)
+        eflux_to_vdf = 2 * vdf_factor / modv**4
+
+        keep = np.isfinite(theta)
+        velocities[~keep] = np.nan
+        eflux_to_vdf[~keep] = np.nan
+
+        # The tables are small, so are calculated in double precision and
+        # only converted to self.dtype before being expanded to every record
+        velocities = velocities.astype(self.dtype, copy=False)
+        eflux_to_vdf = eflux_to_vdf.astype(self.dtype, copy=False)
+        vdf = eflux.value.astype(self.dtype, copy=False)
+        vdf = vdf * eflux_to_vdf[table_idx]
+        if not volumes:
+            return velocities[table_idx], vdf
+
+        shape = (-1,) + SPANDistribution.shape
+        bin_volumes = spherical_bin_volumes(
+            modv.reshape(shape), theta.reshape(shape), phi.reshape(shape),
+            axes=(2, 3, 1)).reshape(modv.shape)
+        bin_volumes = bin_volumes.astype(self.dtype, copy=False)
+        return velocities[table_idx], vdf, bin_volumes[table_idx]
+
+    def get_batch(self, start, stop):
+        """
+        Get a batch of distribution functions as arrays.
+
+        This is equivalent to, but much faster than, creating each
+        `vdffit.vdf.SPANDistribution` in turn.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of indices to get.
+
+        Returns
+        -------
+        vdffit.vdf.VDFBatch
+        """
+        velocities, vdf, volumes = self.velocities_and_vdf(start, stop,
+                                                           volumes=True)
+        finite = np.isfinite(velocities[:, :, 0])
+        quality_flags = SPANDistribution.batch_quality_flags(vdf, finite)
+
+        mask = self._fit_mask(vdf, finite)
+
+        return VDFBatch(self.times[start:stop],
+                        np.where(finite[:, :, None], velocities, 0),
+                        vdf,
+                        mask,
+                        self.bvecs[start:stop],
+                        quality_flags,
+                        np.where(finite, volumes, 0))
+
+    def get_screening_batch(self, start, stop):
+        """
+        Get the data needed to screen a batch of distribution functions
+        before fitting.
+
+        This only reads the energy, angle and flux arrays, and does not
+        calculate velocities.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of indices to get.
+
+        Returns
+        -------
+        vdffit.vdf.ScreeningBatch
+        """
+        energy, theta, phi, eflux = [
+            self._get_records(attr, var_str, start, stop).value
+            for attr, var_str in [('energy', 'ENERGY'), ('theta', 'THETA'),
+                                  ('phi', 'PHI'), ('eflux', 'EFLUX')]]
+        # Bins with a finite velocity, as in velocities_and_vdf()
+        finite = np.isfinite(energy) & np.isfinite(theta) & np.isfinite(phi)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # The VDF is proportional to eflux / energy**2
+            vdf = np.where(np.isfinite(theta), eflux / energy**2, np.nan)
+        vdf = vdf.astype(self.dtype, copy=False)
+        quality_flags = SPANDistribution.batch_quality_flags(vdf, finite)
+        return ScreeningBatch(self.times[start:stop],
+                              vdf,
+                              self._fit_mask(vdf, finite),
+                              finite,
+                              self.bvecs[start:stop],
+                              quality_flags)
+
+    def quality_flags(self, start=0, stop=None):
+        """
+        Quality flags for many distributions at once.
+
+        See `vdffit.vdf.SPANDistribution.quality_flag` for the meaning of
+        each flag.
+
+        Parameters
+        ----------
+        start, stop : int, optional
+            Range of records to get. Defaults to the whole file.
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer quality flags.
+        """
+        velocities, vdf = self.velocities_and_vdf(start, stop)
+        return SPANDistribution.batch_quality_flags(
+            vdf, np.isfinite(velocities[:, :, 0]))
 
     @cached_property
     def eflux(self):
@@ -0,0 +1,461 @@
+"""
+Writing and reading fit results.
+
+Fit results (as returned by ``FitterBase.fit_cdf()`` or
+``FitterBase.iter_fit()``) can be appended batch by batch to Parquet or
+HDF5 files, and read back in part by time range or by a simple predicate on
+any column. Units, column descriptions and table metadata are kept in the
+files.
+
+Parquet and HDF5 support require the optional `pyarrow` and `h5py`
+packages respectively.
+"""
+import abc
+import importlib
+import json
+import operator
+from datetime import datetime, timezone
+
+import astropy.units as u
+import numpy as np
+from astropy.time import Time
+
+from vdffit.util.time import datetime64_to_time, datetime64_to_tt2000
+
+__all__ = ['ParquetWriter', 'HDF5Writer', 'CDFWriter', 'read_parquet',
+           'read_hdf5']
+
+_OPS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt,
+        '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+        'in': np.isin, 'not in': lambda a, b: ~np.isin(a, b)}
+
+
+def _import_optional(module, extra):
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(
+            f'{module.split(".")[0]} is required for this, and can be '
+            f'installed with "pip install vdffit[{extra}]"') from e
+
+
+def _to_datetime64(time):
+    if isinstance(time, Time):
+        time = time.utc.datetime64
+    return np.datetime64(time, 'ns')
+
+
+def _columns(ts):
+    """
+    Split a TimeSeries into plain arrays.
+
+    Returns
+    -------
+    times : numpy.ndarray
+        datetime64[ns] times.
+    data : dict[str, numpy.ndarray]
+    meta : dict[str, dict]
+        Unit and description of each column.
+    """
+    times = np.asarray(ts.time.utc.datetime64, dtype='datetime64[ns]')
+    data = {}
+    meta = {}
+    for name in ts.colnames:
+        if name == 'time':
+            continue
+        col = ts[name]
+        unit = getattr(col, 'unit', None)
+        data[name] = np.asarray(getattr(col, 'value', col))
+        meta[name] = {'unit': None if unit is None else unit.to_string(),
+                      'description': col.info.description}
+    return times, data, meta
+
+
+def _to_timeseries(times, data, meta, table_meta):
+    from astropy.timeseries import TimeSeries
+
+    ts = TimeSeries(time=datetime64_to_time(times))
+    for name, values in data.items():
+        unit = meta.get(name, {}).get('unit')
+        ts[name] = values if unit is None else values * u.Unit(unit)
+        ts[name].info.description = meta.get(name, {}).get('description')
+    ts.meta.update(table_meta)
+    return ts
+
+
+def _table_meta(ts):
+    # Round trip through JSON, so all the keys are strings
+    return json.loads(json.dumps(dict(ts.meta), default=str))
+
+
+class ResultsWriter(abc.ABC):
+    """
+    Base class for writing fit results to a file in batches.
+
+    Writers can be used as context managers, which close the file on exit::
+
+        with ParquetWriter(path) as writer:
+            for results in fitter.iter_fit(cdfs, batch_size=1000):
+                writer.write(results)
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        File to write to. Any existing file is overwritten.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.nrows = 0
+
+    def write(self, ts):
+        """
+        Append a batch of fit results to the file.
+
+        Parameters
+        ----------
+        ts : astropy.timeseries.TimeSeries
+            Fit results. Every batch must have the same columns.
+        """
+        if len(ts):
+            self._write(ts)
+            self.nrows += len(ts)
+
+    @abc.abstractmethod
+    def _write(self, ts):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        """
+        Finish writing the file.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ParquetWriter(ResultsWriter):
+    """
+    Write fit results to a Parquet file.
+
+    Each batch is written as a separate row group, so reading a time range
+    only reads the row groups that overlap with it.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        File to write to.
+    compression : str, optional
+        Compression codec, passed to `pyarrow.parquet.ParquetWriter`.
+    """
+    def __init__(self, path, compression='zstd'):
+        super().__init__(path)
+        self.compression = compression
+        self._writer = None
+
+    def _write(self, ts):
+        pa = _import_optional('pyarrow', 'parquet')
+        pq = _import_optional('pyarrow.parquet', 'parquet')
+        times, data, meta = _columns(ts)
+        fields = [pa.field('time', pa.timestamp('ns'))]
+        for name, values in data.items():
+            fields.append(pa.field(
+                name, pa.from_numpy_dtype(values.dtype),
+                metadata={'vdffit': json.dumps(meta[name])}))
+        schema = pa.schema(fields, metadata={
+            'vdffit': json.dumps(_table_meta(ts))})
+        table = pa.Table.from_arrays(
+            [pa.array(times)] + [pa.array(v) for v in data.values()],
+            schema=schema)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, schema,
+                                            compression=self.compression)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class HDF5Writer(ResultsWriter):
+    """
+    Write fit results to a HDF5 file.
+
+    Each column is stored as a separate chunked and compressed dataset,
+    and times are stored as integer nanoseconds since the Unix epoch. Times
+    must be written in increasing order.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        File to write to.
+    compression : str, optional
+        Compression filter, passed to `h5py.Group.create_dataset`.
+    chunk_size : int, optional
+        Number of rows in each chunk of the datasets.
+    """
+    def __init__(self, path, compression='gzip', chunk_size=4096):
+        super().__init__(path)
+        h5py = _import_optional('h5py', 'hdf5')
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self._file = h5py.File(path, 'w')
+
+    def _write(self, ts):
+        times, data, meta = _columns(ts)
+        times = times.view(np.int64)
+        f = self._file
+        if 'time' not in f:
+            f.attrs['vdffit'] = json.dumps(_table_meta(ts))
+            f.attrs['columns'] = json.dumps(list(data))
+            for name, values in [('time', times), *data.items()]:
+                dset = f.create_dataset(
+                    name, shape=(0,), maxshape=(None,), dtype=values.dtype,
+                    chunks=(self.chunk_size,), compression=self.compression)
+                if name != 'time':
+                    dset.attrs['vdffit'] = json.dumps(meta[name])
+        elif times[0] < f['time'][-1]:
+            raise ValueError('Fit results must be written in time order')
+        if np.any(np.diff(times) < 0):
+            raise ValueError('Fit results must be written in time order')
+
+        n = f['time'].shape[0]
+        for name, values in [('time', times), *data.items()]:
+            dset = f[name]
+            dset.resize((n + values.size,))
+            dset[n:] = values
+
+    def close(self):
+        self._file.close()
+
+
+class CDFWriter(ResultsWriter):
+    """
+    Write fit results to an ISTP compliant CDF file.
+
+    The CDF format does not support appending records, so batches are kept
+    in memory and the whole file is written when the writer is closed.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        File to write to. Must end in ``.cdf``.
+    global_attrs : dict, optional
+        Global attributes. These are added to, and override, a set of default
+        global attributes.
+    """
+    fillval = -1e31
+
+    def __init__(self, path, global_attrs=None):
+        super().__init__(path)
+        self.global_attrs = global_attrs or {}
+        self._batches = []
+
+    def _write(self, ts):
+        self._batches.append(_columns(ts) + (_table_meta(ts),))
+
+    @staticmethod
+    def _var_name(name):
+        return name.replace(' ', '_')
+
+    def close(self):
+        if not self._batches:
+            return
+        from cdflib.cdfwrite import CDF
+
+        times = np.concatenate([b[0] for b in self._batches])
+        data = {name: np.concatenate([b[1][name] for b in self._batches])
+                for name in self._batches[0][1]}
+        meta = self._batches[0][2]
+        table_meta = self._batches[0][3]
+        self._batches = []
+
+        global_attrs = {
+            'Project': 'vdffit',
+            'Discipline': 'Space Physics>Heliospheric Science',
+            'Data_type': 'L3>Level 3 Data',
+            'Descriptor': 'VDFFIT>Velocity distribution function fits',
+            'Data_version': '1',
+            'Generated_by': 'vdffit',
+            'Generation_date': datetime.now(timezone.utc).strftime('%Y%m%d'),
+            'Logical_file_id': self.path.stem,
+            'Logical_source': 'vdffit_fits',
+            'Logical_source_description':
+                'Fits to velocity distribution functions',
+            'PI_name': 'None',
+            'PI_affiliation': 'None',
+            'Source_name': 'None',
+            'Instrument_type': 'Particles (space)',
+            'Mission_group': 'None',
+            'TEXT': json.dumps(table_meta),
+        }
+        global_attrs.update(self.global_attrs)
+
+        cdf = CDF(self.path, delete=True)
+        cdf.write_globalattrs({k: {0: v} for k, v in global_attrs.items()})
+        epochs = datetime64_to_tt2000(times)
+        cdf.write_var(
+            {'Variable': 'Epoch', 'Data_Type': CDF.CDF_TIME_TT2000,
+             'Num_Elements': 1, 'Rec_Vary': True, 'Dim_Sizes': []},
+            var_attrs={'FIELDNAM': 'Epoch',
+                       'CATDESC': 'Time of the distribution function',
+                       'LABLAXIS': 'Epoch',
+                       'UNITS': 'ns',
+                       'VAR_TYPE': 'support_data',
+                       'FILLVAL': [np.iinfo(np.int64).min,
+                                   'CDF_TIME_TT2000'],
+                       'VALIDMIN': [np.min(epochs), 'CDF_TIME_TT2000'],
+                       'VALIDMAX': [np.max(epochs), 'CDF_TIME_TT2000'],
+                       'MONOTON': 'INCREASE',
+                       'SCALETYP': 'linear'},
+            var_data=np.asarray(epochs))
+
+        for name, values in data.items():
+            if np.issubdtype(values.dtype, np.integer):
+                cdf_type = 'CDF_INT4'
+                fillval = np.iinfo(np.int32).min
+                values = values.astype(np.int32)
+            else:
+                cdf_type = 'CDF_DOUBLE'
+                fillval = self.fillval
+                values = np.where(np.isfinite(values), values, fillval)
+            finite = values[values != fillval]
+            var_attrs = {
+                'FIELDNAM': name,
+                'CATDESC': meta[name]['description'] or name,
+                'LABLAXIS': name,
+                'UNITS': meta[name]['unit'] or ' ',
+                'VAR_TYPE': 'data',
+                'DEPEND_0': 'Epoch',
+                'DISPLAY_TYPE': 'time_series',
+                'FILLVAL': [fillval, cdf_type],
+                'VALIDMIN': [np.min(finite, initial=fillval), cdf_type],
+                'VALIDMAX': [np.max(finite, initial=fillval), cdf_type],
+                'SCALETYP': 'linear'}
+            cdf.write_var(
+                {'Variable': self._var_name(name),
+                 'Data_Type': getattr(CDF, cdf_type), 'Num_Elements': 1,
+                 'Rec_Vary': True, 'Dim_Sizes': []},
+                var_attrs=var_attrs, var_data=values)
+        cdf.close()
+
+
+def _time_filters(start_time, end_time):
+    filters = []
+    if start_time is not None:
+        filters.append(('time', '>=', _to_datetime64(start_time)))
+    if end_time is not None:
+        filters.append(('time', '<', _to_datetime64(end_time)))
+    return filters
+
+
+def read_parquet(path, start_time=None, end_time=None, columns=None,
+                 where=None):
+    """
+    Read fit results from Parquet files.
+
+    Only the requested columns, and the row groups that can contain
+    matching rows, are read from disk.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        A single file, or a directory of files written by `ParquetWriter`.
+    start_time, end_time : datetime.datetime, optional
+        Only read results from *start_time* (inclusive) to *end_time*
+        (exclusive). Can also be `numpy.datetime64` or `astropy.time.Time`.
+    columns : list[str], optional
+        Columns to read. Defaults to all columns.
+    where : list[tuple], optional
+        Only read rows that match all of these conditions. Each condition is
+        a tuple of ``(column, op, value)``, where ``op`` is one of ``'=='``,
+        ``'!='``, ``'<'``, ``'<='``, ``'>'``, ``'>='``, ``'in'`` or
+        ``'not in'``. For example ``[('Fit status', '==', 1)]``.
+
+    Returns
+    -------
+    astropy.timeseries.TimeSeries
+    """
+    ds = _import_optional('pyarrow.dataset', 'parquet')
+    pq = _import_optional('pyarrow.parquet', 'parquet')
+    dataset = ds.dataset(path, format='parquet')
+    filters = _time_filters(start_time, end_time) + list(where or [])
+    if columns is not None:
+        columns = ['time'] + [c for c in columns if c != 'time']
+    table = dataset.to_table(
+        columns=columns,
+        filter=pq.filters_to_expression(filters) if filters else None)
+
+    schema = dataset.schema
+    meta = {field.name: json.loads(field.metadata[b'vdffit'])
+            for field in schema if field.name != 'time'}
+    table_meta = json.loads(schema.metadata[b'vdffit'])
+    data = {name: table[name].to_numpy() for name in table.column_names
+            if name != 'time'}
+    times = table['time'].to_numpy().astype('datetime64[ns]')
+    return _to_timeseries(times, data, meta, table_meta)
+
+
+def read_hdf5(path, start_time=None, end_time=None, columns=None,
+              where=None):
+    """
+    Read fit results from a HDF5 file.
+
+    The time range is found with a binary search on the times, and only the
+    requested columns within that range are read from disk.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        File written by `HDF5Writer`.
+    start_time, end_time : datetime.datetime, optional
+        Only read results from *start_time* (inclusive) to *end_time*
+        (exclusive). Can also be `numpy.datetime64` or `astropy.time.Time`.
+    columns : list[str], optional
+        Columns to read. Defaults to all columns.
+    where : list[tuple], optional
+        Only read rows that match all of these conditions. See
+        `read_parquet` for the format.
+
+    Returns
+    -------
+    astropy.timeseries.TimeSeries
+    """
+    h5py = _import_optional('h5py', 'hdf5')
+    with h5py.File(path, 'r') as f:
+        times = f['time']
+        start = 0
+        stop = times.shape[0]
+        # Binary search on the dataset, so only a few chunks are read
+        for _, op, t in _time_filters(start_time, end_time):
+            t = t.astype('datetime64[ns]').view(np.int64)
+            lo, hi = start, stop
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if times[mid] < t:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if op == '>=':
+                start = lo
+            else:
+                stop = max(lo, start)
+
+        names = json.loads(f.attrs['columns']) if columns is None else [
+            c for c in columns if c != 'time']
+        times = f['time'][start:stop].view('datetime64[ns]')
+        keep = np.ones(times.shape, dtype=bool)
+        for col, op, value in where or []:
+            values = times if col == 'time' else f[col][start:stop]
+            if col == 'time':
+                value = _to_datetime64(value)
+            keep &= _OPS[op](values, value)
+
+        data = {name: f[name][start:stop][keep] for name in names}
+        meta = {name: json.loads(f[name].attrs['vdffit']) for name in names}
+        table_meta = json.loads(f.attrs['vdffit'])
+    return _to_timeseries(times[keep], data, meta, table_meta)
@@ -1,38 +1,37 @@
 import glob
 import pathlib
+from functools import cached_property
 
-import numpy as np
-
-from vdffit.io.cdf import CDFFile
-from vdffit.util.vector import Vector
-
-base_dir = pathlib.Path('/Volumes/Work/Data/solo/mag')
+from vdffit.config import get_data_dir
+from vdffit.io.cdf import MAGCDF
 
 __all__ = ['MAGL2']
 
 
-class MAGL2(CDFFile):
-    def __init__(self, date):
+class MAGL2(MAGCDF):
+    def __init__(self, date, data_dir=None):
         self.date = date
+        self.data_dir = (get_data_dir() if data_dir is None
+                         else pathlib.Path(data_dir))
         # Calling this loads the CDF and checks that the file exists
         self.cdf
-        self.mag_rtn = self.cdf.varget('B_RTN')
-        self.times
 
     @property
     def path(self):
         date_str = self.date.strftime('%Y%m%d')
         fname = f'solo_L2_mag-rtn-normal_{date_str}_V*.cdf'
-        fpath = base_dir / fname
+        fpath = self.data_dir / fname
         fpaths = sorted(glob.glob(str(fpath)))
         if len(fpaths):
             return pathlib.Path(fpaths[-1])
 
-        raise FileNotFoundError(f'No MAG data for {self.date} in {base_dir}')
+        raise FileNotFoundError(
+            f'No MAG data for {self.date} in {self.data_dir}')
 
-    def get_bvec(self, epoch):
-        """
-        Get the magnetic field vector closest to *time*.
-        """
-        idx = np.argmin(np.abs(epoch - self.epochs))
-        return Vector(self.mag_rtn[idx, :])
+    @cached_property
+    def all_bvecs(self):
+        return self._read('varget', 'B_RTN')
+
+    @property
+    def mag_rtn(self):
+        return self.all_bvecs
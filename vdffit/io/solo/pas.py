@@ -1,15 +1,12 @@
 import pathlib
 from functools import cached_property
 
-import astropy.units as u
+import numpy as np
 
+from vdffit.config import get_data_dir
 from vdffit.io.cdf import VDFCDF
 from vdffit.io.solo.mag import MAGL2
-from vdffit.vdf import PASDistribution
-
-base_dir = pathlib.Path('/Volumes/Work/Data/solo/swa/pas')
-u.add_enabled_units([u.def_unit('unitless', u.dimensionless_unscaled)])
-
+from vdffit.vdf import PASDistribution, ScreeningBatch, VDFBatch
 
 __all__ = ['PASL2CDF']
 
@@ -20,15 +17,20 @@ class PASL2CDF(VDFCDF):
 
     Each file corresponds to a single day.
     """
-    def __init__(self, date):
+    def __init__(self, date, data_dir=None):
         """
         Parameters
         ----------
         date : astropy.time.Time
             Date of file.
+        data_dir : pathlib.Path, optional
+            Directory containing the PAS and MAG files. Defaults to
+            `vdffit.config.get_data_dir()`.
         """
         self.date = date
-        self.mag_cdf = MAGL2(date)
+        self.data_dir = (get_data_dir() if data_dir is None
+                         else pathlib.Path(data_dir))
+        self.mag_cdf = MAGL2(date, data_dir=self.data_dir)
         # Calling this loads the CDF and checks that the file exists
         self.cdf
 
@@ -43,29 +45,22 @@ class PASL2CDF(VDFCDF):
         """
         date_str = self.date.strftime('%Y%m%d')
         fname = f'solo_L2_swa-pas-vdf_{date_str}_V02.cdf'
-        return base_dir / fname
+        return self.data_dir / fname
 
-    def __getitem__(self, idx):
+    def get_distribution(self, idx):
         """
         Get a single distribtuion function.
 
         Parameters
         ----------
-        idx : int or Time
+        idx : int
 
         Returns
         -------
         PASDistribution
         """
-        if not isinstance(idx, int):
-            time = idx
-            if time not in self.times:
-                raise ValueError(f'{time} not found in timestamps')
-            idx = self.times.index(time)
-        else:
-            time = self.times[idx]
+        time = self.times[idx]
 
-        epoch = self.epochs[idx]
         start_idx = [self.start_azimuth_idx[idx],
                      self.start_elevation_idx[idx],
                      self.start_energy_idx[idx]]
@@ -73,14 +68,233 @@ class PASL2CDF(VDFCDF):
                  self.n_elevation[idx],
                  self.n_energy[idx]]
 
-        return PASDistribution(self.vdf[idx, ...],
+        # Only read the record needed, unless the whole file is loaded.
+        # The energy and angle tables are the same for every record.
+        return PASDistribution(self._get_record('vdf', 'vdf', idx),
                                self.energy,
                                self.theta,
                                self.phi,
                                start_idx,
                                shape,
                                time,
-                               self.mag_cdf.get_bvec(epoch))
+                               self.get_bvec(idx))
+
+    @cached_property
+    def velocity_table(self):
+        """
+        RTN frame velocities of every bin, in units of
+        `vdffit.vdf.VDFBatch.vunit`. See
+        `vdffit.vdf.PASDistribution.velocity_table`.
+
+        Shape (nphi, ntheta, nenergy, 3).
+        """
+        return PASDistribution.velocity_table(
+            self.energy, self.theta, self.phi).to_value(VDFBatch.vunit)
+
+    @cached_property
+    def volume_table(self):
+        """
+        Velocity space volumes of every bin, in units of
+        ``vdffit.vdf.VDFBatch.vunit**3``.
+
+        Shape (nphi, ntheta, nenergy).
+        """
+        return PASDistribution.volume_table(
+            self.energy, self.theta, self.phi).to_value(VDFBatch.vunit**3)
+
+    @property
+    def _window_starts_and_sizes(self):
+        return ([self.start_azimuth_idx, self.start_elevation_idx,
+                 self.start_energy_idx],
+                [self.n_azimuth, self.n_elevation, self.n_energy])
+
+    def _window_shape(self, start, stop):
+        """
+        (nphi, ntheta, nenergy) shape of the largest window of the records
+        in [start, stop).
+        """
+        _, sizes = self._window_starts_and_sizes
+        return tuple(int(np.max(size[start:stop], initial=0))
+                     for size in sizes)
+
+    def _window_indices(self, start, stop):
+        """
+        Indices of the bins in the window of each record in [start, stop).
+
+        Windows are padded to the largest window in the range.
+
+        Returns
+        -------
+        idx : numpy.ndarray
+            Index of each bin in the flattened (phi, theta, energy) bin grid,
+            shape (n, npts).
+        valid : numpy.ndarray
+            `False` for padding, shape (n, npts).
+        """
+        starts, sizes = self._window_starts_and_sizes
+        grid_shape = self.velocity_table.shape[:-1]
+        idx = 0
+        valid = True
+        for axis, (first, size, nbins) in enumerate(
+                zip(starts, sizes, grid_shape)):
+            first, size = first[start:stop, None], size[start:stop, None]
+            offset = np.arange(np.max(size, initial=0))
+            axis_idx = first + offset
+            axis_valid = (offset < size) & (axis_idx < nbins)
+            # Move this axis into place, so the indices broadcast together
+            shape = [-1, 1, 1, 1]
+            shape[axis + 1] = offset.size
+            idx = idx * nbins + np.minimum(axis_idx, nbins - 1).reshape(shape)
+            valid = valid & axis_valid.reshape(shape)
+        n = stop - start
+        return idx.reshape(n, -1), valid.reshape(n, -1)
+
+    def velocities_and_vdf(self, start=0, stop=None, volumes=False):
+        """
+        Velocities and VDF values for many distributions at once.
+
+        Velocities are looked up in `velocity_table`, so the energy and angle
+        tables are only converted to velocities once for the whole file. The
+        window of bins in each distribution is padded to the largest window
+        in the range; padded bins are filled with NaN.
+
+        If the data have not already been loaded, only the records requested
+        are read from the file.
+
+        Parameters
+        ----------
+        start, stop : int, optional
+            Range of records to get. Defaults to the whole file.
+        volumes : bool, optional
+            If `True`, also return the velocity space volume of each bin,
+            looked up in `volume_table`.
+
+        Returns
+        -------
+        velocities : numpy.ndarray
+            RTN frame velocities in km/s, shape (n, npts, 3).
+        vdf : numpy.ndarray
+            VDF values in s**3 / m**6, shape (n, npts).
+        volumes : numpy.ndarray
+            Bin volumes in (km/s)**3, shape (n, npts). Only returned if
+            *volumes* is `True`.
+        """
+        if stop is None:
+            stop = len(self)
+        vdf = self._get_records('vdf', 'vdf', start, stop)
+        factor = vdf.unit.to(VDFBatch.vdfunit)
+        n = vdf.shape[0]
+        idx, valid = self._window_indices(start, start + n)
+
+        vdf = np.take_along_axis(vdf.value.reshape(n, -1), idx, axis=1)
+        vdf = vdf.astype(self.dtype, copy=False)
+        vdf *= factor
+        table = self.velocity_table.astype(self.dtype, copy=False)
+        velocities = np.take(table.reshape(-1, 3), idx, axis=0)
+        if not np.all(valid):
+            vdf[~valid] = np.nan
+            velocities[~valid] = np.nan
+        if not volumes:
+            return velocities, vdf
+
+        table = self.volume_table.astype(self.dtype, copy=False)
+        bin_volumes = np.take(table.ravel(), idx)
+        bin_volumes[~valid] = 0
+        return velocities, vdf, bin_volumes
+
+    def get_batch(self, start, stop):
+        """
+        Get a batch of distribution functions as arrays.
+
+        This is equivalent to, but much faster than, creating each
+        `vdffit.vdf.PASDistribution` in turn. Distributions with smaller
+        windows than the largest window in the batch are padded with masked
+        points.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of indices to get.
+
+        Returns
+        -------
+        vdffit.vdf.VDFBatch
+        """
+        velocities, vdf, volumes = self.velocities_and_vdf(start, stop,
+                                                           volumes=True)
+        finite = np.isfinite(velocities[:, :, 0])
+        quality_flags = PASDistribution.batch_quality_flags(
+            vdf, finite, self._window_shape(start, stop))
+
+        mask = self._fit_mask(vdf, finite)
+
+        velocities[~finite] = 0
+        return VDFBatch(self.times[start:stop],
+                        velocities,
+                        vdf,
+                        mask,
+                        self.bvecs[start:stop],
+                        quality_flags,
+                        volumes)
+
+    def get_screening_batch(self, start, stop):
+        """
+        Get the data needed to screen a batch of distribution functions
+        before fitting.
+
+        This only reads the VDF and window arrays, and does not look up
+        velocities.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of indices to get.
+
+        Returns
+        -------
+        vdffit.vdf.ScreeningBatch
+        """
+        vdf = self._get_records('vdf', 'vdf', start, stop).value
+        n = vdf.shape[0]
+        idx, valid = self._window_indices(start, start + n)
+        vdf = np.take_along_axis(vdf.reshape(n, -1), idx, axis=1)
+        vdf = vdf.astype(self.dtype, copy=False)
+        # Bins with a finite velocity, as in velocities_and_vdf()
+        finite_table = np.all(np.isfinite(self.velocity_table), axis=-1)
+        finite = valid & finite_table.ravel()[idx]
+        vdf[~valid] = np.nan
+        return ScreeningBatch(self.times[start:stop],
+                              vdf,
+                              self._fit_mask(vdf, finite),
+                              finite,
+                              self.bvecs[start:stop],
+                              PASDistribution.batch_quality_flags(
+                                  vdf, finite, self._window_shape(start,
+                                                                  stop)))
+
+    def quality_flags(self, start=0, stop=None):
+        """
+        Quality flags for many distributions at once.
+
+        See `vdffit.vdf.PASDistribution.quality_flag` for the meaning of
+        each flag.
+
+        Parameters
+        ----------
+        start, stop : int, optional
+            Range of records to get. Defaults to the whole file.
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer quality flags.
+        """
+        if stop is None:
+            stop = len(self)
+        velocities, vdf = self.velocities_and_vdf(start, stop)
+        return PASDistribution.batch_quality_flags(
+            vdf, np.isfinite(velocities[:, :, 0]),
+            self._window_shape(start, stop))
 
     @cached_property
     def vdf(self):
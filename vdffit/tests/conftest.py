@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+from vdffit.fitting import BiMaxFitter
+from vdffit.tests.synthetic import write_pas_day, write_span_day
+
+
+@pytest.fixture
+def span_data_dir(tmp_path, monkeypatch):
+    """
+    Point vdffit at an empty data directory.
+    """
+    monkeypatch.setenv('VDFFIT_DATA_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def span_day(span_data_dir):
+    """
+    Write a synthetic day of SPAN data, and point vdffit at it.
+
+    Returns the date of the data and the true fit parameters.
+    """
+    date = datetime(2020, 1, 7)
+    params = write_span_day(span_data_dir, date, ntime=40)
+    return date, params
+
+
+@pytest.fixture
+def pas_day(span_data_dir):
+    """
+    Write a synthetic day of PAS data, and point vdffit at it.
+
+    Returns the date of the data and the true fit parameters.
+    """
+    date = datetime(2020, 1, 7)
+    params = write_pas_day(span_data_dir, date, ntime=20)
+    return date, params
+
+
+@pytest.fixture
+def count_fits(monkeypatch):
+    """
+    Count the number of distribution functions fit in batches by
+    `vdffit.fitting.BiMaxFitter` and its subclasses.
+
+    Returns a list, which has the size of each batch appended to it.
+    """
+    counts = []
+    run_batch_fit = BiMaxFitter.run_batch_fit
+
+    def counting_run_batch_fit(self, vs, *args):
+        counts.append(vs.shape[0])
+        return run_batch_fit(self, vs, *args)
+
+    monkeypatch.setattr(BiMaxFitter, 'run_batch_fit', counting_run_batch_fit)
+    return counts
@@ -0,0 +1,290 @@
+"""
+Synthetic data files, with the same layout as the real data files, filled
+with known bi-Maxwellian distribution functions.
+"""
+from datetime import timedelta
+
+import astropy.constants as const
+import astropy.units as u
+import cdflib
+import numpy as np
+from cdflib.cdfwrite import CDF
+
+from vdffit.fitting import BiMaxFitter
+from vdffit.util import Vector
+from vdffit.vdf import PASDistribution
+
+__all__ = ['span_params', 'write_span_day', 'write_pas_day']
+
+CDF_INT4 = 4
+CDF_DOUBLE = 45
+CDF_TIME_TT2000 = 33
+
+
+def _tt2000(times):
+    unix = (np.asarray(times, dtype='datetime64[ns]') -
+            np.datetime64('1970-01-01')) / np.timedelta64(1, 's')
+    return np.asarray(cdflib.cdfepoch.timestamp_to_tt2000(unix))
+
+
+def _write_var(cdf, name, data, units=None, dtype=CDF_DOUBLE, rec_vary=True):
+    data = np.asarray(data)
+    var_spec = {'Variable': name,
+                'Data_Type': dtype,
+                'Num_Elements': 1,
+                'Rec_Vary': rec_vary,
+                'Dim_Sizes': list(data.shape[1 if rec_vary else 0:])}
+    var_attrs = {} if units is None else {'UNITS': units}
+    cdf.write_var(var_spec, var_attrs=var_attrs, var_data=data)
+
+
+def span_params(ntime, seed=0):
+    """
+    Bi-Maxwellian parameters used for the synthetic SPAN distributions.
+
+    Returns
+    -------
+    params : numpy.ndarray
+        Shape (ntime, 6), in the same order as
+        `vdffit.fitting.BiMaxFitter.fit_param_names`.
+    bvecs : numpy.ndarray
+        Shape (ntime, 3).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, ntime)
+    params = np.column_stack([1e-9 * (1 + 0.2 * np.sin(4 * t)),
+                              -83 + 20 * np.sin(3 * t),
+                              67 + 10 * np.cos(5 * t),
+                              -377 + 20 * np.sin(2 * t),
+                              60 + 5 * np.cos(3 * t),
+                              45 + 5 * np.sin(7 * t)])
+    bvecs = rng.normal(size=(ntime, 3))
+    return params, bvecs
+
+
+def span_grid():
+    """
+    Energy, theta and phi tables for a single synthetic SPAN distribution.
+
+    Each is shape (2048, ), and can be reshaped to the (8, 32, 8) ==
+    (phi, E, theta) bins.
+    """
+    phi = np.linspace(137, 193, 8)
+    energy = np.geomspace(100, 3000, 32)
+    theta = np.linspace(-33, 23, 8)
+    phi, energy, theta = np.meshgrid(phi, energy, theta, indexing='ij')
+    return energy.ravel(), theta.ravel(), phi.ravel()
+
+
+def _span_velocities(energy, theta, phi):
+    # Mirrors vdffit.vdf.SPANDistribution.velocities
+    modv = np.sqrt(2 * energy * u.eV / const.m_p).to_value(u.km / u.s)
+    theta = np.deg2rad(theta)
+    phi = np.deg2rad(phi)
+    vinstr = np.stack([modv * np.cos(theta) * np.cos(phi),
+                       modv * np.cos(theta) * np.sin(phi),
+                       modv * np.sin(theta)], axis=-1)
+    rot = np.deg2rad(20)
+    return modv, np.stack(
+        [-np.cos(rot) * vinstr[..., 1] - np.sin(rot) * vinstr[..., 2],
+         np.sin(rot) * vinstr[..., 1] - np.cos(rot) * vinstr[..., 2],
+         vinstr[..., 0]], axis=-1)
+
+
+def write_span_day(directory, date, ntime, cadence=7, seed=0):
+    """
+    Write a synthetic SPAN-I L2 file and the accompanying MAG L2 file.
+
+    Parameters
+    ----------
+    directory : pathlib.Path
+        Directory to write files to.
+    date : datetime.datetime
+        Date of the files.
+    ntime : int
+        Number of distribution functions in the file.
+    cadence : float, optional
+        Time between distribution functions, in seconds.
+    seed : int, optional
+        Random seed for the magnetic field directions.
+
+    Returns
+    -------
+    params : numpy.ndarray
+        The true bi-Maxwellian parameters, shape (ntime, 6).
+    """
+    params, bvecs = span_params(ntime, seed=seed)
+    times = [date + timedelta(seconds=cadence * i) for i in range(ntime)]
+
+    energy, theta, phi = span_grid()
+    modv, vs = _span_velocities(energy, theta, phi)
+    vdf = np.empty((ntime, energy.size))
+    for i in range(ntime):
+        R = Vector(bvecs[i]).rotation_matrix
+        vs_fa = vs @ R.T
+        vdf[i] = BiMaxFitter.bi_maxwellian_3D(
+            *vs_fa.T, params[i, 0], *(R @ params[i, 1:4]), *params[i, 4:])
+
+    # Convert VDF back to energy flux
+    eflux = (vdf * u.s**3 / u.m**6 * (modv * u.km / u.s)**4 / 2).to_value(
+        1 / (u.cm**2 * u.s))
+
+    date_str = date.strftime('%Y%m%d')
+    span_path = directory / f'psp_swp_spi_sf00_l2_8dx32ex8a_{date_str}_v04.cdf'
+    cdf = CDF(span_path, delete=True)
+    _write_var(cdf, 'Epoch', _tt2000(times), dtype=CDF_TIME_TT2000)
+    _write_var(cdf, 'EFLUX', eflux, units='eV/cm2-s-ster-eV')
+    _write_var(cdf, 'ENERGY', np.tile(energy, (ntime, 1)), units='eV')
+    _write_var(cdf, 'THETA', np.tile(theta, (ntime, 1)), units='Degrees')
+    _write_var(cdf, 'PHI', np.tile(phi, (ntime, 1)))
+    cdf.close()
+
+    # Magnetic field at ~4 samples per second, constant over each
+    # distribution function
+    nmag = 4 * cadence
+    mag_times = [date + timedelta(seconds=(i - 0.5 * nmag) / 4)
+                 for i in range(ntime * nmag)]
+    mag_path = directory / f'psp_fld_l2_mag_sc_4_sa_per_cyc_{date_str}_v02.cdf'
+    cdf = CDF(mag_path, delete=True)
+    _write_var(cdf, 'epoch_mag_SC_4_Sa_per_Cyc', _tt2000(mag_times),
+               dtype=CDF_TIME_TT2000)
+    _write_var(cdf, 'psp_fld_l2_mag_SC_4_Sa_per_Cyc',
+               np.repeat(bvecs, nmag, axis=0), units='nT')
+    cdf.close()
+    return params
+
+
+def pas_grid():
+    """
+    Energy, elevation and azimuth tables for the synthetic PAS files.
+
+    Returns
+    -------
+    energy : numpy.ndarray
+        Shape (96, ), in eV.
+    elevation, azimuth : numpy.ndarray
+        Shape (11, 9), in degrees. The first index is azimuth, and the second
+        elevation.
+    """
+    energy = np.geomspace(20000, 200, 96)
+    azimuth, elevation = np.meshgrid(np.linspace(-24, 39, 11),
+                                     np.linspace(-22.5, 22.5, 9),
+                                     indexing='ij')
+    return energy, elevation, azimuth
+
+
+def _pas_velocities(energy, elevation, azimuth):
+    """
+    RTN frame velocities of the PAS bins, shape (11, 9, 96, 3).
+    """
+    return PASDistribution.velocity_table(
+        energy * u.eV, elevation * u.deg,
+        azimuth * u.deg).to_value(u.km / u.s)
+
+
+def pas_params(ntime, seed=0):
+    """
+    Bi-Maxwellian parameters used for the synthetic PAS distributions.
+
+    Returns
+    -------
+    params : numpy.ndarray
+        Shape (ntime, 6), in the same order as
+        `vdffit.fitting.BiMaxFitter.fit_param_names`.
+    bvecs : numpy.ndarray
+        Shape (ntime, 3).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, ntime)
+    params = np.column_stack([1e-9 * (1 + 0.2 * np.sin(4 * t)),
+                              400 + 20 * np.sin(3 * t),
+                              60 + 10 * np.cos(5 * t),
+                              10 + 10 * np.sin(2 * t),
+                              35 + 5 * np.cos(3 * t),
+                              25 + 5 * np.sin(7 * t)])
+    bvecs = rng.normal(size=(ntime, 3))
+    return params, bvecs
+
+
+def write_pas_day(directory, date, ntime, cadence=4, seed=0):
+    """
+    Write a synthetic PAS L2 VDF file and the accompanying MAG L2 file.
+
+    Each distribution only has data in a window of 48 energy bins, which
+    moves from distribution to distribution.
+
+    Parameters
+    ----------
+    directory : pathlib.Path
+        Directory to write files to.
+    date : datetime.datetime
+        Date of the files.
+    ntime : int
+        Number of distribution functions in the file.
+    cadence : float, optional
+        Time between distribution functions, in seconds.
+    seed : int, optional
+        Random seed for the magnetic field directions.
+
+    Returns
+    -------
+    params : numpy.ndarray
+        The true bi-Maxwellian parameters, shape (ntime, 6).
+    """
+    params, bvecs = pas_params(ntime, seed=seed)
+    times = [date + timedelta(seconds=cadence * i) for i in range(ntime)]
+
+    energy, elevation, azimuth = pas_grid()
+    vs = _pas_velocities(energy, elevation, azimuth)
+    # Energy window, centred on the bulk speed
+    nenergy = 48
+    modv = np.sqrt(2 * energy * u.eV / const.m_p).to_value(u.km / u.s)
+    centre = np.argmin(np.abs(modv[:, np.newaxis] -
+                              np.linalg.norm(params[:, 1:4], axis=1)), axis=0)
+    start_energy = np.clip(centre - nenergy // 2, 0, energy.size - nenergy)
+
+    vdf = np.zeros((ntime,) + vs.shape[:-1])
+    for i in range(ntime):
+        R = Vector(bvecs[i]).rotation_matrix
+        vs_fa = vs @ R.T
+        window = slice(start_energy[i], start_energy[i] + nenergy)
+        vdf[i, :, :, window] = BiMaxFitter.bi_maxwellian_3D(
+            *np.moveaxis(vs_fa[:, :, window], -1, 0), params[i, 0],
+            *(R @ params[i, 1:4]), *params[i, 4:])
+    # Convert from s^3/m^6 to s^3/cm^6
+    vdf = vdf * 1e-12
+
+    date_str = date.strftime('%Y%m%d')
+    pas_path = directory / f'solo_L2_swa-pas-vdf_{date_str}_V02.cdf'
+    cdf = CDF(pas_path, delete=True)
+    _write_var(cdf, 'Epoch', _tt2000(times), dtype=CDF_TIME_TT2000)
+    _write_var(cdf, 'vdf', vdf, units='s^3/cm^6')
+    _write_var(cdf, 'Energy', energy, units='eV', rec_vary=False)
+    angles = np.stack([elevation - 2.5, elevation, elevation + 2.5], axis=-1)
+    _write_var(cdf, 'Full_elevation', angles, units='Degrees',
+               rec_vary=False)
+    angles = np.stack([azimuth - 3, azimuth, azimuth + 3], axis=-1)
+    _write_var(cdf, 'Full_azimuth', angles, units='Degrees', rec_vary=False)
+    _write_var(cdf, 'Elevation_correction', np.zeros(energy.size),
+               units='Degrees', rec_vary=False)
+    for name, value in [('start_energy', start_energy),
+                        ('nb_energy', nenergy),
+                        ('start_elevation', 0),
+                        ('nb_elevation', elevation.shape[1]),
+                        ('start_CEM', 0),
+                        ('nb_CEM', azimuth.shape[0])]:
+        _write_var(cdf, name, np.broadcast_to(value, (ntime,)),
+                   units='unitless', dtype=CDF_INT4)
+    cdf.close()
+
+    # Magnetic field at 8 samples per second, constant over each
+    # distribution function
+    nmag = 8 * cadence
+    mag_times = [date + timedelta(seconds=(i - 0.5 * nmag) / 8)
+                 for i in range(ntime * nmag)]
+    mag_path = directory / f'solo_L2_mag-rtn-normal_{date_str}_V01.cdf'
+    cdf = CDF(mag_path, delete=True)
+    _write_var(cdf, 'Epoch', _tt2000(mag_times), dtype=CDF_TIME_TT2000)
+    _write_var(cdf, 'B_RTN', np.repeat(bvecs, nmag, axis=0), units='nT')
+    cdf.close()
+    return params
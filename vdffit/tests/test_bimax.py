@@ -0,0 +1,295 @@
+import astropy.units as u
+import numpy as np
+import pytest
+
+from vdffit.fitting import BiMaxFitter, BiMaxLogFitter, FitStats, FitterBase
+from vdffit.util import Vector, VectorArray
+
+
+def synthetic_vdfs(n, npts=400, seed=0):
+    """
+    Create *n* bi-Maxwellian distributions with random parameters.
+
+    Returns
+    -------
+    vs, vdf, mask, bvecs, params
+    """
+    rng = np.random.default_rng(seed)
+    vs = rng.uniform(-150, 150, (n, npts, 3)) + np.array([400, 0, 0])
+    bvecs = rng.normal(size=(n, 3))
+    params = np.column_stack([rng.uniform(1e-10, 1e-9, n),
+                              rng.uniform(380, 420, n),
+                              rng.uniform(-20, 20, n),
+                              rng.uniform(-20, 20, n),
+                              rng.uniform(40, 60, n),
+                              rng.uniform(40, 60, n)])
+    vdf = np.empty((n, npts))
+    for i in range(n):
+        R = Vector(bvecs[i]).rotation_matrix
+        vs_fa = vs[i] @ R.T
+        vdf[i] = BiMaxFitter.bi_maxwellian_3D(
+            *vs_fa.T, params[i, 0], *(R @ params[i, 1:4]), *params[i, 4:])
+    mask = vdf > 0.01 * np.max(vdf, axis=1, keepdims=True)
+    return vs, vdf, mask, bvecs, params
+
+
+def abs_vth(params):
+    # Thermal speeds are only defined up to a sign
+    params = params.copy()
+    params[:, 4:] = np.abs(params[:, 4:])
+    return params
+
+
+def test_batch_fit_matches_single():
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(20)
+    fitter = BiMaxFitter()
+    status, batch_params = fitter.run_batch_fit(vs, vdf, mask, bvecs)
+    assert np.all(status == 1)
+    np.testing.assert_allclose(abs_vth(batch_params), params, rtol=1e-5,
+                               atol=1e-6)
+
+    # Compare to fitting each distribution individually
+    single_status, single_params = FitterBase.run_batch_fit(
+        fitter, vs, vdf, mask, bvecs)
+    np.testing.assert_equal(status, single_status)
+    np.testing.assert_allclose(abs_vth(batch_params),
+                               abs_vth(single_params), rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('npts, expected_status', [(11, 2), (12, 1)])
+def test_batch_fit_too_few_points(npts, expected_status):
+    vs, vdf, mask, bvecs, _ = synthetic_vdfs(1)
+    # Keep the npts highest points
+    mask[:] = False
+    mask[0, np.argsort(vdf[0])[-npts:]] = True
+    status, params = BiMaxFitter().run_batch_fit(vs, vdf, mask, bvecs)
+    assert status[0] == expected_status
+    assert np.all(np.isfinite(params)) == (expected_status == 1)
+
+
+def test_bi_maxwellian_jac():
+    rng = np.random.default_rng(1)
+    vs = rng.uniform(-100, 100, (50, 3))
+    params = np.array([2., 10, -5, 3, 40, 55])
+    jac = BiMaxFitter.bi_maxwellian_3D_jac(*vs.T, *params)
+    assert jac.shape == (50, 6)
+    for i in range(6):
+        h = np.zeros(6)
+        h[i] = 1e-6 * max(abs(params[i]), 1)
+        numerical = (BiMaxFitter.bi_maxwellian_3D(*vs.T, *(params + h)) -
+                     BiMaxFitter.bi_maxwellian_3D(*vs.T, *(params - h))) / (
+                         2 * h[i])
+        np.testing.assert_allclose(jac[:, i], numerical, rtol=1e-6,
+                                   atol=1e-12)
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_analytic_jac_matches_finite_difference(batch):
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(10)
+    run = BiMaxFitter.run_batch_fit if batch else FitterBase.run_batch_fit
+    status, analytic = run(BiMaxFitter(jac='analytic'), vs, vdf, mask, bvecs)
+    status_fd, fd = run(BiMaxFitter(jac='2-point'), vs, vdf, mask, bvecs)
+    np.testing.assert_equal(status, status_fd)
+    np.testing.assert_allclose(abs_vth(analytic), abs_vth(fd), rtol=1e-5,
+                               atol=1e-6)
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_jac_reuses_exp(batch, monkeypatch):
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(5)
+    jac = BiMaxFitter.bi_maxwellian_3D_jac
+    reused = []
+
+    def recording_jac(*args, exp=None):
+        reused.append(exp is not None)
+        return jac(*args, exp=exp)
+
+    monkeypatch.setattr(BiMaxFitter, 'bi_maxwellian_3D_jac',
+                        staticmethod(recording_jac))
+    run = BiMaxFitter.run_batch_fit if batch else FitterBase.run_batch_fit
+    status, fit_params = run(BiMaxFitter(), vs, vdf, mask, bvecs)
+    assert np.all(status == 1)
+    # The exponential term from the last residual evaluation is always used
+    assert len(reused) > 0 and all(reused)
+
+
+def test_invalid_jac():
+    with pytest.raises(ValueError, match="jac must be"):
+        BiMaxFitter(jac='3-point')
+
+
+def test_invalid_solver():
+    with pytest.raises(ValueError, match="solver must be"):
+        BiMaxFitter(solver='newton')
+
+
+def test_param_names():
+    vs, _, mask, bvecs, params = synthetic_vdfs(1)
+    # Parallel thermal speed half the perpendicular thermal speed
+    params[0, 4:] = [30, 60]
+    R = Vector(bvecs[0]).rotation_matrix
+    vdf = BiMaxFitter.bi_maxwellian_3D(
+        *(vs[0] @ R.T).T, params[0, 0], *(R @ params[0, 1:4]), 30, 60)
+    mask[:] = vdf > 0.01 * np.max(vdf)
+    fitter = BiMaxFitter()
+    status, fit_params = fitter.run_batch_fit(vs, vdf[np.newaxis], mask,
+                                              bvecs)
+    fit_params = dict(zip(fitter.fit_param_names, abs_vth(fit_params)[0]))
+    assert fit_params['vth_par'] == pytest.approx(30)
+    assert fit_params['vth_perp'] == pytest.approx(60)
+
+
+def test_param_order():
+    # Regression test: parameter 4 is the thermal speed along B, which is
+    # the vth_z argument of bi_maxwellian_3D(vx, vy, vz, ..., vth_z, vth_perp)
+    fitter = BiMaxFitter()
+    assert fitter.fit_param_names[4:] == ['vth_par', 'vth_perp']
+    values = [1, 0, 0, 0, 30, 60]
+    params = dict(zip(fitter.fit_param_names, values))
+    # One thermal speed along z (parallel to B) drops the VDF by 1/e
+    f = BiMaxFitter.bi_maxwellian_3D(0, 0, params['vth_par'], *values)
+    assert f == pytest.approx(np.exp(-1))
+    f = BiMaxFitter.bi_maxwellian_3D(params['vth_perp'], 0, 0, *values)
+    assert f == pytest.approx(np.exp(-1))
+
+    results = fitter.empty_results(1)
+    for name, value in params.items():
+        results[name] = value
+    ts = fitter.post_fit_process(results)
+    assert ts['T_par'][0] == BiMaxFitter.v_to_T(30 * u.km / u.s)
+    assert ts['T_perp'][0] == BiMaxFitter.v_to_T(60 * u.km / u.s)
+
+
+def test_log_fit_batch():
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(3)
+    bvecs = VectorArray(bvecs)
+    vs = bvecs.rotate_into(vs)
+    # No points, and a VDF that has a minimum instead of a maximum
+    vdf[1] = 0
+    vdf[2] = 1 / vdf[2]
+    log_params = BiMaxFitter.log_fit_batch(vs, vdf, mask)
+    log_params[:, 1:4] = bvecs.rotate_out_of(log_params[:, 1:4])
+    np.testing.assert_allclose(log_params[0], params[0], rtol=1e-10)
+    assert np.all(np.isnan(log_params[1:]))
+
+
+def test_log_initial_guess():
+    assert BiMaxFitter().initial_guess == 'peak'
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(20)
+    for initial_guess, max_iterations in [('peak', 20), ('log', 1)]:
+        fitter = BiMaxFitter(initial_guess=initial_guess)
+        stats = FitStats()
+        status, fit_params = fitter.run_batch_fit(vs, vdf, mask, bvecs,
+                                                  stats=stats)
+        np.testing.assert_equal(status, 1)
+        np.testing.assert_allclose(abs_vth(fit_params), params, rtol=1e-5)
+        assert stats.njev <= max_iterations * stats.nsolve
+
+    with pytest.raises(ValueError, match='initial_guess must be'):
+        BiMaxFitter(initial_guess='moments')
+
+
+def test_log_fitter():
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(5)
+    fitter = BiMaxLogFitter()
+    status, fit_params = fitter.run_batch_fit(vs, vdf, mask, bvecs)
+    np.testing.assert_equal(status, 1)
+    np.testing.assert_allclose(fit_params, params, rtol=1e-10)
+
+    single_status, single_params = FitterBase.run_batch_fit(
+        fitter, vs, vdf, mask, bvecs)
+    np.testing.assert_equal(single_status, 1)
+    np.testing.assert_allclose(single_params, params, rtol=1e-10)
+
+    assert fitter.config == {
+        'jac': 'analytic', 'max_warm_resid': 0.1, 'initial_guess': 'log',
+        'solver': 'default',
+        'solver_options': BiMaxFitter.solver_profiles['default']}
+
+
+@pytest.mark.parametrize('fitter', [BiMaxFitter(), BiMaxLogFitter()])
+def test_nonfinite_status(fitter):
+    vs, vdf, mask, bvecs, _ = synthetic_vdfs(4)
+    bvecs[0] = np.nan
+    vs[1, np.argmax(vdf[1])] = np.nan
+    bvecs[2] = 0
+    for run_batch_fit in [type(fitter).run_batch_fit,
+                          FitterBase.run_batch_fit]:
+        status, fit_params = run_batch_fit(fitter, vs, vdf, mask, bvecs)
+        np.testing.assert_equal(status, [3, 3, 3, 1])
+        assert np.all(np.isnan(fit_params[:3]))
+
+
+@pytest.mark.parametrize('solver', list(BiMaxFitter.solver_profiles))
+def test_solver_profiles(solver):
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(10)
+    fitter = BiMaxFitter(solver=solver)
+    status, batch_params = fitter.run_batch_fit(vs, vdf, mask, bvecs)
+    single_status, single_params = FitterBase.run_batch_fit(
+        fitter, vs, vdf, mask, bvecs)
+    np.testing.assert_equal(status, 1)
+    np.testing.assert_equal(single_status, 1)
+    for fit_params in [batch_params, single_params]:
+        np.testing.assert_allclose(abs_vth(fit_params), params, rtol=1e-4)
+    if fitter.solver_profiles[solver]['bounded']:
+        assert np.all(single_params[:, 4:] > 0)
+        assert np.all(batch_params[:, 4:] > 0)
+
+
+def test_bounded_solver_rejects_flat():
+    # Noise with no peak is fit by thermal speeds on their upper bound
+    vs, _, mask, bvecs, _ = synthetic_vdfs(10)
+    vdf = np.random.default_rng(1).uniform(0.5, 1, mask.shape)
+    mask[:] = True
+    fitter = BiMaxFitter(solver='bounded')
+    status, _ = fitter.run_batch_fit(vs, vdf, mask, bvecs)
+    single_status, _ = FitterBase.run_batch_fit(fitter, vs, vdf, mask, bvecs)
+    assert np.all(status > 1)
+    assert np.all(single_status > 1)
+
+
+@pytest.mark.parametrize('bvec', [[0, 0, 2], [0, 0, -2]])
+def test_batch_fit_b_along_z(bvec):
+    vs, vdf, mask, _, params = synthetic_vdfs(2)
+    bvecs = np.array([bvec, [1, 2, 3]], dtype=float)
+    # Re-create the distributions with the new field directions
+    for i in range(2):
+        R = Vector(bvecs[i]).rotation_matrix
+        vs_fa = vs[i] @ R.T
+        vdf[i] = BiMaxFitter.bi_maxwellian_3D(
+            *vs_fa.T, params[i, 0], *(R @ params[i, 1:4]), *params[i, 4:])
+    status, fit_params = BiMaxFitter().run_batch_fit(vs, vdf, mask, bvecs)
+    np.testing.assert_equal(status, 1)
+    np.testing.assert_allclose(abs_vth(fit_params), params, rtol=1e-5)
+
+
+@pytest.mark.parametrize('offset', [0.01, 10])
+def test_single_fit_guess(offset):
+    vs, vdf, mask, bvecs, params = synthetic_vdfs(1)
+    vs, vdf, bvec = vs[0, mask[0]], vdf[0, mask[0]], Vector(bvecs[0])
+    # A good guess, and one so far off the fit has to fall back to the
+    # default initial guesses
+    guess = params[0].copy()
+    guess[1:4] += offset * 100
+    fitter = BiMaxFitter()
+    status, fit_params = fitter.run_single_fit(vs, vdf, bvec, guess=guess)
+    assert status == 1
+    np.testing.assert_allclose(abs_vth(fit_params[np.newaxis]), params,
+                               rtol=1e-5)
+
+
+def test_post_fit_process_list():
+    fitter = BiMaxFitter()
+    results = fitter.empty_results(3)
+    for name in fitter.fit_param_names:
+        results[name] = np.arange(1, 4)
+    results['fit status'] = 1
+    results['Time'] = np.datetime64('2020-01-01') + np.arange(3)
+    # A list of dicts gives the same results as a structured array
+    dicts = [{name: r[name] for name in results.dtype.names}
+             for r in results]
+    ts = fitter.post_fit_process(results)
+    ts_list = fitter.post_fit_process(dicts)
+    assert np.all(ts['time'] == ts_list['time'])
+    for col in ts.colnames[1:]:
+        np.testing.assert_equal(ts[col], ts_list[col])
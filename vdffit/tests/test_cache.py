@@ -0,0 +1,120 @@
+import numpy as np
+
+from vdffit.fitting import BiMaxFitter, FitCache
+from vdffit.io.psp import SPANL2CDF
+
+
+def test_fit_cache(span_day, tmp_path, count_fits):
+    date, _ = span_day
+    cache = FitCache(tmp_path / 'cache.sqlite')
+    cdf = SPANL2CDF(date)
+    result = BiMaxFitter().fit_cdf(cdf, batch_size=16, cache=cache)
+    assert sum(count_fits) == len(cdf) == len(cache)
+
+    # Everything is cached
+    count_fits.clear()
+    cached = BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=16,
+                                   cache=cache)
+    assert sum(count_fits) == 0
+    assert np.all(cached['time'] == result['time'])
+    for col in result.colnames[1:]:
+        np.testing.assert_equal(cached[col], result[col])
+
+    # Changing some records only re-fits those records
+    cdf = SPANL2CDF(date)
+    eflux = cdf.eflux.copy()
+    eflux[[3, 20, 21]] *= 1.1
+    cdf.eflux = eflux
+    BiMaxFitter().fit_cdf(cdf, batch_size=16, cache=cache)
+    assert sum(count_fits) == 3
+
+    # Changing the fitter options re-fits everything
+    count_fits.clear()
+    BiMaxFitter(max_warm_resid=0.2).fit_cdf(SPANL2CDF(date), batch_size=16,
+                                            cache=cache)
+    assert sum(count_fits) == len(cdf)
+
+
+def test_fit_cache_file_index(span_day, tmp_path, monkeypatch):
+    date, _ = span_day
+    cache = FitCache(tmp_path / 'cache.sqlite')
+    result = BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=16,
+                                   cache=cache)
+
+    # An unchanged file isn't read to find its record hashes
+    def record_hashes(self):
+        raise AssertionError('Record hashes calculated')
+
+    with monkeypatch.context() as m:
+        m.setattr(SPANL2CDF, 'record_hashes', record_hashes)
+        m.setattr(SPANL2CDF, 'get_batch', record_hashes)
+        cached = BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=16,
+                                       cache=cache)
+    for col in result.colnames[1:]:
+        np.testing.assert_equal(cached[col], result[col])
+
+    # A modified file is read again
+    cdf = SPANL2CDF(date)
+    signature = cdf.file_signature
+    cdf.path.touch()
+    assert SPANL2CDF(date).file_signature != signature
+    assert cache.get_record_hashes(signature) == cdf.record_hashes()
+    # Data that has been loaded into memory might have been modified
+    cdf.eflux
+    assert cdf.file_signature is None
+
+
+def test_fit_cache_solver_profiles(span_day, tmp_path, count_fits,
+                                   monkeypatch):
+    date, _ = span_day
+    cache = FitCache(tmp_path / 'cache.sqlite')
+    BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=16, cache=cache)
+    count_fits.clear()
+    # Changing the settings of a solver profile re-fits everything
+    monkeypatch.setitem(BiMaxFitter.solver_profiles, 'default',
+                        {**BiMaxFitter.solver_profiles['default'],
+                         'ftol': 1e-8})
+    BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=16, cache=cache)
+    assert sum(count_fits) == len(SPANL2CDF(date))
+
+
+def test_fit_cache_options(span_day, tmp_path):
+    date, _ = span_day
+    cache = FitCache(tmp_path / 'cache.sqlite')
+    n = len(SPANL2CDF(date))
+    BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=16, cache=cache)
+    assert len(cache) == n
+    # The size of batches doesn't change the results
+    BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=8, cache=cache)
+    assert len(cache) == n
+    # Single fits and warm started fits don't use the batched results
+    BiMaxFitter().fit_cdf(SPANL2CDF(date), cache=cache)
+    assert len(cache) == 2 * n
+    BiMaxFitter().fit_cdf(SPANL2CDF(date), warm_start=True, cache=cache)
+    assert len(cache) == 3 * n
+    BiMaxFitter().fit_cdf(SPANL2CDF(date), warm_start=True, cache=cache)
+    assert len(cache) == 3 * n
+
+
+def test_fit_cache_eviction(tmp_path):
+    cache = FitCache(tmp_path / 'cache.sqlite')
+    fitter = BiMaxFitter()
+    # Results that all take up the same space
+    params = fitter.empty_results(20)
+    params['A'] = 1
+    params['fit status'] = 1
+    params['Time'] = np.datetime64(10**9, 's') + np.arange(20)
+    records = [str(i) for i in range(20)]
+    cache.put(fitter, records[:10], params[:10])
+    assert len(cache) == 10
+    # Room for 16 results
+    cache.max_size = cache.size * 1.6
+    # Use the first records, so they are more recently used
+    assert len(cache.get(fitter, records[:5])) == 5
+    cache.put(fitter, records[10:], params[10:])
+    assert len(cache) == 16
+    found = cache.get(fitter, records)
+    assert set(found) >= set(records[:5] + records[10:])
+    found_params = fitter.empty_results(1)
+    found_params[0] = found['3']
+    assert found_params[0] == params[3]
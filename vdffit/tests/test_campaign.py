@@ -0,0 +1,100 @@
+import json
+from datetime import datetime
+
+import cdflib
+import numpy as np
+import pytest
+from astropy.timeseries import TimeSeries
+
+from vdffit.campaign import main, run_campaign
+from vdffit.fitting import BiMaxFitter, Triage
+from vdffit.io import read_parquet
+from vdffit.io.psp import SPANL2CDF
+from vdffit.tests.synthetic import write_span_day
+
+
+def test_campaign(span_data_dir, tmp_path, monkeypatch):
+    # Data for the 1st and 3rd, but not the 2nd
+    for day in [1, 3]:
+        write_span_day(span_data_dir, datetime(2020, 1, day), ntime=10)
+    output_dir = tmp_path / 'output'
+
+    manifest = run_campaign(SPANL2CDF, datetime(2020, 1, 1),
+                            datetime(2020, 1, 4), output_dir,
+                            batch_size=5)
+    with open(output_dir / 'manifest.json') as f:
+        days = json.load(f)['days']
+    assert days == manifest.days
+    assert [days[d]['status'] for d in sorted(days)] == [
+        'done', 'missing', 'done']
+
+    result = TimeSeries.read(output_dir / 'SPANL2CDF_20200101.ecsv',
+                             format='ascii.ecsv')
+    assert len(result) == 10
+    np.testing.assert_equal(result['Fit status'], 1)
+
+    # Re-running should only try to fit the missing day
+    fitted = []
+
+    def fit_cdf(self, cdf, **kwargs):
+        fitted.append(cdf.date)
+        raise RuntimeError('Should not be fitting this day')
+
+    monkeypatch.setattr(BiMaxFitter, 'fit_cdf', fit_cdf)
+    write_span_day(span_data_dir, datetime(2020, 1, 2), ntime=10)
+    manifest = run_campaign(SPANL2CDF, datetime(2020, 1, 1),
+                            datetime(2020, 1, 4), output_dir,
+                            batch_size=5, n_jobs=2)
+    assert fitted == [datetime(2020, 1, 2)]
+    assert manifest.days['2020-01-02']['status'] == 'failed'
+    assert manifest.days['2020-01-01']['status'] == 'done'
+
+
+def test_campaign_settings_changed(span_data_dir, tmp_path):
+    write_span_day(span_data_dir, datetime(2020, 1, 1), ntime=5)
+    output_dir = tmp_path / 'output'
+    args = SPANL2CDF, datetime(2020, 1, 1), datetime(2020, 1, 2), output_dir
+    run_campaign(*args, batch_size=5, triage=Triage())
+    with open(output_dir / 'manifest.json') as f:
+        data = json.load(f)
+    assert data['fitter_config'] == BiMaxFitter().config
+    assert data['fit_options'] == {
+        'batch_size': 5,
+        'triage': {'class': 'Triage',
+                   'config': {'checks': None,
+                              'reject_quality_flags': None}}}
+
+    # Resuming with the same settings works
+    run_campaign(*args, batch_size=5, triage=Triage(), verbose=1)
+    for kwargs in [{'fitter': BiMaxFitter(solver='fast')},
+                   {'batch_size': None},
+                   {'triage': Triage(reject_quality_flags=[2])}]:
+        kwargs = {'batch_size': 5, 'triage': Triage(), **kwargs}
+        with pytest.raises(ValueError, match='Manifest at .* is for'):
+            run_campaign(*args, **kwargs)
+
+
+def test_campaign_cli(span_data_dir, tmp_path, capsys):
+    write_span_day(span_data_dir, datetime(2020, 1, 1), ntime=5)
+    main(['span', '2020-01-01', '2020-01-03', str(tmp_path / 'output')])
+    assert capsys.readouterr().out == 'done: 1 days\nmissing: 1 days\n'
+
+
+def test_campaign_parquet(span_data_dir, tmp_path):
+    write_span_day(span_data_dir, datetime(2020, 1, 1), ntime=5)
+    output_dir = tmp_path / 'output'
+    main(['span', '2020-01-01', '2020-01-02', str(output_dir),
+          '--format', 'parquet'])
+    assert sorted(p.name for p in output_dir.iterdir()) == [
+        'SPANL2CDF_20200101.parquet', 'manifest.json']
+    result = read_parquet(output_dir / 'SPANL2CDF_20200101.parquet')
+    assert len(result) == 5
+
+
+def test_campaign_cdf(span_data_dir, tmp_path):
+    write_span_day(span_data_dir, datetime(2020, 1, 1), ntime=5)
+    output_dir = tmp_path / 'output'
+    main(['span', '2020-01-01', '2020-01-02', str(output_dir),
+          '--format', 'cdf'])
+    cdf = cdflib.CDF(output_dir / 'SPANL2CDF_20200101.cdf')
+    assert cdf.globalattsget()['Logical_file_id'] == ['SPANL2CDF_20200101']
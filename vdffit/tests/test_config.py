@@ -0,0 +1,38 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import vdffit
+from vdffit.config import get_data_dir, set_data_dir
+
+
+def test_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('VDFFIT_DATA_DIR', str(tmp_path / 'env'))
+    assert get_data_dir() == tmp_path / 'env'
+    assert vdffit.data_dir == tmp_path / 'env'
+
+    set_data_dir(tmp_path / 'set')
+    try:
+        assert get_data_dir() == tmp_path / 'set'
+    finally:
+        set_data_dir(None)
+    assert get_data_dir() == tmp_path / 'env'
+
+
+@pytest.mark.parametrize('module', ['vdffit', 'vdffit.campaign',
+                                    'vdffit.fitting', 'vdffit.io.psp',
+                                    'vdffit.io.solo'])
+def test_import_is_lazy(module):
+    # Heavy dependencies should only be imported when they are used
+    heavy = ['sunpy', 'pandas', 'scipy.optimize', 'joblib', 'astropy.table',
+             'h5py', 'pyarrow']
+    if module in ['vdffit', 'vdffit.campaign']:
+        heavy += ['astropy', 'cdflib']
+    code = (f'import sys; import {module}; '
+            f'print([m for m in {heavy} if m in sys.modules])')
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         capture_output=True, text=True,
+                         cwd=Path(vdffit.__file__).parents[1]).stdout
+    assert out.strip() == '[]'
@@ -0,0 +1,126 @@
+import pickle
+
+import numpy as np
+import pytest
+from astropy.timeseries import TimeSeries
+
+from vdffit.fitting import BiMaxFitter, BiMaxLogFitter, FitStats
+from vdffit.io.psp import SPANL2CDF
+
+
+def check_result(result, params):
+    assert isinstance(result, TimeSeries)
+    assert len(result) == params.shape[0]
+    assert result.time.format == 'datetime64'
+    np.testing.assert_equal(result['Fit status'], 1)
+    np.testing.assert_equal(result['Quality flag'], 1)
+    for i, comp in enumerate(['vx', 'vy', 'vz']):
+        np.testing.assert_allclose(result[comp].value, params[:, i + 1],
+                                   rtol=1e-5)
+
+
+@pytest.mark.parametrize('batch_size', [None, 16])
+def test_fit_cdf(span_day, batch_size):
+    date, params = span_day
+    cdf = SPANL2CDF(date)
+    result = BiMaxFitter().fit_cdf(cdf, batch_size=batch_size)
+    check_result(result, params)
+
+
+@pytest.mark.parametrize('batch_size', [None, 16])
+def test_fit_cdf_log_fitter(span_day, batch_size):
+    date, params = span_day
+    result = BiMaxLogFitter().fit_cdf(SPANL2CDF(date), batch_size=batch_size)
+    check_result(result, params)
+
+
+@pytest.mark.parametrize('batch_size', [None, 8])
+def test_fit_cdf_parallel(span_day, batch_size):
+    date, params = span_day
+    cdf = SPANL2CDF(date)
+    result = BiMaxFitter().fit_cdf(cdf, batch_size=batch_size, n_jobs=2,
+                                   backend='threading', chunk_size=7)
+    check_result(result, params)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_fit_cdf_warm_start(span_day, n_jobs):
+    date, params = span_day
+    cdf = SPANL2CDF(date)
+    result = BiMaxFitter().fit_cdf(cdf, warm_start=True, n_jobs=n_jobs,
+                                   backend='threading')
+    check_result(result, params)
+
+
+def test_warm_start_batch_error(span_day):
+    date, _ = span_day
+    with pytest.raises(ValueError, match='warm_start'):
+        BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=8, warm_start=True)
+
+
+def test_cdf_pickle(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    # Load some data
+    cdf.eflux
+    cdf.mag_cdf.all_bvecs
+
+    state = cdf.__getstate__()
+    for attr in ['cdf', 'eflux', 'epochs', 'times']:
+        assert attr not in state
+    assert 'all_bvecs' not in state['mag_cdf'].__getstate__()
+
+    # Check data can be re-loaded
+    new_cdf = pickle.loads(pickle.dumps(cdf))
+    np.testing.assert_equal(new_cdf.eflux, cdf.eflux)
+
+
+@pytest.mark.parametrize('batch_size', [None, 8])
+def test_fit_cdf_stats(span_day, batch_size):
+    date, params = span_day
+    cdf = SPANL2CDF(date)
+    stats = FitStats()
+    result = BiMaxFitter().fit_cdf(cdf, batch_size=batch_size, n_jobs=2,
+                                   backend='threading', chunk_size=7,
+                                   stats=stats)
+    check_result(result, params)
+    n = len(params)
+    assert stats.nspectra == n
+    assert stats.status == {1: n}
+    assert stats.nsolve == n
+    assert stats.nfev >= stats.njev >= n
+    for stage in ['magnetic field', 'read', 'distribution', 'fit',
+                  'least squares', 'post-process', 'total']:
+        assert stats.time[stage] > 0
+    assert stats.calls['magnetic field'] == int(np.ceil(n / 7))
+    assert result.meta['fit stats'] == stats.to_dict()
+
+    # Statistics from another call are added on
+    BiMaxFitter().fit_cdf(cdf, batch_size=batch_size, stats=stats)
+    assert stats.nspectra == 2 * n
+    assert stats.status == {1: 2 * n}
+
+
+def test_fit_cdf_float32(span_day):
+    date, params = span_day
+    cdf = SPANL2CDF(date)
+    cdf.dtype = np.float32
+    batch = cdf.get_batch(0, 8)
+    assert batch.velocities.dtype == np.float32
+    assert batch.vdf.dtype == np.float32
+
+    result = BiMaxFitter().fit_cdf(cdf, batch_size=16)
+    check_result(result, params)
+    # Compare to fitting in double precision
+    expected = BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=16)
+    for col in ['n', 'vx', 'vy', 'vz', 'T_perp', 'T_par']:
+        np.testing.assert_allclose(result[col], expected[col], rtol=1e-5)
+
+
+def test_fit_cdf_loky(span_day):
+    # Worker processes don't share any configuration with this process, so
+    # have to find the data from the file object alone
+    date, params = span_day
+    result = BiMaxFitter().fit_cdf(SPANL2CDF(date), batch_size=8, n_jobs=2,
+                                   backend='loky', chunk_size=16)
+    check_result(result, params)
@@ -0,0 +1,54 @@
+import astropy.units as u
+import numpy as np
+import pytest
+
+from vdffit.io.psp import MAGL2, SPANL2CDF
+
+
+@pytest.fixture
+def mag(span_day):
+    date, _ = span_day
+    return MAGL2(date)
+
+
+def test_nearest_indices(span_day):
+    date, _ = span_day
+    mag = MAGL2(date)
+    rng = np.random.default_rng(0)
+    mag_epochs = mag.epochs
+    epochs = rng.integers(mag_epochs[0] - 10**10, mag_epochs[-1] + 10**10,
+                          size=100)
+    # Include exact matches and ties
+    epochs[:10] = mag_epochs[rng.integers(0, mag_epochs.size, 10)]
+    epochs[10:20] = (mag_epochs[:10] + mag_epochs[1:11]) // 2
+
+    expected = [np.argmin(np.abs(e - mag_epochs)) for e in epochs]
+    np.testing.assert_equal(mag.nearest_indices(epochs), expected)
+
+    # Unsorted epochs
+    mag = MAGL2(date)
+    mag.epochs = mag_epochs[rng.permutation(mag_epochs.size)]
+    epochs = epochs[20:]
+    expected = [np.argmin(np.abs(e - mag.epochs)) for e in epochs]
+    np.testing.assert_equal(mag.nearest_indices(epochs), expected)
+
+
+def test_get_bvecs(mag):
+    epochs = mag.epochs[[0, 5, 100]]
+    np.testing.assert_equal(mag.get_bvecs(epochs), mag.all_bvecs[[0, 5, 100]])
+    np.testing.assert_equal(mag.get_bvec(epochs[1]).vec, mag.all_bvecs[5])
+
+    # A 1 second window contains 5 samples at 4 samples/second
+    averaged = mag.get_bvecs(epochs[1:], window=1 * u.s)
+    np.testing.assert_allclose(averaged[0],
+                               np.mean(mag.all_bvecs[3:8], axis=0))
+    np.testing.assert_allclose(averaged[1],
+                               np.mean(mag.all_bvecs[98:103], axis=0))
+
+
+def test_vdf_bvecs(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    expected = [cdf.mag_cdf.get_bvec(e).vec for e in cdf.epochs]
+    np.testing.assert_equal(cdf.bvecs, expected)
+    np.testing.assert_equal(cdf[3].bvec.vec, expected[3])
@@ -0,0 +1,117 @@
+import astropy.units as u
+import numpy as np
+import pytest
+
+from vdffit.fitting import BiMaxFitter, Moments, batch_moments
+from vdffit.io.psp import SPANL2CDF
+from vdffit.io.solo import PASL2CDF
+from vdffit.util import Vector
+from vdffit.vdf import VDFBatch, spherical_bin_volumes
+
+
+def true_moments(params):
+    """
+    Density, and parallel and perpendicular temperatures, of bi-Maxwellians.
+    """
+    vth_par, vth_perp = params[:, 4] * u.km / u.s, params[:, 5] * u.km / u.s
+    n = (params[:, 0] * u.s**3 / u.m**6 * np.pi**1.5 *
+         vth_perp**2 * vth_par).to_value(u.cm**-3)
+    return (n, BiMaxFitter.v_to_T(vth_par).value,
+            BiMaxFitter.v_to_T(vth_perp).value)
+
+
+def test_spherical_bin_volumes():
+    modv = np.linspace(0.01, 0.99, 50)[:, None, None]
+    theta = np.deg2rad(np.linspace(-87.5, 87.5, 36))[None, :, None]
+    # Azimuths that wrap around 2 pi
+    phi = np.deg2rad(np.arange(2.5, 360, 5) + 180)[None, None, :] % (
+        2 * np.pi)
+    volumes = spherical_bin_volumes(modv, theta, phi, axes=(0, 1, 2))
+    assert volumes.shape == (50, 36, 72)
+    assert np.sum(volumes) == pytest.approx(4 / 3 * np.pi)
+
+    # NaN bins don't affect their neighbours
+    theta = np.broadcast_to(theta, volumes.shape).copy()
+    theta[:, 3] = np.nan
+    volumes_nan = spherical_bin_volumes(modv, theta, phi, axes=(0, 1, 2))
+    assert np.all(np.isnan(volumes_nan[:, 3]))
+    np.testing.assert_equal(volumes_nan[:, 4:], volumes[:, 4:])
+
+
+def test_batch_moments():
+    # A finely resolved bi-Maxwellian
+    params = np.array([[1e-9, -300, 50, -20, 40, 25]])
+    bvec = Vector(np.array([1., 2, 3]))
+    modv = np.linspace(150, 450, 150)[:, None, None]
+    theta = np.deg2rad(np.linspace(-30, 30, 120))[None, :, None]
+    phi = np.deg2rad(np.linspace(140, 200, 120))[None, None, :]
+    vs = np.stack(np.broadcast_arrays(modv * np.cos(theta) * np.cos(phi),
+                                      modv * np.cos(theta) * np.sin(phi),
+                                      modv * np.sin(theta)), axis=-1)
+    volumes = spherical_bin_volumes(modv, theta, phi, axes=(0, 1, 2))
+    R = bvec.rotation_matrix
+    vdf = BiMaxFitter.bi_maxwellian_3D(
+        *(vs.reshape(-1, 3) @ R.T).T, params[0, 0], *(R @ params[0, 1:4]),
+        *params[0, 4:])
+
+    n, v, T = batch_moments(vs.reshape(1, -1, 3), vdf[np.newaxis],
+                            volumes.reshape(1, -1))
+    n_true, T_par, T_perp = true_moments(params)
+    np.testing.assert_allclose(n, n_true, rtol=1e-4)
+    np.testing.assert_allclose(v, params[:, 1:4], atol=1e-3)
+    b = bvec.vec / np.linalg.norm(bvec.vec)
+    np.testing.assert_allclose(b @ T[0] @ b, T_par, rtol=1e-3)
+    np.testing.assert_allclose((np.trace(T[0]) - b @ T[0] @ b) / 2, T_perp,
+                               rtol=1e-3)
+    np.testing.assert_allclose(T, T.swapaxes(1, 2))
+
+
+def test_moments_span(span_day):
+    date, params = span_day
+    cdf = SPANL2CDF(date)
+    result = Moments().compute_cdf(cdf, batch_size=16)
+    assert len(result) == len(cdf)
+    np.testing.assert_equal(result['Fit status'], 1)
+    np.testing.assert_equal(result['Quality flag'], 1)
+    # The synthetic distributions are only sampled at the centre of each
+    # bin, which is coarse compared to their width
+    n, T_par, T_perp = true_moments(params)
+    np.testing.assert_allclose(result['n'].to_value(u.cm**-3), n,
+                               rtol=0.02)
+    for i, comp in enumerate(['vx', 'vy', 'vz']):
+        np.testing.assert_allclose(result[comp].to_value(u.km / u.s),
+                                   params[:, i + 1], atol=1)
+    np.testing.assert_allclose(result['T_par'].to_value(u.K), T_par,
+                               rtol=0.05)
+    np.testing.assert_allclose(result['T_perp'].to_value(u.K), T_perp,
+                               rtol=0.1)
+
+    # Same columns as the fit results
+    fit = BiMaxFitter().fit_cdf(cdf, batch_size=16)
+    assert result.colnames == fit.colnames
+    for col in result.colnames[1:]:
+        assert getattr(result[col], 'unit', None) == getattr(fit[col], 'unit',
+                                                             None)
+
+
+@pytest.mark.parametrize('cdf_cls, day', [(SPANL2CDF, 'span_day'),
+                                          (PASL2CDF, 'pas_day')])
+def test_moments_distributions(cdf_cls, day, request):
+    # Moments of single distributions are the same as of batches read
+    # straight from the file
+    date, _ = request.getfixturevalue(day)
+    cdf = cdf_cls(date)
+    moments = Moments()
+    batch = moments.compute_batch(cdf.get_batch(0, 5))
+    single = moments.compute_batch(
+        VDFBatch.from_distributions([cdf[i] for i in range(5)]))
+    for name in moments.param_names:
+        np.testing.assert_allclose(batch[name], single[name], rtol=1e-10)
+
+
+def test_moments_no_volumes(span_day):
+    date, _ = span_day
+    batch = SPANL2CDF(date).get_batch(0, 5)
+    batch.volumes = None
+    with pytest.raises(ValueError, match='bin volumes'):
+        Moments().compute_batch(batch)
@@ -0,0 +1,131 @@
+import astropy.constants as const
+import astropy.units as u
+import numpy as np
+import pytest
+
+from vdffit.fitting import BiMaxFitter, PASProtonCoreFitter, Triage
+from vdffit.io.solo import PASL2CDF
+from vdffit.tests.test_span import check_batches_equal
+from vdffit.tests.test_triage import check_screening_batch
+from vdffit.vdf import PASDistribution, VDFBatch
+
+
+def test_get_batch(pas_day):
+    date, _ = pas_day
+    cdf = PASL2CDF(date)
+    # Shrink the windows of some records, so the batch has to be padded
+    n_energy = cdf.n_energy.copy()
+    n_energy[::3] -= 5
+    cdf.n_energy = n_energy
+    n_azimuth = cdf.n_azimuth.copy()
+    n_azimuth[1] -= 2
+    cdf.n_azimuth = n_azimuth
+    start_elevation = cdf.start_elevation_idx.copy()
+    start_elevation[2] = 1
+    cdf.start_elevation_idx = start_elevation
+
+    batch = cdf.get_batch(0, 10)
+    assert batch.vdf.shape == (10, 11 * 9 * 48)
+    assert batch.velocities.shape == (10, 11 * 9 * 48, 3)
+
+    dists = [cdf[i] for i in range(10)]
+    for i, dist in enumerate(dists):
+        assert dist.vdf.shape == (np.prod(dist.shape), )
+        assert np.sum(np.isfinite(batch.vdf[i])) == dist.vdf.size
+    check_batches_equal(batch, VDFBatch.from_distributions(dists))
+
+
+@pytest.mark.parametrize('phi, theta, direction', [
+    # Looking at the Sun sees particles moving radially outwards
+    (0, 0, [1, 0, 0]),
+    # Looking towards -Y in the spacecraft frame, which is +T
+    (90, 0, [0, -1, 0]),
+    # Looking towards +Z in the spacecraft frame, which is +N
+    (0, 90, [0, 0, -1]),
+    (180, 0, [-1, 0, 0]),
+])
+def test_velocity_table(phi, theta, direction):
+    energy = [1000] * u.eV
+    v = PASDistribution.velocity_table(
+        energy, [[theta]] * u.deg, [[phi]] * u.deg)
+    assert v.shape == (1, 1, 1, 3)
+    modv = np.sqrt(2 * energy / const.m_p).to(u.km / u.s)
+    np.testing.assert_allclose(v[0, 0, 0].to_value(u.km / u.s),
+                               (modv * direction).value, atol=1e-9)
+
+
+def test_get_distribution_reads_records(pas_day):
+    date, _ = pas_day
+    cdf = PASL2CDF(date)
+    dist = cdf[5]
+    # Only the requested record should have been read
+    assert 'vdf' not in cdf.__dict__
+    loaded = PASL2CDF(date)
+    loaded.vdf
+    check_batches_equal(VDFBatch.from_distributions([dist]),
+                        VDFBatch.from_distributions([loaded[5]]))
+
+
+@pytest.mark.parametrize('batch_size', [None, 8])
+def test_fit_cdf(pas_day, batch_size):
+    date, params = pas_day
+    result = BiMaxFitter().fit_cdf(PASL2CDF(date), batch_size=batch_size)
+    np.testing.assert_equal(result['Fit status'], 1)
+    for i, comp in enumerate(['vx', 'vy', 'vz']):
+        np.testing.assert_allclose(result[comp].value, params[:, i + 1],
+                                   rtol=1e-5)
+
+
+@pytest.fixture
+def noisy_pas_cdf(pas_day):
+    """
+    A PAS file with some bad distribution functions.
+    """
+    date, _ = pas_day
+    cdf = PASL2CDF(date)
+    vdf = cdf.vdf.copy()
+    window = slice(cdf.start_energy_idx[3], cdf.start_energy_idx[3] + 48)
+    # Peak on an edge
+    vdf[3, 0, 4, window][24] = 1.5 * np.max(vdf[3])
+    # No data either side of the peak in azimuth
+    peak = np.unravel_index(np.argmax(vdf[5]), vdf.shape[1:])
+    vdf[5, np.arange(11) != peak[0]] = 0
+    # Only a few points
+    vdf[8].flat[np.argsort(vdf[8], axis=None)[:-5]] = 0
+    cdf.vdf = vdf
+    return cdf
+
+
+def test_quality_flags(noisy_pas_cdf):
+    cdf = noisy_pas_cdf
+    expected = np.ones(len(cdf), dtype=int)
+    expected[[3, 5, 8]] = [2, 3, 4]
+    np.testing.assert_equal(cdf.quality_flags(), expected)
+    np.testing.assert_equal(cdf.get_batch(0, 10).quality_flags,
+                            expected[:10])
+    assert [cdf[i].quality_flag() for i in range(len(cdf))] == list(expected)
+
+
+def test_screening_batch(noisy_pas_cdf):
+    check_screening_batch(noisy_pas_cdf, 0, 10)
+    check_screening_batch(noisy_pas_cdf, 3, len(noisy_pas_cdf))
+
+
+def test_triage(noisy_pas_cdf, count_fits):
+    triage = Triage()
+    result = PASProtonCoreFitter().fit_cdf(noisy_pas_cdf, batch_size=8,
+                                           triage=triage, verbose=0)
+    assert sum(count_fits) == len(noisy_pas_cdf) - 3
+    assert result.meta['triage'] == {'too few points': 1,
+                                     'bad magnetic field': 0,
+                                     'non-finite peak velocity': 0,
+                                     'quality flag': 2}
+    status = np.ones(len(noisy_pas_cdf), dtype=int)
+    status[[3, 5, 8]] = [Triage.QUALITY_STATUS, Triage.QUALITY_STATUS, 2]
+    np.testing.assert_equal(result['Fit status'], status)
+    assert set(result.meta['fit status']) >= set(status)
+
+    # The default quality flag checks can be turned off
+    results = Triage(reject_quality_flags=[]).screen_cdf(
+        PASProtonCoreFitter(), noisy_pas_cdf)
+    np.testing.assert_equal(np.nonzero(results['fit status'] != 1)[0], [8])
@@ -0,0 +1,101 @@
+import astropy.units as u
+import cdflib
+import numpy as np
+import pytest
+
+from vdffit.fitting import BiMaxFitter
+from vdffit.io import (
+    CDFWriter,
+    HDF5Writer,
+    ParquetWriter,
+    read_hdf5,
+    read_parquet,
+)
+from vdffit.io.psp import SPANL2CDF
+from vdffit.util import datetime64_to_time
+
+
+@pytest.fixture
+def results(span_day):
+    """
+    Fit results, one TimeSeries for each batch.
+    """
+    date, _ = span_day
+    batches = list(BiMaxFitter().iter_fit(SPANL2CDF(date), batch_size=16))
+    # Make some fits fail, so the results have NaNs and different statuses
+    batches[1]['Fit status'][3] = 4
+    batches[1]['n'][3] = np.nan
+    return batches
+
+
+def check_equal(ts, expected):
+    assert ts.colnames == expected.colnames
+    assert np.all(ts['time'] == expected['time'])
+    for col in ts.colnames[1:]:
+        assert getattr(ts[col], 'unit', None) == getattr(expected[col],
+                                                         'unit', None)
+        np.testing.assert_equal(np.asarray(ts[col]), np.asarray(expected[col]))
+
+
+@pytest.mark.parametrize('writer, read', [(ParquetWriter, read_parquet),
+                                          (HDF5Writer, read_hdf5)])
+def test_write_read(results, tmp_path, writer, read):
+    path = tmp_path / 'results'
+    with writer(path) as w:
+        for ts in results:
+            w.write(ts)
+    assert w.nrows == 40
+
+    all_results = read(path)
+    assert all_results.time.format == 'datetime64'
+    check_equal(all_results[:16], results[0])
+    check_equal(all_results[16:32], results[1])
+    assert all_results['vx'].unit == u.km / u.s
+    assert all_results.meta['fit status']['4'] == 'Fit failed.'
+    assert all_results['Fit status'].info.description == 'Fit status code'
+
+    # Time range and predicate reads
+    times = all_results['time']
+    subset = read(path, start_time=times[10].datetime, end_time=times[20],
+                  columns=['vx', 'Fit status'],
+                  where=[('Fit status', '==', 1)])
+    assert subset.colnames == ['time', 'vx', 'Fit status']
+    keep = np.arange(10, 20) != 19
+    assert np.all(subset['time'] == times[10:20][keep])
+    np.testing.assert_equal(subset['vx'], all_results['vx'][10:20][keep])
+
+    subset = read(path, start_time=np.datetime64('2030-01-01'))
+    assert len(subset) == 0
+
+
+def test_hdf5_time_order(results, tmp_path):
+    with HDF5Writer(tmp_path / 'results.h5') as w:
+        w.write(results[1])
+        with pytest.raises(ValueError, match='time order'):
+            w.write(results[0])
+
+
+def test_cdf_writer(results, tmp_path):
+    path = tmp_path / 'results.cdf'
+    # Times that aren't a whole number of microseconds
+    expected_times = (np.asarray(results[0].time.datetime64,
+                                 dtype='datetime64[ns]') +
+                      np.timedelta64(123456789, 'ns'))
+    results[0]['time'] = datetime64_to_time(expected_times)
+    with CDFWriter(path, global_attrs={'PI_name': 'Me'}) as w:
+        for ts in results:
+            w.write(ts)
+
+    cdf = cdflib.CDF(path)
+    assert cdf.globalattsget()['PI_name'] == ['Me']
+    times = cdflib.cdfepoch.to_datetime(cdf.varget('Epoch'))
+    np.testing.assert_equal(times[:16], expected_times)
+    assert cdf.varattsget('vx')['UNITS'] == 'km / s'
+    np.testing.assert_allclose(cdf.varget('vx')[:16], results[0]['vx'].value)
+    # NaNs are replaced with the fill value
+    assert cdf.varget('n')[19] == -1e31
+    attrs = cdf.varattsget('Fit_status')
+    assert attrs['DEPEND_0'] == 'Epoch'
+    assert attrs['VAR_TYPE'] == 'data'
+    np.testing.assert_equal(cdf.varget('Fit_status')[16:32],
+                            results[1]['Fit status'])
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+import astropy.units as u
+import numpy as np
+import pytest
+from astropy.time import Time
+
+from vdffit.io.psp import SPANL2CDF
+from vdffit.vdf import VDFBatch
+
+
+def check_batches_equal(batch, expected):
+    """
+    Check that the unmasked points in two batches are the same.
+    """
+    batch = batch.compressed()
+    expected = expected.compressed()
+    np.testing.assert_equal(batch.times, expected.times)
+    np.testing.assert_equal(batch.mask, expected.mask)
+    mask = batch.mask
+    np.testing.assert_allclose(batch.velocities[mask],
+                               expected.velocities[mask], rtol=1e-12)
+    np.testing.assert_allclose(batch.vdf[mask], expected.vdf[mask],
+                               rtol=1e-12)
+    np.testing.assert_equal(batch.bvecs, expected.bvecs)
+    np.testing.assert_equal(batch.quality_flags, expected.quality_flags)
+    if batch.volumes is not None and expected.volumes is not None:
+        np.testing.assert_allclose(batch.volumes[mask],
+                                   expected.volumes[mask], rtol=1e-12)
+
+
+def test_get_batch(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    # Change the energy table for some records, and remove some bins
+    energy = cdf.energy.copy()
+    energy[20:30] *= 1.1
+    cdf.energy = energy
+    theta = cdf.theta.copy()
+    theta[25, :10] = np.nan * u.deg
+    cdf.theta = theta
+
+    table_idx, first_records = cdf._grid_tables(
+        cdf.energy[5:35].value, cdf.theta[5:35].value, cdf.phi[5:35].value)
+    np.testing.assert_equal(first_records, [0, 15, 20, 21, 25])
+    np.testing.assert_equal(np.bincount(table_idx), [15, 5, 1, 4, 5])
+
+    batch = cdf.get_batch(5, 35)
+    assert batch.quality_flags[20] == 4
+    assert batch.vdf.shape == (30, 2048)
+    assert not np.any(batch.mask[20, :10])
+    expected = VDFBatch.from_distributions([cdf[i] for i in range(5, 35)])
+    check_batches_equal(batch, expected)
+
+
+def test_lazy_varget(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    eflux = cdf.varget('EFLUX')
+    lazy = cdf.lazy_varget('EFLUX')
+    assert lazy.shape == eflux.shape
+    assert lazy.unit == eflux.unit
+    for key in [slice(3, 10), slice(None, 5), slice(30, None, 3),
+                slice(20, 2, -4), slice(10, 10), 7, -1, (slice(2, 5), 100)]:
+        np.testing.assert_equal(lazy[key], eflux[key])
+    np.testing.assert_equal(cdf.varget('EFLUX', startrec=3, endrec=5),
+                            eflux[3:6])
+
+
+def test_get_batch_reads_records(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    batch = cdf.get_batch(10, 20)
+    # Only the requested records should have been read
+    for attr in ['eflux', 'energy', 'theta', 'phi']:
+        assert attr not in cdf.__dict__
+    check_batches_equal(batch, SPANL2CDF(date).get_batch(0, 40)[10:20])
+
+
+def test_get_distribution_reads_records(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    dists = [cdf[i] for i in [10, -1]]
+    # Only the requested records should have been read
+    for attr in ['eflux', 'energy', 'theta', 'phi']:
+        assert attr not in cdf.__dict__
+    loaded = SPANL2CDF(date)
+    loaded.eflux
+    check_batches_equal(VDFBatch.from_distributions(dists),
+                        VDFBatch.from_distributions([loaded[10],
+                                                     loaded[len(cdf) - 1]]))
+
+
+def test_time_indexing(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    t = cdf.times[3]
+    for time in [t, np.datetime64(t, 'ns'), t.astype('datetime64[us]').item(),
+                 Time(t, scale='utc')]:
+        assert cdf.index(time) == 3
+        assert cdf[time].time == cdf[3].time
+
+    with pytest.raises(ValueError, match='not found in timestamps'):
+        cdf[t + np.timedelta64(1, 's')]
+
+    assert cdf.nearest_index(t + np.timedelta64(3, 's')) == 3
+    assert cdf.nearest_index(t + np.timedelta64(4, 's')) == 4
+    assert cdf.nearest_index(date - timedelta(days=1)) == 0
+    assert cdf.nearest(date + timedelta(days=1)).time == cdf.times[-1]
+
+    dists = cdf[t:Time(cdf.times[6], scale='utc')]
+    assert [d.time for d in dists] == list(cdf.times[3:6])
+    assert [d.time for d in cdf[2:8:2]] == list(cdf.times[2:8:2])
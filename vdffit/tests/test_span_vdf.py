@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from vdffit.vdf import SPANDistribution, VDFBase
+
+
+def single_quality_flag(vdf):
+    dist = SPANDistribution.__new__(SPANDistribution)
+    dist.eflux = vdf
+    dist.__dict__['vdf'] = vdf
+    return dist.quality_flag()
+
+
+def test_batch_quality_flags():
+    rng = np.random.default_rng(0)
+    n = 500
+    # Peaked distributions, with the peak in a random place
+    phi, energy, theta = np.meshgrid(np.arange(8), np.arange(32),
+                                     np.arange(8), indexing='ij')
+    centre = rng.uniform([0, 0, 0], [7, 31, 7], (n, 3))
+    vdf = np.exp(-((phi - centre[:, 0, None, None, None])**2 +
+                   (energy - centre[:, 1, None, None, None])**2 / 4 +
+                   (theta - centre[:, 2, None, None, None])**2))
+    vdf = vdf.reshape(n, -1)
+    # Zero out and NaN some bins
+    vdf[rng.uniform(size=vdf.shape) < 0.3] = 0
+    vdf[rng.uniform(size=vdf.shape) < 0.05] = np.nan
+    vdf[0] = np.nan
+    finite = np.ones(vdf.shape, dtype=bool)
+    finite[1:3, :10] = False
+
+    flags = SPANDistribution.batch_quality_flags(vdf, finite)
+    assert flags[0] == 3
+    np.testing.assert_equal(flags[1:3], 4)
+    expected = [single_quality_flag(v) for v in vdf[3:]]
+    np.testing.assert_equal(flags[3:], expected)
+    # Check that all the flags have been tested
+    np.testing.assert_equal(np.unique(flags), [1, 2, 3, 4])
+
+
+def test_volumes_required():
+    # Distribution classes must implement bin volumes
+    class NoVolumes(SPANDistribution):
+        volumes = VDFBase.volumes
+
+    with pytest.raises(TypeError, match='volumes'):
+        NoVolumes.__new__(NoVolumes)
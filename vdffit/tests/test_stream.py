@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from astropy.table import vstack
+
+from vdffit.fitting import BiMaxFitter
+from vdffit.io.psp import SPANL2CDF
+from vdffit.tests.synthetic import write_span_day
+
+
+def test_iter_batches(span_day):
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    batches = list(cdf.iter_batches(16))
+    assert [len(b) for b in batches] == [16, 16, 8]
+    np.testing.assert_equal(np.concatenate([b.times for b in batches]),
+                            cdf.times)
+
+    # Distributions are every 7 seconds
+    start_time = date + timedelta(seconds=70)
+    end_time = date + timedelta(seconds=140)
+    assert cdf.index_range(start_time, end_time) == (10, 20)
+    batches = list(cdf.iter_batches(4, start_time, end_time))
+    assert [len(b) for b in batches] == [4, 4, 2]
+    dists = list(cdf.iter_distributions(start_time, end_time))
+    np.testing.assert_equal([d.time for d in dists], cdf.times[10:20])
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_iter_fit(span_data_dir, n_jobs):
+    dates = [datetime(2020, 1, 1), datetime(2020, 1, 2)]
+    for date in dates:
+        write_span_day(span_data_dir, date, ntime=20)
+    cdfs = [SPANL2CDF(date) for date in dates]
+
+    fitter = BiMaxFitter()
+    results = list(fitter.iter_fit(
+        cdfs, 8, start_time=dates[0] + timedelta(seconds=35),
+        n_jobs=n_jobs, backend='threading'))
+    assert [len(r) for r in results] == [8, 7, 8, 8, 4]
+
+    result = vstack(results)
+    expected = vstack([fitter.fit_cdf(cdfs[0], verbose=0)[5:],
+                       fitter.fit_cdf(cdfs[1], verbose=0)])
+    assert np.all(result['time'] == expected['time'])
+    np.testing.assert_allclose(result['vx'], expected['vx'], rtol=1e-5)
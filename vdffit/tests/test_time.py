@@ -0,0 +1,44 @@
+import astropy.units as u
+import cdflib
+import numpy as np
+import pytest
+from astropy.time import Time
+
+from vdffit.util import datetime64_to_time, datetime64_to_tt2000
+
+
+@pytest.mark.parametrize('start', ['2020-01-01T12:34:56',
+                                   # Goes over a leap second
+                                   '2016-12-31T23:59:50'])
+def test_datetime64_to_time(start):
+    times = (np.datetime64(start, 'ns') +
+             np.arange(5) * np.timedelta64(7123456789, 'ns'))
+    t = datetime64_to_time(times)
+    assert t.scale == 'utc'
+    assert np.all(t.datetime64 == times)
+    assert np.all(np.abs((t - Time(times, format='datetime64')).to(u.ns)) <
+                  1 * u.ns)
+    assert t.format == 'datetime64'
+
+
+def test_timeseries_time_format():
+    from astropy.timeseries import TimeSeries
+
+    times = np.datetime64('2020-01-01T12:34:56.123456789', 'ns')[None]
+    ts = TimeSeries(time=datetime64_to_time(times))
+    assert ts.time.format == 'datetime64'
+    assert ts.time[0].value == times[0]
+
+
+def test_datetime64_to_tt2000():
+    times = np.array(['2000-01-01T11:58:55.816',
+                      '2016-12-31T23:59:59.999999999',
+                      '2017-01-01T00:00:00.000000001',
+                      '2020-01-07T00:00:01.123456789'], dtype='datetime64[ns]')
+    epochs = datetime64_to_tt2000(times)
+    assert epochs.dtype == np.int64
+    # J2000
+    assert epochs[0] == 0
+    # Leap second at the end of 2016
+    assert epochs[2] - epochs[1] == 10**9 + 2
+    np.testing.assert_equal(cdflib.cdfepoch.to_datetime(epochs), times)
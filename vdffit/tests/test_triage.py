@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from vdffit.fitting import BiMaxFitter, PSPProtonCoreFitter, Triage
+from vdffit.io.psp import SPANL2CDF
+from vdffit.vdf import ScreeningBatch
+
+
+def check_screening_batch(cdf, start, stop):
+    """
+    Check that a screening batch matches the full batch it summarises.
+    """
+    screening = cdf.get_screening_batch(start, stop)
+    expected = ScreeningBatch.from_batch(cdf.get_batch(start, stop))
+    assert len(screening) == len(expected)
+    assert np.all(screening.times == expected.times)
+    np.testing.assert_equal(screening.mask, expected.mask)
+    np.testing.assert_equal(screening.npoints, expected.npoints)
+    np.testing.assert_equal(screening.peak_finite, expected.peak_finite)
+    np.testing.assert_equal(screening.quality_flags, expected.quality_flags)
+    np.testing.assert_equal(screening.bvecs, expected.bvecs)
+
+
+@pytest.fixture
+def noisy_cdf(span_day):
+    """
+    A SPAN file with some bad distribution functions.
+    """
+    date, _ = span_day
+    cdf = SPANL2CDF(date)
+    eflux = cdf.eflux.copy()
+    # Only a few points
+    eflux[[2, 5], 10:] = 0
+    # Peak on an edge
+    eflux[7].reshape(8, 32, 8)[0, 10, 4] = 1.5 * np.max(eflux[7])
+    cdf.eflux = eflux
+    return cdf
+
+
+def test_triage(noisy_cdf, count_fits):
+    fitter = BiMaxFitter()
+    expected = fitter.fit_cdf(noisy_cdf, batch_size=8, verbose=0)
+    count_fits.clear()
+
+    triage = Triage(reject_quality_flags=[2])
+    result = fitter.fit_cdf(noisy_cdf, batch_size=8, triage=triage,
+                            verbose=0)
+    assert sum(count_fits) == len(noisy_cdf) - 3
+    assert result.meta['triage'] == {'too few points': 2,
+                                     'bad magnetic field': 0,
+                                     'non-finite peak velocity': 0,
+                                     'quality flag': 1}
+    assert triage.counts == result.meta['triage']
+
+    status = np.array(expected['Fit status'])
+    np.testing.assert_equal(status[[2, 5]], 2)
+    status[7] = Triage.QUALITY_STATUS
+    np.testing.assert_equal(result['Fit status'], status)
+    np.testing.assert_equal(result['Quality flag'], expected['Quality flag'])
+    assert np.all(result['time'] == expected['time'])
+    assert np.all(np.isnan(result['n'][[2, 5, 7]]))
+    np.testing.assert_equal(np.delete(result['vx'], [7]),
+                            np.delete(expected['vx'], [7]))
+
+
+def test_triage_checks(noisy_cdf):
+    fitter = BiMaxFitter()
+    results = Triage(checks=['too few points']).screen_cdf(fitter, noisy_cdf)
+    np.testing.assert_equal(np.nonzero(results['fit status'] != 1)[0], [2, 5])
+
+    with pytest.raises(ValueError, match='Unknown checks'):
+        Triage(checks=['not a check']).screen_cdf(fitter, noisy_cdf)
+
+
+def test_triage_nonfinite_bvec(noisy_cdf):
+    bvecs = noisy_cdf.bvecs.copy()
+    bvecs[1] = np.nan
+    bvecs[9] = 0
+    noisy_cdf.bvecs = bvecs
+    triage = Triage()
+    results = triage.screen_cdf(BiMaxFitter(), noisy_cdf)
+    np.testing.assert_equal(np.nonzero(results['fit status'] != 1)[0],
+                            [1, 2, 5, 9])
+    np.testing.assert_equal(results['fit status'][[1, 9]], 3)
+    assert triage.last_counts['bad magnetic field'] == 2
+
+
+def test_screening_batch(noisy_cdf):
+    theta = noisy_cdf.theta.copy()
+    theta[3, :8] = np.nan
+    noisy_cdf.theta = theta
+    check_screening_batch(noisy_cdf, 0, 10)
+    check_screening_batch(noisy_cdf, 5, len(noisy_cdf))
+
+
+def test_triage_no_velocities(noisy_cdf, monkeypatch):
+    def velocities_and_vdf(*args, **kwargs):
+        raise AssertionError('Velocities calculated during triage')
+
+    monkeypatch.setattr(noisy_cdf, 'velocities_and_vdf', velocities_and_vdf)
+    results = Triage(reject_quality_flags=[2]).screen_cdf(BiMaxFitter(),
+                                                          noisy_cdf)
+    np.testing.assert_equal(np.nonzero(results['fit status'] != 1)[0],
+                            [2, 5, 7])
+
+
+def test_psp_fitter_triage(noisy_cdf):
+    # Distributions with their peak on an edge are rejected by default
+    triage = Triage()
+    results = triage.screen_cdf(PSPProtonCoreFitter(), noisy_cdf)
+    np.testing.assert_equal(results['fit status'][[2, 5, 7]],
+                            [2, 2, Triage.QUALITY_STATUS])
+    assert triage.last_counts['quality flag'] == 1
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from vdffit.util import Vector, VectorArray
+
+
+@pytest.mark.parametrize('vec', [[1, 2, 3], [-3, 1, 0.5], [0, 0, 2],
+                                 [0, 0, -2], [1, 0, 0]])
+def test_rotation_matrix(vec):
+    vec = np.array(vec, dtype=float)
+    R = Vector(vec).rotation_matrix
+    np.testing.assert_allclose(R @ vec, [0, 0, np.linalg.norm(vec)],
+                               atol=1e-12)
+    np.testing.assert_allclose(R @ R.T, np.identity(3), atol=1e-12)
+    np.testing.assert_allclose(np.linalg.det(R), 1)
+
+
+def test_vector_array():
+    rng = np.random.default_rng(0)
+    vecs = rng.normal(size=(10, 3))
+    vecs[0] = [0, 0, 1]
+    vecs[1] = [0, 0, -1]
+    arr = VectorArray(vecs)
+
+    R = arr.rotation_matrices
+    assert R.shape == (10, 3, 3)
+    for i in range(10):
+        np.testing.assert_allclose(R[i], Vector(vecs[i]).rotation_matrix)
+
+    vs = rng.normal(size=(10, 20, 3))
+    rotated = arr.rotate_into(vs)
+    np.testing.assert_allclose(rotated[3], vs[3] @ R[3].T)
+    np.testing.assert_allclose(arr.rotate_out_of(rotated), vs)
+    np.testing.assert_allclose(arr.rotate_into(vecs)[:, 2],
+                               np.linalg.norm(vecs, axis=1))
+    np.testing.assert_allclose(arr.rotate_out_of(arr.rotate_into(vecs)),
+                               vecs)
+
+    # Single precision velocities stay in single precision
+    rotated32 = arr.rotate_into(vs.astype(np.float32))
+    assert rotated32.dtype == np.float32
+    np.testing.assert_allclose(rotated32, rotated, rtol=1e-5, atol=1e-5)
+
+
+def test_zero_vector():
+    with pytest.raises(ValueError, match=r'zero length vector \(at indices '
+                                         r'\[1\]\)'):
+        VectorArray([[1, 2, 3], [0, 0, 0]]).rotation_matrices
+    with pytest.raises(ValueError, match='zero length vector'):
+        Vector(np.zeros(3)).rotation_matrix
+    # Non-finite vectors don't raise
+    R = VectorArray([[1, 2, 3], [np.nan, 0, 0]]).rotation_matrices
+    assert np.all(np.isfinite(R[0]))
+    assert np.all(np.isnan(R[1]))
+
+
+@pytest.mark.parametrize('shape', [(4, 3), (4, 10, 3)])
+def test_rotate_float32(shape):
+    rng = np.random.default_rng(0)
+    vecs = VectorArray(rng.normal(size=(4, 3)))
+    vs = rng.normal(size=shape).astype(np.float32)
+    rotated = vecs.rotate_into(vs)
+    assert rotated.dtype == np.float32
+    back = vecs.rotate_out_of(rotated)
+    assert back.dtype == np.float32
+    np.testing.assert_allclose(back, vs, rtol=1e-5, atol=1e-6)
+
+
+def test_rotationmatrixangle_deprecated():
+    vec = np.array([1., 2, 3])
+    with pytest.warns(DeprecationWarning, match='rotation_matrix'):
+        R = Vector._rotationmatrixangle(np.cross([0, 0, 1], vec),
+                                        -np.arccos(3 / np.linalg.norm(vec)))
+    np.testing.assert_allclose(R, Vector(vec).rotation_matrix, atol=1e-15)
@@ -1 +1,2 @@
+from .time import *
 from .vector import *
@@ -1,6 +1,9 @@
+import warnings
+from functools import cached_property
+
 import numpy as np
 
-__all__ = ['Vector']
+__all__ = ['Vector', 'VectorArray']
 
 
 class Vector:
@@ -26,24 +29,21 @@ class Vector:
     def rotation_matrix(self):
         """
         The 3x3 rotation matrix that maps this vector on to the z-axis.
-        """
-        norm = np.linalg.norm(self.vec)
-        zaxis = np.array([0, 0, 1])
-
-        # Calculate orthogonal axis
-        orthvec = np.cross(zaxis, self.vec)
-        phi = np.arccos(self.vec[2] / norm)
 
-        R = self._rotationmatrixangle(orthvec, -phi)
-        return R
+        See `VectorArray.rotation_matrices` for details.
+        """
+        return VectorArray(self.vec[np.newaxis, :]).rotation_matrices[0]
 
     @staticmethod
     def _rotationmatrixangle(axis, theta):
         """
         Return the rotation matrix about a given axis.
 
-        The rotation is taken to be counterclockwise about the given axis. Uses the
-        Euler-Rodrigues formula.
+        The rotation is taken to be counterclockwise about the given axis.
+        Uses the Euler-Rodrigues formula.
+
+        This is deprecated, use `Vector.rotation_matrix` or
+        `VectorArray.rotation_matrices` instead.
 
         Parameters
         ----------
@@ -57,6 +57,10 @@ class Vector:
             R : array_like
                 Rotation matrix resulting from rotation about given axis.
         """
+        warnings.warn('Vector._rotationmatrixangle is deprecated, use '
+                      'Vector.rotation_matrix or '
+                      'VectorArray.rotation_matrices instead',
+                      DeprecationWarning, stacklevel=2)
         assert axis.shape == (3, ), 'Axis must be a single 3 vector'
         assert np.dot(axis, axis) != 0, 'Axis has zero length'
 
@@ -70,3 +74,122 @@ class Vector:
                         [2 * (bc - ad), aa + cc - bb - dd, 2 * (cd + ab)],
                         [2 * (bd + ac), 2 * (cd - ab), aa + dd - bb - cc]])
         return out
+
+
+class VectorArray:
+    """
+    An array of vectors.
+
+    Parameters
+    ----------
+    vecs : numpy.ndarray
+        Vector data, must be shape (n, 3).
+    """
+    def __init__(self, vecs):
+        vecs = np.asarray(vecs)
+        assert vecs.ndim == 2 and vecs.shape[1] == 3, \
+            "VectorArray must have shape (n, 3)"
+        self.vecs = vecs
+
+    def __len__(self):
+        return self.vecs.shape[0]
+
+    def __getitem__(self, i):
+        return Vector(self.vecs[i])
+
+    def __repr__(self):
+        return f'VectorArray, {self.vecs.__repr__()}'
+
+    @cached_property
+    def rotation_matrices(self):
+        """
+        The 3x3 rotation matrices that map each vector on to the z-axis.
+
+        These are calculated using the Euler-Rodrigues formula, rotating each
+        vector about its cross product with the z-axis. Vectors parallel to
+        the z-axis give the identity matrix, and vectors anti-parallel to the
+        z-axis are rotated by 180 degrees about the x-axis. Vectors with any
+        non-finite component give matrices of NaN.
+
+        Returns
+        -------
+        numpy.ndarray
+            Shape (n, 3, 3).
+
+        Raises
+        ------
+        ValueError
+            If any of the vectors has zero length, as these have no
+            direction to rotate on to the z-axis.
+        """
+        vecs = self.vecs
+        norm = np.linalg.norm(vecs, axis=1)
+        zero = np.nonzero(norm == 0)[0]
+        if zero.size:
+            raise ValueError('Cannot calculate the rotation matrix of a zero '
+                             f'length vector (at indices {zero.tolist()})')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            phi = np.arccos(vecs[:, 2] / norm)
+            # Axis orthogonal to the z-axis and each vector
+            axis = np.stack([-vecs[:, 1], vecs[:, 0],
+                             np.zeros(len(self))], axis=-1)
+            axis_norm = np.linalg.norm(axis, axis=1)
+            # Vectors (anti-)parallel to z; any axis in the x-y plane works
+            parallel = axis_norm == 0
+            axis[parallel] = [1, 0, 0]
+            axis_norm[parallel] = 1
+            axis = axis / axis_norm[:, np.newaxis]
+
+        # Rotate by -phi about the axis
+        a = np.cos(-phi / 2)
+        b, c, d = (axis * np.sin(phi / 2)[:, np.newaxis]).T
+        aa, bb, cc, dd = a * a, b * b, c * c, d * d
+        bc, ad, ac, ab, bd, cd = b * c, a * d, a * c, a * b, b * d, c * d
+        return np.stack([
+            np.stack([aa + bb - cc - dd, 2 * (bc + ad), 2 * (bd - ac)], -1),
+            np.stack([2 * (bc - ad), aa + cc - bb - dd, 2 * (cd + ab)], -1),
+            np.stack([2 * (bd + ac), 2 * (cd - ab), aa + dd - bb - cc], -1)],
+            axis=1)
+
+    def rotate_into(self, vs):
+        """
+        Rotate velocities into the frame aligned with each vector.
+
+        Parameters
+        ----------
+        vs : numpy.ndarray
+            Velocities, shape (n, 3) or (n, npts, 3).
+
+        Returns
+        -------
+        numpy.ndarray
+            Rotated velocities, the same shape as *vs*. Single precision
+            velocities are rotated in single precision.
+        """
+        R = self.rotation_matrices.astype(np.result_type(vs, np.float32),
+                                          copy=False)
+        if vs.ndim == 2:
+            return np.einsum('nij,nj->ni', R, vs)
+        return vs @ R.swapaxes(1, 2)
+
+    def rotate_out_of(self, vs):
+        """
+        Rotate velocities out of the frame aligned with each vector. This is
+        the inverse of `rotate_into`.
+
+        Parameters
+        ----------
+        vs : numpy.ndarray
+            Velocities, shape (n, 3) or (n, npts, 3).
+
+        Returns
+        -------
+        numpy.ndarray
+            Rotated velocities, the same shape as *vs*. Single precision
+            velocities are rotated in single precision.
+        """
+        R = self.rotation_matrices.astype(np.result_type(vs, np.float32),
+                                          copy=False)
+        if vs.ndim == 2:
+            return np.einsum('nji,nj->ni', R, vs)
+        return vs @ R
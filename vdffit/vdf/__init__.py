@@ -1,3 +1,5 @@
+from .batch import *
+from .grid import *
 from .pas import *
 from .span import *
 from .vdf import *
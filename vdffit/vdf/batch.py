@@ -0,0 +1,214 @@
+import hashlib
+
+import astropy.units as u
+import numpy as np
+
+__all__ = ['ScreeningBatch', 'VDFBatch']
+
+
+class VDFBatch:
+    """
+    A batch of velocity distribution functions, stored as plain arrays.
+
+    Distributions with different numbers of points are padded to the same
+    length; padded points are marked as `False` in the mask.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Times, shape (N, ).
+    velocities : numpy.ndarray
+        Velocities in units of `VDFBatch.vunit`, shape (N, npts, 3).
+    vdf : numpy.ndarray
+        VDF values in units of `VDFBatch.vdfunit`, shape (N, npts).
+    mask : numpy.ndarray
+        Boolean mask of points to use when fitting, shape (N, npts).
+    bvecs : numpy.ndarray
+        Magnetic field vectors, shape (N, 3).
+    quality_flags : numpy.ndarray
+        Integer quality flags, shape (N, ).
+    volumes : numpy.ndarray, optional
+        Velocity space volume of the bin around each point in units of
+        ``VDFBatch.vunit**3``, shape (N, npts). Only needed to calculate
+        moments.
+    """
+    vunit = u.km / u.s
+    vdfunit = u.s**3 / u.m**6
+
+    def __init__(self, times, velocities, vdf, mask, bvecs, quality_flags,
+                 volumes=None):
+        self.times = np.asarray(times, dtype='datetime64[ns]')
+        self.velocities = velocities
+        self.vdf = vdf
+        self.mask = mask
+        self.bvecs = bvecs
+        self.quality_flags = quality_flags
+        self.volumes = volumes
+
+    def __len__(self):
+        return self.vdf.shape[0]
+
+    def __getitem__(self, key):
+        """
+        Select a subset of the distributions in this batch.
+
+        Parameters
+        ----------
+        key : slice or numpy.ndarray
+            Slice, integer index array, or boolean mask.
+
+        Returns
+        -------
+        VDFBatch
+        """
+        return VDFBatch(self.times[key], self.velocities[key], self.vdf[key],
+                        self.mask[key], self.bvecs[key],
+                        self.quality_flags[key],
+                        None if self.volumes is None else self.volumes[key])
+
+    @property
+    def npoints(self):
+        """
+        Number of unmasked points in each distribution.
+        """
+        return np.sum(self.mask, axis=1)
+
+    def compressed(self):
+        """
+        Return a copy of this batch with all the masked out points removed.
+
+        The unmasked points of each distribution are moved to the start of
+        each row, and the arrays truncated to the largest number of unmasked
+        points in any distribution.
+        """
+        npts = np.max(self.npoints, initial=0)
+        order = np.argsort(~self.mask, axis=1, kind='stable')[:, :npts]
+        volumes = self.volumes
+        if volumes is not None:
+            volumes = np.take_along_axis(volumes, order, axis=1)
+        return VDFBatch(
+            self.times,
+            np.take_along_axis(self.velocities, order[:, :, None], axis=1),
+            np.take_along_axis(self.vdf, order, axis=1),
+            np.take_along_axis(self.mask, order, axis=1),
+            self.bvecs,
+            self.quality_flags,
+            volumes)
+
+    def record_hashes(self):
+        """
+        Hash of all the data in each distribution function.
+
+        Two distributions have the same hash if and only if (up to hash
+        collisions) they have the same time, velocities, VDF values, mask,
+        magnetic field and quality flag.
+
+        Returns
+        -------
+        list[str]
+        """
+        hashes = []
+        for i in range(len(self)):
+            h = hashlib.blake2b(digest_size=16)
+            for arr in [self.times[i], self.velocities[i], self.vdf[i],
+                        self.mask[i], self.bvecs[i], self.quality_flags[i]]:
+                h.update(np.ascontiguousarray(arr).tobytes())
+            hashes.append(h.hexdigest())
+        return hashes
+
+    @classmethod
+    def from_distributions(cls, dists):
+        """
+        Create a batch from a list of distribution functions.
+
+        Parameters
+        ----------
+        dists : list[vdffit.vdf.VDFBase]
+        """
+        n = len(dists)
+        npts = max([d.vdf.size for d in dists], default=0)
+        velocities = np.zeros((n, npts, 3))
+        vdf = np.zeros((n, npts))
+        mask = np.zeros((n, npts), dtype=bool)
+        bvecs = np.zeros((n, 3))
+        quality_flags = np.zeros(n, dtype=int)
+        volumes = np.zeros((n, npts))
+        for i, dist in enumerate(dists):
+            size = dist.vdf.size
+            velocities[i, :size] = dist.velocities.to_value(cls.vunit)
+            vdf[i, :size] = dist.vdf.to_value(cls.vdfunit)
+            mask[i, :size] = dist.mask
+            bvecs[i] = dist.bvec.vec
+            quality_flags[i] = dist.quality_flag()
+            volumes[i, :size] = dist.volumes.to_value(cls.vunit**3)
+
+        return cls([d.time for d in dists], velocities, vdf, mask, bvecs,
+                   quality_flags, volumes)
+
+
+class ScreeningBatch:
+    """
+    The parts of a batch of distribution functions that are needed to screen
+    them before fitting (see `vdffit.fitting.Triage`).
+
+    These can be made straight from the arrays in a data file, without
+    calculating velocities or converting units.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Times, shape (N, ).
+    vdf : numpy.ndarray
+        VDF values, or any values proportional to them within each
+        distribution, shape (N, npts).
+    mask : numpy.ndarray
+        Boolean mask of points to use when fitting, shape (N, npts).
+    finite : numpy.ndarray
+        Boolean array that is `True` for points with a finite velocity,
+        shape (N, npts).
+    bvecs : numpy.ndarray
+        Magnetic field vectors, shape (N, 3).
+    quality_flags : numpy.ndarray
+        Integer quality flags, shape (N, ).
+    """
+    def __init__(self, times, vdf, mask, finite, bvecs, quality_flags):
+        self.times = np.asarray(times, dtype='datetime64[ns]')
+        self.vdf = vdf
+        self.mask = mask
+        self.finite = finite
+        self.bvecs = bvecs
+        self.quality_flags = quality_flags
+
+    def __len__(self):
+        return self.vdf.shape[0]
+
+    @classmethod
+    def from_batch(cls, batch):
+        """
+        Create a screening batch from a `VDFBatch`.
+
+        Velocities that were set to zero because they are masked count as
+        finite.
+        """
+        return cls(batch.times, batch.vdf, batch.mask,
+                   np.all(np.isfinite(batch.velocities), axis=-1),
+                   batch.bvecs, batch.quality_flags)
+
+    @property
+    def npoints(self):
+        """
+        Number of unmasked points in each distribution.
+        """
+        return np.sum(self.mask, axis=1)
+
+    @property
+    def peak_finite(self):
+        """
+        `True` for distributions where the velocity of the largest unmasked
+        VDF value is finite.
+        """
+        n = len(self)
+        with np.errstate(invalid='ignore'):
+            peak = np.argmax(np.where(self.mask & ~np.isnan(self.vdf),
+                                      self.vdf, -np.inf), axis=1)
+        return self.finite[np.arange(n), peak]
@@ -0,0 +1,66 @@
+"""
+Geometry of the velocity space bins of spherical instrument grids.
+"""
+import numpy as np
+
+__all__ = ['spherical_bin_volumes']
+
+
+def _half_widths(centres, axis, wrap=False):
+    """
+    Distances from each bin centre to the lower and upper edges of the bin.
+
+    Edges are half way between adjacent bin centres along *axis*. Where
+    there is no finite neighbour on one side, the bin is made symmetric.
+    If *wrap* is `True`, the centres are angles in radians, and differences
+    are wrapped into [-pi, pi).
+    """
+    centres = np.moveaxis(centres, axis, -1)
+    diff = np.diff(centres, axis=-1)
+    if wrap:
+        diff = (diff + np.pi) % (2 * np.pi) - np.pi
+    nan = np.full(diff.shape[:-1] + (1,), np.nan)
+    below = np.concatenate([nan, diff], axis=-1) / 2
+    above = np.concatenate([diff, nan], axis=-1) / 2
+    below, above = (np.where(np.isnan(below), above, below),
+                    np.where(np.isnan(above), below, above))
+    return np.moveaxis(below, -1, axis), np.moveaxis(above, -1, axis)
+
+
+def spherical_bin_volumes(modv, theta, phi, axes):
+    """
+    Velocity space volumes of the bins of a grid in speed, elevation and
+    azimuth.
+
+    Bin edges are half way between the centres of adjacent bins along each
+    axis of the grid, and the outermost edges are the same distance from the
+    outermost centres. Each bin is the region between two spheres, two cones
+    of constant elevation and two half-planes of constant azimuth.
+
+    Parameters
+    ----------
+    modv : numpy.ndarray
+        Speed at the centre of each bin.
+    theta, phi : numpy.ndarray
+        Elevation and azimuth angle at the centre of each bin, in radians.
+    axes : tuple[int]
+        Axes of the grid along which speed, elevation and azimuth vary.
+        Each axis must have at least two bins.
+
+    Returns
+    -------
+    numpy.ndarray
+        Volume of each bin, in units of ``modv**3``. NaN for bins with a
+        NaN centre.
+    """
+    modv, theta, phi = np.broadcast_arrays(modv, theta, phi)
+    below, above = _half_widths(modv, axes[0])
+    v_lower = np.maximum(modv - below, 0)
+    v_upper = modv + above
+    below, above = _half_widths(theta, axes[1])
+    theta_lower = np.clip(theta - below, -np.pi / 2, np.pi / 2)
+    theta_upper = np.clip(theta + above, -np.pi / 2, np.pi / 2)
+    below, above = _half_widths(phi, axes[2], wrap=True)
+    return np.abs((v_upper**3 - v_lower**3) / 3 *
+                  (np.sin(theta_upper) - np.sin(theta_lower)) *
+                  (below + above))
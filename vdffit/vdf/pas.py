@@ -4,6 +4,7 @@ import astropy.constants as const
 import astropy.units as u
 import numpy as np
 
+from .grid import spherical_bin_volumes
 from .vdf import VDFBase
 
 __all__ = ['PASDistribution']
@@ -12,6 +13,13 @@ __all__ = ['PASDistribution']
 class PASDistribution(VDFBase):
     """
     A single distribution measured by PAS.
+
+    Only the window of bins given by *start_idx* and *shape* is kept. The
+    indexing of the window is (phi, theta, E) bins.
+
+    Velocities are in the RTN frame, so they are in the same frame as the
+    Solar Orbiter MAG ``B_RTN`` magnetic field. See `velocity_table` for the
+    conversion from the PAS angles.
     """
 
     def __init__(self, vdf, energy, theta, phi, start_idx, shape, time, bvec):
@@ -19,7 +27,12 @@ class PASDistribution(VDFBase):
         end_idx = [start + s for start, s in zip(start_idx, shape)]
         slc = tuple(slice(s, e) for s, e in zip(start_idx, end_idx))
 
+        self._slc = slc
+        self._grid = energy, theta, phi
         self._vdf = vdf[slc]
+        # Windows are truncated at the edge of the bin grid
+        self.shape = self._vdf.shape
+        self._energy = energy[slc[2]]
         self._theta = theta[slc[:2]]
         self._phi = phi[slc[:2]]
 
@@ -28,10 +41,82 @@ class PASDistribution(VDFBase):
         # Assume proton mass
         self.mass = const.m_p
 
-        self._modv = np.sqrt(2 * energy / self.mass).to(u.km / u.s)
+    @staticmethod
+    def velocity_table(energy, theta, phi):
+        """
+        RTN frame velocities of a grid of PAS bins.
+
+        The PAS azimuth and elevation angles give the direction that each bin
+        looks in, in the spacecraft reference frame (SRF), which has +X
+        pointing towards the Sun. The look direction is::
+
+            (cos(theta) cos(phi), -cos(theta) sin(phi), sin(theta))
+
+        so that (phi, theta) = (0, 0) looks at the Sun. Particles travel in
+        the opposite direction to the look direction. Velocities are then
+        rotated into RTN assuming the nominal spacecraft attitude, where
+        R = -X, T = -Y and N = +Z in the SRF. Offsets of the spacecraft
+        pointing from the Sun are ignored.
+
+        Parameters
+        ----------
+        energy : astropy.units.Quantity
+            Bin energies, shape (nenergy, ).
+        theta, phi : astropy.units.Quantity
+            Bin elevation and azimuth angles, shape (nphi, ntheta).
+
+        Returns
+        -------
+        astropy.units.Quantity
+            RTN velocities in km/s, shape (nphi, ntheta, nenergy, 3).
+        """
+        # Assume proton mass
+        modv = np.sqrt(2 * energy / const.m_p).to(u.km / u.s)
+        cos_theta = np.cos(theta)[:, :, np.newaxis]
+        sin_theta = np.sin(theta)[:, :, np.newaxis]
+        cos_phi = np.cos(phi)[:, :, np.newaxis]
+        sin_phi = np.sin(phi)[:, :, np.newaxis]
+        # SRF velocities, opposite to the look direction
+        v_srf = [-modv * cos_theta * cos_phi,
+                 modv * cos_theta * sin_phi,
+                 -modv * sin_theta * np.ones(modv.shape)]
+        # (R, T, N) = (-X, -Y, Z)
+        return np.stack([-v_srf[0], -v_srf[1], v_srf[2]], axis=-1)
+
+    @staticmethod
+    def volume_table(energy, theta, phi):
+        """
+        Velocity space volumes of a grid of PAS bins.
+
+        Parameters
+        ----------
+        energy : astropy.units.Quantity
+            Bin energies, shape (nenergy, ).
+        theta, phi : astropy.units.Quantity
+            Bin elevation and azimuth angles, shape (nphi, ntheta).
+
+        Returns
+        -------
+        astropy.units.Quantity
+            Volumes in (km/s)**3, shape (nphi, ntheta, nenergy).
+        """
+        # Assume proton mass
+        modv = np.sqrt(2 * energy / const.m_p).to(u.km / u.s)
+        volumes = spherical_bin_volumes(
+            modv.value, theta.to_value(u.rad)[:, :, np.newaxis],
+            phi.to_value(u.rad)[:, :, np.newaxis], axes=(2, 1, 0))
+        return volumes * modv.unit**3
 
+    @property
     def vdf(self):
-        return self._vdf
+        return self._vdf.ravel()
+
+    @cached_property
+    def volumes(self):
+        """
+        Velocity space volume of each bin in the window.
+        """
+        return self.volume_table(*self._grid)[self._slc].ravel()
 
     @property
     def time(self):
@@ -51,77 +136,93 @@ class PASDistribution(VDFBase):
         idx, _ = self.peak_vdf
         return np.unravel_index(idx, self.shape)
 
-    '''
-    def max_vdf_on_edge(self):
-        """
-        Return True if the peak of the VDF is at the edge of the angular bins.
-        """
-        return (self.peak_idx[0] in [0, 7]) or (self.peak_idx[2] in [0, 7])
+    def quality_flag_info(self):
+        return {2: "Peak of the distribution function is on an edge of the "
+                   "window.",
+                3: "Not all bins adjacent to peak VDF have positive data.",
+                4: "Less than 12 points within 1% of the peak VDF."}
+
+    def quality_flag(self):
+        vdf = self._vdf.value.reshape(1, -1)
+        return int(self.batch_quality_flags(
+            vdf, np.ones(vdf.shape, dtype=bool), self.shape)[0])
 
-    def has_angular_resolution(self):
+    @staticmethod
+    def batch_quality_flags(vdf, finite, window_shape):
         """
-        Return True if all of the adjacent angular bins to the peak vdf has
-        data.
+        Quality flags for many distributions at once.
+
+        Parameters
+        ----------
+        vdf : numpy.ndarray
+            VDF values in the window of each distribution, shape (n, npts).
+            NaN values are ignored when finding the peak of each
+            distribution.
+        finite : numpy.ndarray
+            Boolean array of bins that are in the window of each
+            distribution, shape (n, npts). Windows smaller than
+            *window_shape* are padded with bins that are `False` here.
+        window_shape : tuple[int]
+            (nphi, ntheta, nenergy) shape of the padded windows, with
+            ``nphi * ntheta * nenergy == npts``.
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer quality flags, shape (n, ).
         """
-        peak_idx = self.peak_idx
-        vdf = self.vdf.reshape(self.shape)
+        n = vdf.shape[0]
+        flags = np.ones(n, dtype=int)
+        shape = (n,) + tuple(window_shape)
+        finite = finite.reshape(shape)
+        with np.errstate(invalid='ignore'):
+            vdf = np.where(finite, vdf.reshape(shape), np.nan)
+            flat = np.where(np.isnan(vdf), -np.inf, vdf).reshape(n, -1)
+            peak = np.argmax(flat, axis=1)
+            peak_val = flat[np.arange(n), peak]
+            positive = vdf > 0
+            npoints = np.sum(flat > 0.01 * peak_val[:, None], axis=1)
+        peak_idx = np.unravel_index(peak, window_shape)
+        rows = np.arange(n)
+
+        # All bins adjacent in angle to the peak must have some positive data
+        # at any energy, and bins adjacent in energy must be positive.
+        # Indices are clipped so that peaks on the edge don't index out of
+        # bounds; these get flag 2 below anyway.
+        iphi, itheta, ie = [np.clip(i, 0, s - 1) for i, s in
+                            zip(peak_idx, window_shape)]
+        any_positive = np.any(positive, axis=3)
         for i, j in [[-1, 0], [1, 0], [0, -1], [0, 1]]:
-            n_positive = np.sum(vdf[peak_idx[0]+i, :, peak_idx[2]+j] > 0)
-            if n_positive == 0:
-                return False
-
-        peak_vels = vdf[peak_idx[0], peak_idx[1]-1:peak_idx[1]+2, peak_idx[2]]
-        if not np.all(peak_vels > 0):
-            return False
-
-        return True
-    '''
-
-    def quality_flag_info(self):
-        return {}
-
-    def quality_flag(self):
-        return 1
+            ok = any_positive[rows, np.clip(iphi + i, 0, window_shape[0] - 1),
+                              np.clip(itheta + j, 0, window_shape[1] - 1)]
+            flags[~ok] = 3
+        for k in [-1, 1]:
+            ok = positive[rows, iphi, itheta,
+                          np.clip(ie + k, 0, window_shape[2] - 1)]
+            flags[~ok] = 3
+
+        # Peak on the edge of the window, in any direction
+        for axis, idx in enumerate(peak_idx):
+            other = tuple(a + 1 for a in range(3) if a != axis)
+            size = np.sum(np.any(finite, axis=other), axis=1)
+            flags[(idx == 0) | (idx >= size - 1)] = 2
+        flags[~(peak_val > 0) | (npoints < 12)] = 4
+        return flags
 
     @property
     def bvec(self):
         return self._bvec
 
-    def velocities_instr_frame(self):
-        """
-        Velocities in the instrument frame.
-
-        The last index is the velocity component.
-        """
-        modv = self._modv
-        vx = modv * np.cos(self._theta) * np.cos(self._phi)
-        vy = modv * np.cos(self._theta) * np.sin(self._phi)
-        vz = modv * np.sin(self._theta)
-        v = np.stack([vx, vy, vz], axis=-1)
-        return v
-
     @cached_property
     def velocities(self):
         """
-        Velocity in the spacecraft frame.
-
-        This is different from the instrument frame by a flip in the x and y
-        directions.
+        Velocity in the RTN frame, shape (npts, 3).
         """
-        vinstr = self.velocities_instr_frame()
-        phi = 20 * u.deg
-        vx = -np.cos(phi) * vinstr[:, 1] - np.sin(phi) * vinstr[:, 2]
-        vy = np.sin(phi) * vinstr[:, 1] - np.cos(phi) * vinstr[:, 2]
-        vz = vinstr[:, 0]
-        # vx = -vinstr[:, 1]
-        # vy = -vinstr[:, 2]
-        vz = vinstr[:, 0]
-        return np.stack([vx, vy, vz], axis=-1)
-
-    '''
+        v = self.velocity_table(self._energy, self._theta, self._phi)
+        return v.reshape(-1, 3)
+
     @property
     def mask(self):
         _, peak_val = self.peak_vdf
         # Only select values within 1% of peak VDF value
-        return (self.vdf > 0.01 * peak_val).astype(bool)
-    '''
+        return self.vdf > 0.01 * peak_val
@@ -3,6 +3,7 @@ from functools import cached_property
 import astropy.units as u
 import numpy as np
 
+from .grid import spherical_bin_volumes
 from .vdf import VDFBase
 
 __all__ = ['SPANDistribution']
@@ -18,6 +19,8 @@ class SPANDistribution(VDFBase):
 
     def __init__(self, eflux, energy, theta, phi, mass, time, bvec, species):
         keep = np.isfinite(theta)
+        self._keep = keep
+        self._grid = energy, theta, phi
         self.eflux = eflux[keep]
         self._theta = theta[keep]
         self._phi = phi[keep]
@@ -85,6 +88,59 @@ class SPANDistribution(VDFBase):
         else:
             return 1
 
+    @classmethod
+    def batch_quality_flags(cls, vdf, finite):
+        """
+        Quality flags for many distributions at once.
+
+        This gives the same flags as ``quality_flag()``, but only uses array
+        operations.
+
+        Parameters
+        ----------
+        vdf : numpy.ndarray
+            VDF values, shape (n, 2048). NaN values are ignored when finding
+            the peak of each distribution.
+        finite : numpy.ndarray
+            Boolean array of bins that have a finite theta value, shape
+            (n, 2048).
+
+        Returns
+        -------
+        numpy.ndarray
+            Integer quality flags, shape (n, ).
+        """
+        n = vdf.shape[0]
+        flags = np.ones(n, dtype=int)
+        vdf = vdf.reshape((n,) + cls.shape)
+        with np.errstate(invalid='ignore'):
+            peak = np.argmax(np.where(np.isnan(vdf), -np.inf, vdf).reshape(
+                n, -1), axis=1)
+            positive = vdf > 0
+        iphi, ie, itheta = np.unravel_index(peak, cls.shape)
+        rows = np.arange(n)
+
+        # All bins adjacent in angle to the peak must have some positive data
+        # at any energy. Indices are clipped so that peaks on the edge don't
+        # index out of bounds; these get flag 2 below anyway.
+        any_positive = np.any(positive, axis=2)
+        for i, j in [[-1, 0], [1, 0], [0, -1], [0, 1]]:
+            flags[~any_positive[rows, np.clip(iphi + i, 0, 7),
+                                np.clip(itheta + j, 0, 7)]] = 3
+        # Bins adjacent in energy to the peak must be positive. If the peak
+        # is in the first energy bin this check is skipped.
+        for k in [-1, 0, 1]:
+            e = ie + k
+            valid = (ie > 0) & (e <= cls.shape[1] - 1)
+            ok = positive[rows, iphi, np.clip(e, 0, cls.shape[1] - 1),
+                          itheta]
+            flags[valid & ~ok] = 3
+        flags[np.isin(iphi, [0, 7]) | np.isin(itheta, [0, 7])] = 2
+        # All NaN distributions have no peak
+        flags[np.all(np.isnan(vdf.reshape(n, -1)), axis=1)] = 3
+        flags[~np.all(finite, axis=1)] = 4
+        return flags
+
     @property
     def bvec(self):
         return self._bvec
@@ -128,6 +184,21 @@ class SPANDistribution(VDFBase):
         return (self.eflux * 2 /
                 self._modv**4).to(u.s**3 / u.m**6)
 
+    @cached_property
+    def volumes(self):
+        """
+        Velocity space volume of each bin.
+        """
+        energy, theta, phi = self._grid
+        if energy.size != np.prod(self.shape):
+            return np.full(self.eflux.shape, np.nan) * (u.km / u.s)**3
+        modv = np.sqrt(2 * energy / self.mass).to(u.km / u.s)
+        volumes = spherical_bin_volumes(
+            *[x.reshape(self.shape) for x in
+              [modv.value, theta.to_value(u.rad), phi.to_value(u.rad)]],
+            axes=(1, 2, 0))
+        return volumes.ravel()[self._keep] * modv.unit**3
+
     @property
     def mask(self):
         _, peak_val = self.peak_vdf
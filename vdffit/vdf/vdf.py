@@ -1,5 +1,7 @@
 import abc
 
+import numpy as np
+
 __all__ = ['VDFBase']
 
 
@@ -50,6 +52,16 @@ class VDFBase(abc.ABC):
         Must be in units equivalent to seconds**3 / meters**6.
         """
 
+    @property
+    @abc.abstractmethod
+    def volumes(self):
+        """
+        Velocity space volume of the bin around each VDF sample, used to
+        integrate moments of the distribution.
+
+        Must be in units equivalent to (kilometers / second)**3.
+        """
+
     @property
     def mask(self):
         """